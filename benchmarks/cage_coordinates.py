@@ -0,0 +1,63 @@
+"""
+peak memory and runtime of forward + backward of the dense and the chunked mean value / green
+coordinates of a convex cage, and the largest deviation of the chunked results
+usage: python benchmarks/cage_coordinates.py [--faces 200] [--points 1000 4000 16000] [--budget 64]
+"""
+import argparse
+import torch
+from scipy.spatial import ConvexHull
+from common import timeit, peak_memory, print_table
+from pytorch_points.network import geo_operations as G
+
+
+def sphere_cage(n_faces):
+    """outward oriented convex hull of random points on the unit sphere with about n_faces faces"""
+    pts = torch.randn(n_faces // 2 + 2, 3)
+    pts = pts / pts.norm(dim=1, keepdim=True)
+    faces = torch.from_numpy(ConvexHull(pts.numpy()).simplices).long()
+    centers = pts[faces].mean(1)
+    normals = torch.cross(pts[faces[:, 1]] - pts[faces[:, 0]], pts[faces[:, 2]] - pts[faces[:, 0]], dim=1)
+    flip = (normals * centers).sum(1) < 0
+    faces[flip] = faces[flip][:, [0, 2, 1]]
+    return pts, faces
+
+
+def run(fn, query, vertices, faces):
+    out = fn(query, vertices, faces)
+    out = out if isinstance(out, tuple) else (out,)
+    sum(o.sum() for o in out if o.is_floating_point()).backward()
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--faces", type=int, default=200)
+    parser.add_argument("--points", type=int, nargs="+", default=[1000, 4000, 16000])
+    parser.add_argument("--budget", type=int, default=64, help="memory budget of the chunked version in MB")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    vertices, faces = sphere_cage(args.faces)
+    vertices, faces = vertices[None].requires_grad_(), faces[None]
+    budget = args.budget * 2**20
+    methods = [("mvc", G.mean_value_coordinates_3D,
+                lambda q, v, f: G.chunked_mean_value_coordinates_3D(q, v, f, memory_budget=budget)),
+               ("green", G.green_coordinates_3D,
+                lambda q, v, f: G.chunked_green_coordinates_3D(q, v, f, memory_budget=budget))]
+    rows = []
+    for P in args.points:
+        query = (torch.rand(1, P, 3) - 0.5).requires_grad_()
+        for name, dense, chunked in methods:
+            # the dense version is skipped where its estimated peak exceeds 8 GB
+            pair_bytes = 4 * (G._MVC_PAIR_ELEMENTS if name == "mvc" else G._GREEN_PAIR_ELEMENTS)
+            dense_ok = P * faces.shape[1] * pair_bytes < 8 * 2**30
+            ref = run(dense, query, vertices, faces) if dense_ok else None
+            out = run(chunked, query, vertices, faces)
+            err = max((a.float() - b.float()).abs().max().item() for a, b in zip(out, ref)) if ref else float("nan")
+            rows.append((name, P, faces.shape[1],
+                         "%.0f" % (peak_memory(run, dense, query, vertices, faces) / 2**20) if dense_ok else "-",
+                         "%.0f" % (peak_memory(run, chunked, query, vertices, faces) / 2**20),
+                         "%.2f" % timeit(run, dense, query, vertices, faces, repeat=2, warmup=0) if dense_ok else "-",
+                         "%.2f" % timeit(run, chunked, query, vertices, faces, repeat=2, warmup=0),
+                         "%.1e" % err))
+    print_table(("coords", "P", "F", "dense MB", "chunked MB", "dense [s]", "chunked [s]", "max diff"), rows)
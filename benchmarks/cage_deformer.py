@@ -0,0 +1,50 @@
+"""
+error versus speed of CageDeformer with top-k truncated sparse coordinates: per-frame deformation
+time, storage and the deviation from the dense coordinates on randomly perturbed cages
+usage: python benchmarks/cage_deformer.py [--faces 1000] [--points 100000] [--frames 8] [--method mvc]
+"""
+import argparse
+import torch
+from common import timeit, print_table
+from cage_coordinates import sphere_cage
+from pytorch_points.network.geo_operations import CageDeformer
+
+
+def storage(deformer):
+    tensors = [t for t in (deformer.phi, deformer.psi) if t is not None]
+    if deformer.is_sparse:
+        return sum(t.values().nbytes + t.col_indices().nbytes + t.crow_indices().nbytes for t in tensors)
+    return sum(t.nbytes for t in tensors)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--faces", type=int, default=1000)
+    parser.add_argument("--points", type=int, default=100000)
+    parser.add_argument("--frames", type=int, default=8)
+    parser.add_argument("--method", default="mvc", choices=("mvc", "green"))
+    parser.add_argument("--topk", type=int, nargs="+", default=[4, 8, 16, 32, 64, 128])
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    vertices, faces = sphere_cage(args.faces)
+    vertices, faces = vertices[None].to(args.device), faces[None].to(args.device)
+    query = ((torch.rand(1, args.points, 3) - 0.5) * 0.8).to(args.device)
+    cages = vertices + 0.05 * torch.randn(args.frames, *vertices.shape[1:], device=args.device)
+
+    dense = CageDeformer.precompute(query, vertices, faces, method=args.method)
+    reference = dense(cages)
+    # the extent of the deformed points sets the scale of the errors
+    scale = (reference.max(dim=1)[0] - reference.min(dim=1)[0]).max().item()
+    rows = [("dense", "%.1f" % (storage(dense) / 2**20),
+             "%.2f" % (1000 * timeit(dense, cages, device=args.device) / args.frames), "-", "-")]
+    for k in args.topk:
+        sparse = CageDeformer.precompute(query, vertices, faces, method=args.method, sparse=True, topk=k)
+        err = (sparse(cages) - reference).norm(dim=-1) / scale
+        rows.append((k, "%.1f" % (storage(sparse) / 2**20),
+                     "%.2f" % (1000 * timeit(sparse, cages, device=args.device) / args.frames),
+                     "%.1e" % err.mean().item(), "%.1e" % err.max().item()))
+    print("{} coordinates, P={} N={} F={}, {} frames".format(
+        args.method, args.points, vertices.shape[1], faces.shape[1], args.frames))
+    print_table(("topk", "storage MB", "ms / frame", "mean rel err", "max rel err"), rows)
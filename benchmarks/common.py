@@ -0,0 +1,56 @@
+"""
+small helpers shared by the benchmark scripts
+"""
+import time
+import torch
+
+
+def synchronize(device):
+    if torch.device(device).type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def timeit(fn, *args, repeat=10, warmup=2, device="cpu", **kwargs):
+    """return the median runtime of fn(*args, **kwargs) in seconds"""
+    for _ in range(warmup):
+        fn(*args, **kwargs)
+    synchronize(device)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args, **kwargs)
+        synchronize(device)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def print_table(header, rows):
+    widths = [max(len(str(x)) for x in col) for col in zip(header, *rows)]
+    fmt = "  ".join("{:>%d}" % w for w in widths)
+    print(fmt.format(*header))
+    for row in rows:
+        print(fmt.format(*[str(x) for x in row]))
+
+
+def peak_memory(fn, *args, device="cpu", **kwargs):
+    """
+    bytes allocated at the peak of fn(*args, **kwargs) on top of what was allocated before,
+    exact on cuda, on cpu estimated at op granularity from the memory profiler
+    """
+    device = torch.device(device)
+    if device.type == "cuda":
+        synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+        base = torch.cuda.memory_allocated(device)
+        fn(*args, **kwargs)
+        synchronize(device)
+        return torch.cuda.max_memory_allocated(device) - base
+    from torch.profiler import profile, ProfilerActivity
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        fn(*args, **kwargs)
+    current = peak = 0
+    for e in sorted(prof.events(), key=lambda e: e.time_range.start):
+        current += e.self_cpu_memory_usage
+        peak = max(peak, current)
+    return peak
@@ -0,0 +1,49 @@
+"""
+approximate EMD (sliced Wasserstein, Sinkhorn) against the exact assignment of scipy on
+equally sized clouds: runtime, and how well the approximations track the exact W_2^2 over pairs
+of clouds with increasing deformation (pearson correlation and mean ratio approx / exact)
+usage: python benchmarks/emd.py [--pairs 8]
+"""
+import argparse
+import numpy as np
+import torch
+from scipy.optimize import linear_sum_assignment
+from common import timeit, print_table
+from pytorch_points.network.model_loss import sliced_wasserstein, sinkhorn
+
+
+def exact_emd(xyz1, xyz2):
+    cost = (torch.cdist(xyz1[0], xyz2[0])**2).numpy()
+    rows, cols = linear_sum_assignment(cost)
+    return cost[rows, cols].mean()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pairs", type=int, default=8)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    methods = [("sw L=64", lambda a, b: sliced_wasserstein(a, b, 64)),
+               ("sw L=256", lambda a, b: sliced_wasserstein(a, b, 256)),
+               ("sinkhorn", lambda a, b: sinkhorn(a, b, eps=1e-3))]
+    rows = []
+    for N in [256, 512, 1024, 2048]:
+        base = torch.randn(1, N, 3)
+        base = base / base.norm(dim=-1, keepdim=True)
+        pairs = []
+        for k in range(args.pairs):
+            other = torch.randn(1, N, 3)
+            other = other / other.norm(dim=-1, keepdim=True) * (1 + 0.1 * k) + 0.05 * k
+            pairs.append((base, other))
+        exact = np.array([exact_emd(a, b) for a, b in pairs])
+        row = [N, "%.1f" % (timeit(exact_emd, *pairs[0], repeat=1, warmup=0) * 1e3)]
+        for name, fn in methods:
+            approx = np.array([fn(a, b).item() for a, b in pairs])
+            t = timeit(fn, *pairs[0], repeat=3, warmup=1)
+            row += ["%.1f" % (t * 1e3), "%.3f / %.2f" % (np.corrcoef(exact, approx)[0, 1], np.mean(approx / exact))]
+        rows.append(row)
+    header = ["N", "exact [ms]"]
+    for name, _ in methods:
+        header += [name + " [ms]", name + " corr / ratio"]
+    print_table(header, rows)
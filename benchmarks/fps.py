@@ -0,0 +1,35 @@
+"""
+exhaustive vs grid-pruned furthest point sampling on cpu, with the coverage radius of the
+grid-pruned samples relative to exact FPS (1.0 = same quality, smaller is better)
+usage: python benchmarks/fps.py [--large] [--eps 0.1]
+"""
+import argparse
+import torch
+from common import timeit, print_table
+from pytorch_points.network.geo_operations import furthest_point_sample
+from pytorch_points.network.model_loss import coverage_radius
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--eps", type=float, default=0.1)
+    parser.add_argument("--large", action="store_true", help="include N=2M (slow for the exhaustive sampler)")
+    args = parser.parse_args()
+
+    configs = [(100000, 1024), (100000, 4096), (500000, 4096), (500000, 16384)]
+    if args.large:
+        configs += [(2000000, 4096), (2000000, 16384)]
+    rows = []
+    for N, K in configs:
+        # points on a noisy sphere surface, a typical scan-like distribution
+        xyz = torch.randn(1, N, 3)
+        xyz = xyz / xyz.norm(dim=-1, keepdim=True) + 0.01 * torch.randn(1, N, 3)
+        times, radii = [], []
+        for eps in [None, 0.0, args.eps]:
+            times.append(timeit(furthest_point_sample, xyz, K, NCHW=False, eps=eps, repeat=1, warmup=0))
+            _, samples = furthest_point_sample(xyz, K, NCHW=False, eps=eps)
+            radii.append(coverage_radius(xyz, samples, NCHW=False).item())
+        rows.append(((N, K), "%.2f" % times[0], "%.2f" % times[1], "%.2f" % times[2],
+                     "%.1fx" % (times[0] / times[1]), "%.1fx" % (times[0] / times[2]), "%.3f" % (radii[2] / radii[0])))
+    print_table(["(N,K)", "exact [s]", "grid eps=0 [s]", "grid eps=%g [s]" % args.eps,
+                 "speedup eps=0", "speedup eps=%g" % args.eps, "coverage ratio"], rows)
@@ -0,0 +1,40 @@
+"""
+throughput of grouping_operation (forward + backward) compared to a torch.gather reference
+usage: python benchmarks/grouping.py [--device cpu]
+"""
+import argparse
+import torch
+from common import timeit, print_table
+from pytorch_points.network.operations import grouping_operation
+
+
+def gather_reference(features, idx):
+    B, C, N = features.shape
+    _, npoint, nsample = idx.shape
+    index = idx.long().view(B, 1, -1).expand(-1, C, -1)
+    return torch.gather(features, 2, index).view(B, C, npoint, nsample)
+
+
+def step(group_fn, features, idx):
+    out = group_fn(features, idx)
+    out.backward(torch.ones_like(out))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    # (B, C, N, npoint, nsample) of typical PointNet++ SA layers
+    configs = [(16, 3, 4096, 1024, 32), (16, 64, 1024, 256, 32), (16, 128, 256, 64, 64), (4, 32, 100000, 16384, 32)]
+    rows = []
+    for B, C, N, npoint, nsample in configs:
+        features = torch.rand(B, C, N, device=args.device, requires_grad=True)
+        idx = torch.randint(0, N, (B, npoint, nsample), dtype=torch.int32, device=args.device)
+        t_ext = timeit(step, grouping_operation, features, idx, device=args.device)
+        t_ref = timeit(step, gather_reference, features, idx, device=args.device)
+        # bytes read and written in forward and backward
+        nbytes = 4 * (2 * B * C * npoint * nsample + B * npoint * nsample + B * C * N) * 2
+        rows.append(((B, C, N, npoint, nsample), "%.2f" % (t_ext * 1e3), "%.2f" % (t_ref * 1e3),
+                     "%.2f" % (nbytes / t_ext / 1e9), "%.2f" % (t_ref / t_ext)))
+    print_table(["(B,C,N,npoint,nsample)", "ext [ms]", "gather [ms]", "ext GB/s", "speedup"], rows)
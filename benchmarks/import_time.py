@@ -0,0 +1,57 @@
+"""
+wall time of importing pytorch_points modules in fresh cpu-only processes,
+and which heavy dependencies each import pulls in
+usage: python benchmarks/import_time.py [--repeat 5]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from common import print_table
+
+HEAVY = ["scipy", "matplotlib", "pytorch3d", "openmesh",
+         "pytorch_points._ext.sampling", "pytorch_points._ext.linalg", "pytorch_points._ext.losses"]
+
+SNIPPET = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print("%f\t%s" % (elapsed, ",".join(m for m in {heavy!r} if m in sys.modules)))
+"""
+
+
+def import_once(module):
+    env = dict(os.environ, CUDA_VISIBLE_DEVICES="")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [root, env.get("PYTHONPATH")]))
+    out = subprocess.run([sys.executable, "-c", SNIPPET.format(module=module, heavy=HEAVY)],
+                         env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if out.returncode != 0:
+        return None, out.stderr.strip().splitlines()[-1]
+    elapsed, loaded = out.stdout.splitlines()[-1].split("\t")
+    return float(elapsed), loaded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    modules = ["torch", "pytorch_points", "pytorch_points.network.operations", "pytorch_points.network.geo_operations",
+               "pytorch_points.network.model_loss", "pytorch_points.network.pointnet2_modules",
+               "pytorch_points.utils.pc_utils", "pytorch_points.utils.geometry_utils"]
+    rows = []
+    for module in modules:
+        times, loaded = [], ""
+        for _ in range(args.repeat):
+            elapsed, loaded = import_once(module)
+            if elapsed is None:
+                break
+            times.append(elapsed)
+        if not times:
+            rows.append((module, "failed", loaded))
+            continue
+        times.sort()
+        rows.append((module, "%.1f" % (times[len(times) // 2] * 1e3), loaded or "-"))
+    print_table(["module", "import [ms]", "heavy modules loaded"], rows)
@@ -0,0 +1,59 @@
+"""
+fused ball query + grouping + recentering (QueryAndGroupFunction) against the composition of
+ball_query, grouping_operation, the in-place recentering and torch.cat, forward + backward
+usage: python benchmarks/query_and_group.py [--device cpu]
+"""
+import argparse
+import torch
+from common import timeit, peak_memory, print_table
+from pytorch_points.network.operations import QueryAndGroupFunction, _query_and_group_torch
+
+
+def forward(group_fn, radius, nsample, xyz, new_xyz, features):
+    return group_fn(radius, nsample, xyz, new_xyz, features, True)
+
+
+def step(group_fn, radius, nsample, xyz, new_xyz, features):
+    out = group_fn(radius, nsample, xyz, new_xyz, features, True)
+    out.backward(torch.ones_like(out))
+
+
+def forward_traffic(B, C, N, npoint, nsample, fused):
+    """bytes written and read in the forward besides the inputs and the ball query"""
+    out = B * (3 + C) * npoint * nsample
+    if fused:
+        return 4 * out
+    grouped_xyz = B * 3 * npoint * nsample
+    grouped_features = B * C * npoint * nsample
+    # transposed copy of xyz, grouped xyz written then read and written by the recentering,
+    # both grouped tensors read and the result written by the concatenation
+    return 4 * (2 * B * 3 * N + 3 * grouped_xyz + grouped_features + (grouped_xyz + grouped_features) + out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    # (B, C, N, npoint, radius, nsample) of the SA layers of PointNet++ (SSG and MSG)
+    configs = [(16, 0, 4096, 1024, 0.1, 32), (16, 64, 1024, 256, 0.2, 32), (16, 128, 256, 64, 0.4, 64),
+               (16, 32, 1024, 256, 0.4, 128), (4, 64, 16384, 4096, 0.1, 32)]
+    rows = []
+    for B, C, N, npoint, radius, nsample in configs:
+        xyz = torch.rand(B, N, 3, device=args.device, requires_grad=True)
+        new_xyz = xyz[:, :npoint].detach().clone().requires_grad_()
+        features = torch.rand(B, C, N, device=args.device, requires_grad=True) if C > 0 else None
+        inputs = (radius, nsample, xyz, new_xyz, features)
+        t_fused = timeit(step, QueryAndGroupFunction.apply, *inputs, device=args.device)
+        t_ref = timeit(step, _query_and_group_torch, *inputs, device=args.device)
+        # MB as fused / unfused
+        memory = []
+        for fn in (forward, step):
+            memory.append("%.1f / %.1f" % tuple(peak_memory(fn, group_fn, *inputs, device=args.device) / 2**20
+                                                for group_fn in (QueryAndGroupFunction.apply, _query_and_group_torch)))
+        memory.append("%.1f / %.1f" % tuple(forward_traffic(B, C, N, npoint, nsample, fused) / 2**20 for fused in (True, False)))
+        rows.append(((B, C, N, npoint, nsample), "%.2f" % (t_fused * 1e3), "%.2f" % (t_ref * 1e3),
+                     "%.2fx" % (t_ref / t_fused)) + tuple(memory))
+    print("memory columns in MB, fused / unfused")
+    print_table(["(B,C,N,npoint,nsample)", "fused [ms]", "unfused [ms]", "speedup",
+                 "fwd peak", "fwd+bwd peak", "fwd traffic"], rows)
@@ -0,0 +1,234 @@
+#ifndef _CPU_UTILS_H
+#define _CPU_UTILS_H
+#include <cmath>
+#include <cstdint>
+#include <algorithm>
+#include <vector>
+
+// uniform grid whose cells are spatially hashed into a power-of-2 bucket table,
+// the points of a bucket are stored in ascending index order (CSR layout)
+struct HashGrid {
+    double inv_cell;
+    uint64_t mask;
+    std::vector<int> bucket_start;
+    std::vector<int> points;
+
+    inline void cell_of(double x, double y, double z, int64_t& cx, int64_t& cy, int64_t& cz) const {
+        cx = static_cast<int64_t>(std::floor(x * inv_cell));
+        cy = static_cast<int64_t>(std::floor(y * inv_cell));
+        cz = static_cast<int64_t>(std::floor(z * inv_cell));
+    }
+
+    inline int bucket(int64_t cx, int64_t cy, int64_t cz) const {
+        const uint64_t h = (static_cast<uint64_t>(cx) * 73856093ULL) ^
+                           (static_cast<uint64_t>(cy) * 19349663ULL) ^
+                           (static_cast<uint64_t>(cz) * 83492791ULL);
+        return static_cast<int>(h & mask);
+    }
+
+    // xyz: (n, 3)
+    template <typename scalar_t>
+    void build(const scalar_t *xyz, int n, double cell_size) {
+        inv_cell = 1.0 / cell_size;
+        uint64_t n_buckets = 1;
+        while (n_buckets < 2 * static_cast<uint64_t>(std::max(n, 1))) n_buckets <<= 1;
+        mask = n_buckets - 1;
+        std::vector<int> point_bucket(n);
+        bucket_start.assign(n_buckets + 1, 0);
+        for (int k = 0; k < n; ++k) {
+            int64_t cx, cy, cz;
+            cell_of(xyz[k * 3 + 0], xyz[k * 3 + 1], xyz[k * 3 + 2], cx, cy, cz);
+            point_bucket[k] = bucket(cx, cy, cz);
+            ++bucket_start[point_bucket[k] + 1];
+        }
+        for (uint64_t i = 0; i < n_buckets; ++i) bucket_start[i + 1] += bucket_start[i];
+        // counting sort keeps the ascending index order inside every bucket
+        std::vector<int> fill(bucket_start.begin(), bucket_start.end() - 1);
+        points.resize(n);
+        for (int k = 0; k < n; ++k) points[fill[point_bucket[k]]++] = k;
+    }
+
+    // unique buckets of the 3x3x3 cells around (x, y, z), returns the number of buckets
+    inline int neighbor_buckets(double x, double y, double z, int *buckets) const {
+        int64_t cx, cy, cz;
+        cell_of(x, y, z, cx, cy, cz);
+        int cnt = 0;
+        for (int dx = -1; dx <= 1; ++dx)
+            for (int dy = -1; dy <= 1; ++dy)
+                for (int dz = -1; dz <= 1; ++dz)
+                    buckets[cnt++] = bucket(cx + dx, cy + dy, cz + dz);
+        std::sort(buckets, buckets + cnt);
+        return std::unique(buckets, buckets + cnt) - buckets;
+    }
+};
+
+// dense uniform grid over the bounding box of a point set with about points_per_cell points
+// per cell, the points of a cell are stored in ascending index order (CSR layout)
+struct DenseGrid {
+    double origin[3];
+    double cell;
+    double inv_cell;
+    int64_t dims[3];
+    std::vector<int> cell_start;
+    std::vector<int> points;
+
+    template <typename scalar_t>
+    void build(const scalar_t *xyz, int n, double points_per_cell = 2.0) {
+        double lo[3] = {0, 0, 0}, hi[3] = {0, 0, 0};
+        for (int k = 0; k < n; ++k) {
+            for (int d = 0; d < 3; ++d) {
+                const double v = xyz[k * 3 + d];
+                if (k == 0 || v < lo[d]) lo[d] = v;
+                if (k == 0 || v > hi[d]) hi[d] = v;
+            }
+        }
+        double extent = 0;
+        for (int d = 0; d < 3; ++d) extent = std::max(extent, hi[d] - lo[d]);
+        // cell edge from the bounding box volume, degenerated axes count as one cell
+        double volume = 1;
+        int n_axes = 0;
+        for (int d = 0; d < 3; ++d) {
+            if (hi[d] - lo[d] > 1e-6 * extent) {
+                volume *= hi[d] - lo[d];
+                ++n_axes;
+            }
+        }
+        cell = n_axes > 0 ? std::pow(volume * points_per_cell / std::max(n, 1), 1.0 / n_axes) : 1.0;
+        if (!(cell > 0)) cell = extent > 0 ? extent : 1.0;
+        // thin or elongated sets would create too many cells, coarsen until the grid is bounded
+        const int64_t max_cells = std::max<int64_t>(64, 8 * static_cast<int64_t>(n));
+        while (true) {
+            double cells = 1;
+            for (int d = 0; d < 3; ++d) cells *= std::floor((hi[d] - lo[d]) / cell) + 1;
+            if (cells <= max_cells) break;
+            cell *= 1.5;
+        }
+        int64_t n_cells = 1;
+        for (int d = 0; d < 3; ++d) {
+            dims[d] = static_cast<int64_t>((hi[d] - lo[d]) / cell) + 1;
+            n_cells *= dims[d];
+        }
+        for (int d = 0; d < 3; ++d) origin[d] = lo[d];
+        inv_cell = 1.0 / cell;
+        std::vector<int> point_cell(n);
+        cell_start.assign(n_cells + 1, 0);
+        for (int k = 0; k < n; ++k) {
+            int64_t c[3];
+            cell_of(xyz[k * 3 + 0], xyz[k * 3 + 1], xyz[k * 3 + 2], c);
+            point_cell[k] = index(c[0], c[1], c[2]);
+            ++cell_start[point_cell[k] + 1];
+        }
+        for (int64_t i = 0; i < n_cells; ++i) cell_start[i + 1] += cell_start[i];
+        std::vector<int> fill(cell_start.begin(), cell_start.end() - 1);
+        points.resize(n);
+        for (int k = 0; k < n; ++k) points[fill[point_cell[k]]++] = k;
+    }
+
+    // cell of (x, y, z), clamped to the grid
+    inline void cell_of(double x, double y, double z, int64_t *c) const {
+        const double v[3] = {x, y, z};
+        for (int d = 0; d < 3; ++d) {
+            const double f = std::floor((v[d] - origin[d]) * inv_cell);
+            c[d] = f < 0 ? 0 : (f >= dims[d] ? dims[d] - 1 : static_cast<int64_t>(f));
+        }
+    }
+
+    inline int64_t index(int64_t cx, int64_t cy, int64_t cz) const {
+        return (cx * dims[1] + cy) * dims[2] + cz;
+    }
+
+    // visit the indices of all cells on the shell at Chebyshev distance r around c,
+    // returns false if the shell lies completely outside the grid
+    template <typename F>
+    bool visit_shell_cells(const int64_t *c, int64_t r, F&& visit_cell) const {
+        bool inside = false;
+        const int64_t x0 = std::max<int64_t>(c[0] - r, 0), x1 = std::min<int64_t>(c[0] + r, dims[0] - 1);
+        const int64_t y0 = std::max<int64_t>(c[1] - r, 0), y1 = std::min<int64_t>(c[1] + r, dims[1] - 1);
+        const int64_t z0 = std::max<int64_t>(c[2] - r, 0), z1 = std::min<int64_t>(c[2] + r, dims[2] - 1);
+        for (int64_t x = x0; x <= x1; ++x) {
+            const bool x_face = (x == c[0] - r || x == c[0] + r);
+            for (int64_t y = y0; y <= y1; ++y) {
+                const bool y_face = x_face || (y == c[1] - r || y == c[1] + r);
+                if (y_face) {
+                    for (int64_t z = z0; z <= z1; ++z) {
+                        inside = true;
+                        visit_cell(index(x, y, z));
+                    }
+                } else {
+                    // inside the shell only the two z faces are visited
+                    if (c[2] - r >= 0) {
+                        inside = true;
+                        visit_cell(index(x, y, c[2] - r));
+                    }
+                    if (r > 0 && c[2] + r < dims[2]) {
+                        inside = true;
+                        visit_cell(index(x, y, c[2] + r));
+                    }
+                }
+            }
+        }
+        return inside;
+    }
+
+    // visit all points of the cells on the shell at Chebyshev distance r around c,
+    // returns false if the shell lies completely outside the grid
+    template <typename F>
+    bool visit_shell(const int64_t *c, int64_t r, F&& visit) const {
+        return visit_shell_cells(c, r, [&](int64_t i) {
+            for (int s = cell_start[i]; s < cell_start[i + 1]; ++s) visit(points[s]);
+        });
+    }
+
+    // number of shells needed to cover the whole grid from any cell
+    inline int64_t max_radius() const {
+        return std::max(dims[0], std::max(dims[1], dims[2]));
+    }
+};
+
+// tournament tree over n slots keeping the largest value and, among equal values,
+// the smallest argument
+template <typename scalar_t>
+struct MaxTree {
+    int size;
+    std::vector<scalar_t> val;
+    std::vector<int> arg;
+
+    void init(int n, scalar_t fill) {
+        size = 1;
+        while (size < n) size <<= 1;
+        val.assign(2 * size, fill);
+        arg.assign(2 * size, -1);
+    }
+
+    inline bool better(int a, int b) const {
+        if (arg[b] < 0) return arg[a] >= 0;
+        if (arg[a] < 0) return false;
+        return val[a] > val[b] || (val[a] == val[b] && arg[a] < arg[b]);
+    }
+
+    // set slot i without updating its ancestors, call build() afterwards
+    inline void assign(int i, scalar_t v, int a) {
+        val[size + i] = v;
+        arg[size + i] = a;
+    }
+
+    void build() {
+        for (int i = size - 1; i > 0; --i) pull(i);
+    }
+
+    inline void set(int i, scalar_t v, int a) {
+        assign(i, v, a);
+        for (i = (size + i) >> 1; i > 0; i >>= 1) pull(i);
+    }
+
+    inline void pull(int i) {
+        const int c = better(2 * i, 2 * i + 1) ? 2 * i : 2 * i + 1;
+        val[i] = val[c];
+        arg[i] = arg[c];
+    }
+
+    inline scalar_t top() const { return val[1]; }
+    inline int top_arg() const { return arg[1]; }
+};
+
+#endif
@@ -30,13 +30,8 @@ void three_interpolate_wrapper_fast(int b, int c, int m, int n,
                          at::Tensor weight_tensor,
                          at::Tensor out_tensor) {
 
-    const float *points = points_tensor.data_ptr<float>();
-    const float *weight = weight_tensor.data_ptr<float>();
-    float *out = out_tensor.data_ptr<float>();
-    const int *idx = idx_tensor.data_ptr<int>();
-
     cudaStream_t stream = THCState_getCurrentStream(state);
-    three_interpolate_kernel_launcher_fast(b, c, m, n, points, idx, weight, out, stream);
+    three_interpolate_kernel_launcher_fast(b, c, m, n, points_tensor, idx_tensor, weight_tensor, out_tensor, stream);
 }
 
 void three_interpolate_grad_wrapper_fast(int b, int c, int n, int m,
@@ -45,13 +40,8 @@ void three_interpolate_grad_wrapper_fast(int b, int c, int n, int m,
                             at::Tensor weight_tensor,
                             at::Tensor grad_points_tensor) {
 
-    const float *grad_out = grad_out_tensor.data_ptr<float>();
-    const float *weight = weight_tensor.data_ptr<float>();
-    float *grad_points = grad_points_tensor.data_ptr<float>();
-    const int *idx = idx_tensor.data_ptr<int>();
-
     cudaStream_t stream = THCState_getCurrentStream(state);
-    three_interpolate_grad_kernel_launcher_fast(b, c, n, m, grad_out, idx, weight, grad_points, stream);
+    three_interpolate_grad_kernel_launcher_fast(b, c, n, m, grad_out_tensor, idx_tensor, weight_tensor, grad_points_tensor, stream);
 }
 
 PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
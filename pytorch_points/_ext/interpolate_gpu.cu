@@ -2,6 +2,10 @@
 #include <stdio.h>
 #include <stdlib.h>
 
+#include <ATen/ATen.h>
+#include <ATen/OpMathType.h>
+#include <ATen/cuda/Atomic.cuh>
+
 #include "cuda_utils.h"
 #include "interpolate_gpu.h"
 
@@ -74,8 +78,9 @@ void three_nn_kernel_launcher_fast(int b, int n, int m, const float *unknown,
 }
 
 
-__global__ void three_interpolate_kernel_fast(int b, int c, int m, int n, const float *__restrict__ points, 
-    const int *__restrict__ idx, const float *__restrict__ weight, float *__restrict__ out) {
+template <typename scalar_t>
+__global__ void three_interpolate_kernel_fast(int b, int c, int m, int n, const scalar_t *__restrict__ points,
+    const int *__restrict__ idx, const scalar_t *__restrict__ weight, scalar_t *__restrict__ out) {
     // points: (B, C, M)
     // idx: (B, N, 3)
     // weight: (B, N, 3)
@@ -93,11 +98,14 @@ __global__ void three_interpolate_kernel_fast(int b, int c, int m, int n, const
     idx += bs_idx * n * 3 + pt_idx * 3;
     out += bs_idx * c * n + c_idx * n;
 
-    out[pt_idx] = weight[0] * points[idx[0]] + weight[1] * points[idx[1]] + weight[2] * points[idx[2]];
+    // the weighted sum of half and bfloat16 features is formed in float
+    using acc_t = at::opmath_type<scalar_t>;
+    out[pt_idx] = static_cast<acc_t>(weight[0]) * points[idx[0]] + static_cast<acc_t>(weight[1]) * points[idx[1]] +
+                  static_cast<acc_t>(weight[2]) * points[idx[2]];
 }
 
-void three_interpolate_kernel_launcher_fast(int b, int c, int m, int n, 
-    const float *points, const int *idx, const float *weight, float *out, cudaStream_t stream) {
+void three_interpolate_kernel_launcher_fast(int b, int c, int m, int n, const at::Tensor& points,
+    const at::Tensor& idx, const at::Tensor& weight, at::Tensor& out, cudaStream_t stream) {
     // points: (B, C, M)
     // idx: (B, N, 3)
     // weight: (B, N, 3)
@@ -107,7 +115,11 @@ void three_interpolate_kernel_launcher_fast(int b, int c, int m, int n,
     cudaError_t err;
     dim3 blocks(DIVUP(n, THREADS_PER_BLOCK), c, b);  // blockIdx.x(col), blockIdx.y(row)
     dim3 threads(THREADS_PER_BLOCK);
-    three_interpolate_kernel_fast<<<blocks, threads, 0, stream>>>(b, c, m, n, points, idx, weight, out);
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, points.scalar_type(),
+        "three_interpolate_kernel_fast", [&] {
+        three_interpolate_kernel_fast<scalar_t><<<blocks, threads, 0, stream>>>(b, c, m, n,
+            points.data_ptr<scalar_t>(), idx.data_ptr<int>(), weight.data_ptr<scalar_t>(), out.data_ptr<scalar_t>());
+    });
 
     err = cudaGetLastError();
     if (cudaSuccess != err) {
@@ -117,8 +129,9 @@ void three_interpolate_kernel_launcher_fast(int b, int c, int m, int n,
 }
 
 
-__global__ void three_interpolate_grad_kernel_fast(int b, int c, int n, int m, const float *__restrict__ grad_out, 
-    const int *__restrict__ idx, const float *__restrict__ weight, float *__restrict__ grad_points) {
+template <typename scalar_t, typename acc_t>
+__global__ void three_interpolate_grad_kernel_fast(int b, int c, int n, int m, const scalar_t *__restrict__ grad_out,
+    const int *__restrict__ idx, const scalar_t *__restrict__ weight, acc_t *__restrict__ grad_points) {
     // grad_out: (B, C, N)
     // weight: (B, N, 3)
     // output:
@@ -136,13 +149,14 @@ __global__ void three_interpolate_grad_kernel_fast(int b, int c, int n, int m, c
     idx += bs_idx * n * 3 + pt_idx * 3;
 
 
-    atomicAdd(grad_points + idx[0], grad_out[0] * weight[0]);
-    atomicAdd(grad_points + idx[1], grad_out[0] * weight[1]);
-    atomicAdd(grad_points + idx[2], grad_out[0] * weight[2]);
+    const acc_t g = grad_out[0];
+    gpuAtomicAdd(grad_points + idx[0], g * static_cast<acc_t>(weight[0]));
+    gpuAtomicAdd(grad_points + idx[1], g * static_cast<acc_t>(weight[1]));
+    gpuAtomicAdd(grad_points + idx[2], g * static_cast<acc_t>(weight[2]));
 }
 
-void three_interpolate_grad_kernel_launcher_fast(int b, int c, int n, int m, const float *grad_out, 
-    const int *idx, const float *weight, float *grad_points, cudaStream_t stream) {
+void three_interpolate_grad_kernel_launcher_fast(int b, int c, int n, int m, const at::Tensor& grad_out,
+    const at::Tensor& idx, const at::Tensor& weight, at::Tensor& grad_points, cudaStream_t stream) {
     // grad_out: (B, C, N)
     // weight: (B, N, 3)
     // output:
@@ -151,7 +165,17 @@ void three_interpolate_grad_kernel_launcher_fast(int b, int c, int n, int m, con
     cudaError_t err;
     dim3 blocks(DIVUP(n, THREADS_PER_BLOCK), c, b);  // blockIdx.x(col), blockIdx.y(row)
     dim3 threads(THREADS_PER_BLOCK);
-    three_interpolate_grad_kernel_fast<<<blocks, threads, 0, stream>>>(b, c, n, m, grad_out, idx, weight, grad_points);
+    // half and bfloat16 gradients are accumulated in a float buffer
+    const bool reduced = grad_points.scalar_type() == at::ScalarType::Half ||
+                         grad_points.scalar_type() == at::ScalarType::BFloat16;
+    at::Tensor acc = reduced ? grad_points.to(at::ScalarType::Float) : grad_points;
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, grad_out.scalar_type(),
+        "three_interpolate_grad_kernel_fast", [&] {
+        using acc_t = at::opmath_type<scalar_t>;
+        three_interpolate_grad_kernel_fast<scalar_t, acc_t><<<blocks, threads, 0, stream>>>(b, c, n, m,
+            grad_out.data_ptr<scalar_t>(), idx.data_ptr<int>(), weight.data_ptr<scalar_t>(), acc.data_ptr<acc_t>());
+    });
+    if (reduced) grad_points.copy_(acc);
 
     err = cudaGetLastError();
     if (cudaSuccess != err) {
@@ -2,6 +2,7 @@
 #include <vector>
 
 
+#ifdef WITH_CUDA
 int chamfer_cuda_forward(at::Tensor& xyz1, at::Tensor& xyz2, at::Tensor& dist1, at::Tensor& dist2, at::Tensor& idx1, at::Tensor& idx2);
 
 
@@ -9,26 +10,68 @@ int chamfer_cuda_backward(at::Tensor& xyz1, at::Tensor& xyz2, at::Tensor& gradxy
 
 int labeled_chamfer_cuda_forward(const at::Tensor& xyz1, const at::Tensor& xyz2, const at::Tensor& label1, const at::Tensor& label2,
 						 		                 at::Tensor& dist1, at::Tensor& dist2, at::Tensor& idx1, at::Tensor& idx2);
+#endif
+
+// CPU declarations
+
+int chamfer_cpu_forward(at::Tensor& xyz1, at::Tensor& xyz2, at::Tensor& dist1, at::Tensor& dist2, at::Tensor& idx1, at::Tensor& idx2);
+
+int chamfer_cpu_backward(at::Tensor& xyz1, at::Tensor& xyz2, at::Tensor& gradxyz1, at::Tensor& gradxyz2, at::Tensor& graddist1, at::Tensor& graddist2, at::Tensor& idx1, at::Tensor& idx2);
+
+int labeled_chamfer_cpu_forward(const at::Tensor& xyz1, const at::Tensor& xyz2, const at::Tensor& label1, const at::Tensor& label2,
+                                at::Tensor& dist1, at::Tensor& dist2, at::Tensor& idx1, at::Tensor& idx2);
+
+int chamfer_packed_cpu_forward(const at::Tensor& xyz1, const at::Tensor& offsets1, const at::Tensor& xyz2, const at::Tensor& offsets2,
+                               at::Tensor& dist1, at::Tensor& dist2, at::Tensor& idx1, at::Tensor& idx2);
 
 int chamfer_forward(at::Tensor& xyz1, at::Tensor& xyz2, at::Tensor& dist1, at::Tensor& dist2, at::Tensor& idx1, at::Tensor& idx2) {
-    return chamfer_cuda_forward(xyz1, xyz2, dist1, dist2, idx1, idx2);
+    if (xyz1.is_cuda()) {
+#ifdef WITH_CUDA
+        return chamfer_cuda_forward(xyz1, xyz2, dist1, dist2, idx1, idx2);
+#else
+        TORCH_CHECK(false, "xyz1 is a CUDA tensor, but pytorch_points was built without CUDA");
+#endif
+    }
+    return chamfer_cpu_forward(xyz1, xyz2, dist1, dist2, idx1, idx2);
 }
 
 int labeled_chamfer_forward(const at::Tensor& xyz1, const at::Tensor& xyz2, const at::Tensor& label1, const at::Tensor& label2,
 						 		            at::Tensor& dist1, at::Tensor& dist2, at::Tensor& idx1, at::Tensor& idx2) {
-    return labeled_chamfer_cuda_forward(xyz1, xyz2, label1, label2, dist1, dist2, idx1, idx2);
+    if (xyz1.is_cuda()) {
+#ifdef WITH_CUDA
+        return labeled_chamfer_cuda_forward(xyz1, xyz2, label1, label2, dist1, dist2, idx1, idx2);
+#else
+        TORCH_CHECK(false, "xyz1 is a CUDA tensor, but pytorch_points was built without CUDA");
+#endif
+    }
+    return labeled_chamfer_cpu_forward(xyz1, xyz2, label1, label2, dist1, dist2, idx1, idx2);
+}
+
+
+// packed clouds xyz1 (P1, c), xyz2 (P2, c) with offsets (b + 1), indices are global
+int chamfer_packed_forward(const at::Tensor& xyz1, const at::Tensor& offsets1, const at::Tensor& xyz2, const at::Tensor& offsets2,
+                           at::Tensor& dist1, at::Tensor& dist2, at::Tensor& idx1, at::Tensor& idx2) {
+    TORCH_CHECK(!xyz1.is_cuda(), "packed chamfer runs on cpu, compute cuda clouds one by one");
+    return chamfer_packed_cpu_forward(xyz1, offsets1, xyz2, offsets2, dist1, dist2, idx1, idx2);
 }
 
 
 int chamfer_backward(at::Tensor& xyz1, at::Tensor& xyz2, at::Tensor& gradxyz1, at::Tensor& gradxyz2, at::Tensor& graddist1,
 					  at::Tensor& graddist2, at::Tensor& idx1, at::Tensor& idx2) {
-
-    return chamfer_cuda_backward(xyz1, xyz2, gradxyz1, gradxyz2, graddist1, graddist2, idx1, idx2);
+    if (xyz1.is_cuda()) {
+#ifdef WITH_CUDA
+        return chamfer_cuda_backward(xyz1, xyz2, gradxyz1, gradxyz2, graddist1, graddist2, idx1, idx2);
+#else
+        TORCH_CHECK(false, "xyz1 is a CUDA tensor, but pytorch_points was built without CUDA");
+#endif
+    }
+    return chamfer_cpu_backward(xyz1, xyz2, gradxyz1, gradxyz2, graddist1, graddist2, idx1, idx2);
 }
 
 
 PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
-  m.def("nmdistance_forward", &chamfer_forward, "chamfer forward (CUDA)");
-  m.def("labeled_nmdistance_forward", &labeled_chamfer_forward, "labeled chamfer forward (CUDA)");
-  m.def("nmdistance_backward", &chamfer_backward, "chamfer backward (CUDA)");
+  m.def("nmdistance_forward", &chamfer_forward, "chamfer forward (CUDA/CPU)");
+  m.def("nmdistance_packed_forward", &chamfer_packed_forward, "chamfer forward of packed clouds (CPU)");
+  m.def("labeled_nmdistance_forward", &labeled_chamfer_forward, "labeled chamfer forward (CUDA/CPU)");
+  m.def("nmdistance_backward", &chamfer_backward, "chamfer backward (CUDA/CPU)");
 }
\ No newline at end of file
@@ -0,0 +1,297 @@
+#include <torch/extension.h>
+#include <ATen/Parallel.h>
+#include <algorithm>
+#include <vector>
+#include "cpu_utils.h"
+
+// CPU engine of the chamfer distance
+
+// queries and references are processed in blocks so that a reference block stays in cache
+const int QUERY_BLOCK = 32;
+const int REF_BLOCK = 512;
+// use the grid once a brute-force search would do more than GRID_WORK distance evaluations
+const int64_t GRID_WORK = 1 << 22;
+const int GRID_MIN_REF = 256;
+
+// nearest neighbor search in a fixed reference set (nr, c),
+// ties are broken by the smaller index as in the sequential scan of the cuda kernel
+template <typename scalar_t>
+struct NNSearch {
+    const scalar_t *ref;
+    int nr;
+    int c;
+    bool use_grid;
+    DenseGrid grid;
+
+    void init(const scalar_t *ref_, int nr_, int c_, int64_t nq) {
+        ref = ref_;
+        nr = nr_;
+        c = c_;
+        use_grid = c == 3 && nr >= GRID_MIN_REF && nq * nr >= GRID_WORK;
+        if (use_grid) grid.build(ref, nr);
+    }
+
+    // query(nq, c) -> dist(nq), idx(nq)
+    void query(const scalar_t *query, int64_t nq, scalar_t *dist, int *idx) const {
+        if (nr == 0) {
+            std::fill(dist, dist + nq, scalar_t(0));
+            std::fill(idx, idx + nq, -1);
+        } else if (use_grid) {
+            query_grid(query, nq, dist, idx);
+        } else {
+            query_blocked(query, nq, dist, idx);
+        }
+    }
+
+    void query_blocked(const scalar_t *query, int64_t nq, scalar_t *dist, int *idx) const {
+        scalar_t best[QUERY_BLOCK];
+        int best_i[QUERY_BLOCK];
+        for (int64_t q0 = 0; q0 < nq; q0 += QUERY_BLOCK) {
+            const int end_q = std::min<int64_t>(nq - q0, QUERY_BLOCK);
+            for (int j = 0; j < end_q; ++j) best_i[j] = -1;
+            for (int k0 = 0; k0 < nr; k0 += REF_BLOCK) {
+                const int end_k = std::min(nr - k0, REF_BLOCK);
+                for (int j = 0; j < end_q; ++j) {
+                    const scalar_t *p = query + (q0 + j) * c;
+                    scalar_t b = best[j];
+                    int bi = best_i[j];
+                    for (int k = 0; k < end_k; ++k) {
+                        const scalar_t *r = ref + (k0 + k) * c;
+                        scalar_t d = 0;
+                        for (int _c = 0; _c < c; ++_c) {
+                            const scalar_t tmp = r[_c] - p[_c];
+                            d += tmp * tmp;
+                        }
+                        if (bi < 0 || d < b) {
+                            b = d;
+                            bi = k0 + k;
+                        }
+                    }
+                    best[j] = b;
+                    best_i[j] = bi;
+                }
+            }
+            for (int j = 0; j < end_q; ++j) {
+                dist[q0 + j] = best[j];
+                idx[q0 + j] = best_i[j];
+            }
+        }
+    }
+
+    void query_grid(const scalar_t *query, int64_t nq, scalar_t *dist, int *idx) const {
+        for (int64_t j = 0; j < nq; ++j) {
+            const scalar_t *p = query + j * 3;
+            double best = 0;
+            int best_i = -1;
+            auto visit = [&](int k) {
+                const scalar_t *r = ref + k * 3;
+                const scalar_t dx = r[0] - p[0], dy = r[1] - p[1], dz = r[2] - p[2];
+                const double d = static_cast<scalar_t>(dx * dx + dy * dy + dz * dz);
+                if (best_i < 0 || d < best || (d == best && k < best_i)) {
+                    best = d;
+                    best_i = k;
+                }
+            };
+            int64_t cell[3];
+            grid.cell_of(p[0], p[1], p[2], cell);
+            for (int64_t r = 0; r <= grid.max_radius(); ++r) {
+                if (!grid.visit_shell(cell, r, visit)) break;
+                const double bound = r * grid.cell;
+                if (best_i >= 0 && best < bound * bound) break;
+            }
+            dist[j] = best;
+            idx[j] = best_i;
+        }
+    }
+};
+
+// xyz1 (b, n, c), xyz2 (b, m, c) -> dist1 (b, n), idx1 (b, n)
+template <typename scalar_t>
+void nn_distance_cpu_kernel(int b, int n, int c, const scalar_t *xyz1, int m, const scalar_t *xyz2,
+    scalar_t *result, int *result_i) {
+    std::vector<NNSearch<scalar_t>> search(b);
+    at::parallel_for(0, b, 1, [&](int64_t start, int64_t end) {
+        for (int64_t i = start; i < end; ++i) {
+            search[i].init(xyz2 + i * m * c, m, c, n);
+        }
+    });
+    // parallel over batches and query tiles
+    const int64_t tiles = (n + QUERY_BLOCK * 4 - 1) / (QUERY_BLOCK * 4);
+    at::parallel_for(0, b * tiles, 1, [&](int64_t start, int64_t end) {
+        for (int64_t t = start; t < end; ++t) {
+            const int64_t i = t / tiles;
+            const int64_t q0 = (t % tiles) * QUERY_BLOCK * 4;
+            const int64_t nq = std::min<int64_t>(n - q0, QUERY_BLOCK * 4);
+            search[i].query(xyz1 + (i * n + q0) * c, nq, result + i * n + q0, result_i + i * n + q0);
+        }
+    });
+}
+
+// packed clouds: the queries xyz1[offsets1[i]:offsets1[i+1]] search xyz2[offsets2[i]:offsets2[i+1]],
+// the indices are global, i.e. relative to the packed xyz2
+template <typename scalar_t>
+void nn_distance_packed_cpu_kernel(int b, int c, const int64_t *offsets1, const scalar_t *xyz1,
+    const int64_t *offsets2, const scalar_t *xyz2, scalar_t *result, int *result_i) {
+    std::vector<NNSearch<scalar_t>> search(b);
+    at::parallel_for(0, b, 1, [&](int64_t start, int64_t end) {
+        for (int64_t i = start; i < end; ++i) {
+            search[i].init(xyz2 + offsets2[i] * c, offsets2[i + 1] - offsets2[i], c, offsets1[i + 1] - offsets1[i]);
+        }
+    });
+    // tiles of at most QUERY_BLOCK * 4 queries that do not cross clouds
+    std::vector<int64_t> tile_cloud, tile_start;
+    for (int i = 0; i < b; ++i) {
+        for (int64_t q0 = offsets1[i]; q0 < offsets1[i + 1]; q0 += QUERY_BLOCK * 4) {
+            tile_cloud.push_back(i);
+            tile_start.push_back(q0);
+        }
+    }
+    at::parallel_for(0, tile_cloud.size(), 1, [&](int64_t start, int64_t end) {
+        for (int64_t t = start; t < end; ++t) {
+            const int64_t i = tile_cloud[t];
+            const int64_t q0 = tile_start[t];
+            const int64_t nq = std::min<int64_t>(offsets1[i + 1] - q0, QUERY_BLOCK * 4);
+            search[i].query(xyz1 + q0 * c, nq, result + q0, result_i + q0);
+            for (int64_t j = q0; j < q0 + nq; ++j) {
+                if (result_i[j] >= 0) result_i[j] += offsets2[i];
+            }
+        }
+    });
+}
+
+// indices (n) sorted by label, stable w.r.t. the index
+template <typename scalar_t>
+static std::vector<int> sort_by_label(const scalar_t *label, int n) {
+    std::vector<int> order(n);
+    for (int k = 0; k < n; ++k) order[k] = k;
+    std::stable_sort(order.begin(), order.end(), [&](int a, int b) { return label[a] < label[b]; });
+    return order;
+}
+
+// labeled nearest neighbor: every query only searches the points of its own label,
+// queries without a matching label get idx -1 and distance 0
+template <typename scalar_t>
+void labeled_nn_distance_cpu_kernel(int b, int n, int c, const scalar_t *xyz1, const scalar_t *label1,
+    int m, const scalar_t *xyz2, const scalar_t *label2, scalar_t *result, int *result_i) {
+    for (int i = 0; i < b; ++i) {
+        const scalar_t *points1 = xyz1 + i * n * c;
+        const scalar_t *points2 = xyz2 + i * m * c;
+        const scalar_t *l1 = label1 + i * n;
+        const scalar_t *l2 = label2 + i * m;
+        const std::vector<int> order1 = sort_by_label(l1, n);
+        const std::vector<int> order2 = sort_by_label(l2, m);
+        int s2 = 0;
+        for (int s1 = 0; s1 < n;) {
+            // bucket [s1, e1) of queries and [s2, e2) of references with the same label
+            const scalar_t label = l1[order1[s1]];
+            int e1 = s1;
+            while (e1 < n && l1[order1[e1]] == label) ++e1;
+            while (s2 < m && l2[order2[s2]] < label) ++s2;
+            int e2 = s2;
+            while (e2 < m && l2[order2[e2]] == label) ++e2;
+
+            const int nq = e1 - s1, nr = e2 - s2;
+            std::vector<scalar_t> query(static_cast<int64_t>(nq) * c), ref(static_cast<int64_t>(nr) * c);
+            for (int k = 0; k < nq; ++k) std::copy_n(points1 + order1[s1 + k] * c, c, query.data() + k * c);
+            for (int k = 0; k < nr; ++k) std::copy_n(points2 + order2[s2 + k] * c, c, ref.data() + k * c);
+            NNSearch<scalar_t> search;
+            search.init(ref.data(), nr, c, nq);
+            std::vector<scalar_t> dist(nq);
+            std::vector<int> idx(nq);
+            at::parallel_for(0, nq, QUERY_BLOCK * 4, [&](int64_t start, int64_t end) {
+                search.query(query.data() + start * c, end - start, dist.data() + start, idx.data() + start);
+            });
+            for (int k = 0; k < nq; ++k) {
+                // buckets are ordered by index, hence the local order preserves the tie breaking
+                result[i * n + order1[s1 + k]] = dist[k];
+                result_i[i * n + order1[s1 + k]] = idx[k] < 0 ? -1 : order2[s2 + idx[k]];
+            }
+            s1 = e1;
+            s2 = e2;
+        }
+    }
+}
+
+// accumulate the gradient of dist1, every batch is owned by one thread
+template <typename scalar_t>
+void nn_distance_grad_cpu_kernel(int b, int n, int c, const scalar_t *xyz1, int m, const scalar_t *xyz2,
+    const scalar_t *grad_dist1, const int *idx1, scalar_t *grad_xyz1, scalar_t *grad_xyz2) {
+    at::parallel_for(0, b, 1, [&](int64_t start, int64_t end) {
+        for (int64_t i = start; i < end; ++i) {
+            for (int j = 0; j < n; ++j) {
+                const int j2 = idx1[i * n + j];
+                // ignore negative indices (for labeled_nmdistance points can have no closest neighbors!)
+                if (j2 < 0) continue;
+                const scalar_t g = grad_dist1[i * n + j] * 2;
+                for (int _c = 0; _c < c; ++_c) {
+                    const scalar_t xyz_g = g * (xyz1[(i * n + j) * c + _c] - xyz2[(i * m + j2) * c + _c]);
+                    grad_xyz1[(i * n + j) * c + _c] += xyz_g;
+                    grad_xyz2[(i * m + j2) * c + _c] -= xyz_g;
+                }
+            }
+        }
+    });
+}
+
+int chamfer_cpu_forward(at::Tensor& xyz1, at::Tensor& xyz2, at::Tensor& dist1, at::Tensor& dist2, at::Tensor& idx1, at::Tensor& idx2) {
+    const auto batch_size = xyz1.size(0);
+    const auto n = xyz1.size(1);
+    const auto m = xyz2.size(1);
+    const auto c = xyz1.size(2);
+    TORCH_CHECK(xyz2.size(2) == c, "xyz1 and xyz2 must have the same point dimension");
+    AT_DISPATCH_FLOATING_TYPES(xyz1.scalar_type(), "nn_distance_cpu_kernel", ([&] {
+        nn_distance_cpu_kernel<scalar_t>(batch_size, n, c, xyz1.data_ptr<scalar_t>(), m, xyz2.data_ptr<scalar_t>(), dist1.data_ptr<scalar_t>(), idx1.data_ptr<int>());
+        nn_distance_cpu_kernel<scalar_t>(batch_size, m, c, xyz2.data_ptr<scalar_t>(), n, xyz1.data_ptr<scalar_t>(), dist2.data_ptr<scalar_t>(), idx2.data_ptr<int>());
+    }));
+    return 1;
+}
+
+int chamfer_packed_cpu_forward(const at::Tensor& xyz1, const at::Tensor& offsets1, const at::Tensor& xyz2, const at::Tensor& offsets2,
+                               at::Tensor& dist1, at::Tensor& dist2, at::Tensor& idx1, at::Tensor& idx2) {
+    const auto c = xyz1.size(1);
+    TORCH_CHECK(xyz2.size(1) == c, "xyz1 and xyz2 must have the same point dimension");
+    TORCH_CHECK(offsets1.size(0) == offsets2.size(0), "offsets1 and offsets2 must have the same size");
+    const auto off1 = offsets1.to(at::kLong).contiguous();
+    const auto off2 = offsets2.to(at::kLong).contiguous();
+    const int b = off1.size(0) - 1;
+    AT_DISPATCH_FLOATING_TYPES(xyz1.scalar_type(), "nn_distance_packed_cpu_kernel", ([&] {
+        nn_distance_packed_cpu_kernel<scalar_t>(b, c, off1.data_ptr<int64_t>(), xyz1.data_ptr<scalar_t>(), off2.data_ptr<int64_t>(),
+                                                xyz2.data_ptr<scalar_t>(), dist1.data_ptr<scalar_t>(), idx1.data_ptr<int>());
+        nn_distance_packed_cpu_kernel<scalar_t>(b, c, off2.data_ptr<int64_t>(), xyz2.data_ptr<scalar_t>(), off1.data_ptr<int64_t>(),
+                                                xyz1.data_ptr<scalar_t>(), dist2.data_ptr<scalar_t>(), idx2.data_ptr<int>());
+    }));
+    return 1;
+}
+
+int labeled_chamfer_cpu_forward(const at::Tensor& xyz1, const at::Tensor& xyz2, const at::Tensor& label1, const at::Tensor& label2,
+                                at::Tensor& dist1, at::Tensor& dist2, at::Tensor& idx1, at::Tensor& idx2) {
+    const auto batch_size = xyz1.size(0);
+    const auto n = xyz1.size(1);
+    const auto m = xyz2.size(1);
+    const auto c = xyz1.size(2);
+    TORCH_CHECK(xyz2.size(2) == c, "xyz1 and xyz2 must have the same point dimension");
+    AT_DISPATCH_FLOATING_TYPES(xyz1.scalar_type(), "labeled_nn_distance_cpu_kernel", ([&] {
+        const at::Tensor l1 = label1.toType(xyz1.scalar_type()).contiguous();
+        const at::Tensor l2 = label2.toType(xyz1.scalar_type()).contiguous();
+        labeled_nn_distance_cpu_kernel<scalar_t>(batch_size, n, c, xyz1.data_ptr<scalar_t>(), l1.data_ptr<scalar_t>(), m,
+                                                 xyz2.data_ptr<scalar_t>(), l2.data_ptr<scalar_t>(), dist1.data_ptr<scalar_t>(), idx1.data_ptr<int>());
+        labeled_nn_distance_cpu_kernel<scalar_t>(batch_size, m, c, xyz2.data_ptr<scalar_t>(), l2.data_ptr<scalar_t>(), n,
+                                                 xyz1.data_ptr<scalar_t>(), l1.data_ptr<scalar_t>(), dist2.data_ptr<scalar_t>(), idx2.data_ptr<int>());
+    }));
+    return 1;
+}
+
+int chamfer_cpu_backward(at::Tensor& xyz1, at::Tensor& xyz2, at::Tensor& gradxyz1, at::Tensor& gradxyz2, at::Tensor& graddist1, at::Tensor& graddist2, at::Tensor& idx1, at::Tensor& idx2) {
+    const auto batch_size = xyz1.size(0);
+    const auto n = xyz1.size(1);
+    const auto m = xyz2.size(1);
+    const auto c = xyz1.size(2);
+    gradxyz1.zero_();
+    gradxyz2.zero_();
+    TORCH_CHECK(xyz2.size(2) == c, "xyz1 and xyz2 must have the same point dimension");
+    AT_DISPATCH_FLOATING_TYPES(xyz1.scalar_type(), "nn_distance_grad_cpu_kernel", ([&] {
+        nn_distance_grad_cpu_kernel<scalar_t>(batch_size, n, c, xyz1.data_ptr<scalar_t>(), m, xyz2.data_ptr<scalar_t>(), graddist1.data_ptr<scalar_t>(), idx1.data_ptr<int>(), gradxyz1.data_ptr<scalar_t>(), gradxyz2.data_ptr<scalar_t>());
+        nn_distance_grad_cpu_kernel<scalar_t>(batch_size, m, c, xyz2.data_ptr<scalar_t>(), n, xyz1.data_ptr<scalar_t>(), graddist2.data_ptr<scalar_t>(), idx2.data_ptr<int>(), gradxyz2.data_ptr<scalar_t>(), gradxyz1.data_ptr<scalar_t>());
+    }));
+    return 1;
+}
@@ -5,38 +5,104 @@
 
 // CUDA forward declarations
 
-
+#ifdef WITH_CUDA
 void furthest_sampling_cuda_forward(const int m, const int seedIdx,
   at::Tensor& input, at::Tensor& temp, at::Tensor& idx);
 
+void furthest_sampling_resume_cuda(const int m, const int start, const int applied,
+  const at::Tensor& input, at::Tensor& temp, at::Tensor& idx);
+
 void gather_points_kernel_launcher_fast(int b, int c, int n, int npoints,
-    const float *points, const int *idx, float *out, at::cuda::CUDAStream stream);
+    const at::Tensor& points, const at::Tensor& idx, at::Tensor& out, at::cuda::CUDAStream stream);
 
 void gather_points_grad_kernel_launcher_fast(int b, int c, int n, int npoints,
-    const float *grad_out, const int *idx, float *grad_points, at::cuda::CUDAStream stream);
+    const at::Tensor& grad_out, const at::Tensor& idx, at::Tensor& grad_points, at::cuda::CUDAStream stream);
+#endif
+
+// CPU forward declarations
+
+void furthest_sampling_cpu_forward(const int m, const int seedIdx,
+  at::Tensor& input, at::Tensor& temp, at::Tensor& idx);
+
+void gather_points_cpu(int b, int c, int n, int npoints,
+    const at::Tensor& points, const at::Tensor& idx, at::Tensor& out);
+
+void gather_points_grad_cpu(int b, int c, int n, int npoints,
+    const at::Tensor& grad_out, const at::Tensor& idx, at::Tensor& grad_points);
+
+void ball_query_cpu(int b, int n, int m, float radius, int nsample,
+    const at::Tensor& new_xyz, const at::Tensor& xyz, at::Tensor& idx);
+
+void furthest_sampling_resume_cpu(const int m, const int start, const int applied,
+    const at::Tensor& input, at::Tensor& temp, at::Tensor& idx);
+
+void furthest_sampling_grid_cpu(const int m, const int first_idx, const double eps,
+    const at::Tensor& input, at::Tensor& idx);
+
+void furthest_sampling_packed_cpu(const int first_idx, const at::Tensor& input, const at::Tensor& offsets,
+    const at::Tensor& sample_offsets, at::Tensor& idx);
+
+void ball_query_packed_cpu(const at::Tensor& new_xyz, const at::Tensor& new_offsets, const at::Tensor& xyz,
+    const at::Tensor& offsets, float radius, int nsample, at::Tensor& idx);
+
+void group_points_cpu(int b, int c, int n, int npoints, int nsample,
+    const at::Tensor& points, const at::Tensor& idx, at::Tensor& out);
+
+void group_points_grad_cpu(int b, int c, int n, int npoints, int nsample,
+    const at::Tensor& grad_out, const at::Tensor& idx, at::Tensor& grad_points);
+
+void group_and_center_cpu(int b, int c, int n, int m, int nsample, int cx,
+    const at::Tensor& new_xyz, const at::Tensor& xyz, const at::Tensor& features, const at::Tensor& idx, at::Tensor& out);
+
+void group_and_center_grad_cpu(int b, int c, int n, int m, int nsample, int cx,
+    const at::Tensor& grad_out, const at::Tensor& idx, at::Tensor& grad_xyz, at::Tensor& grad_new_xyz, at::Tensor& grad_features);
+
+void three_nn_cpu(int b, int n, int m, const float *unknown,
+    const float *known, float *dist2, int *idx);
+
+void three_interpolate_cpu(int b, int c, int m, int n,
+    const at::Tensor& points, const at::Tensor& idx, const at::Tensor& weight, at::Tensor& out);
+
+void three_interpolate_grad_cpu(int b, int c, int n, int m,
+    const at::Tensor& grad_out, const at::Tensor& idx, const at::Tensor& weight, at::Tensor& grad_points);
 
 
 int gather_points_wrapper_fast(int b, int c, int n, int npoints,
     at::Tensor& points_tensor, at::Tensor& idx_tensor, at::Tensor& out_tensor){
-    const float *points = points_tensor.data_ptr<float>();
-    const int *idx = idx_tensor.data_ptr<int>();
-    float *out = out_tensor.data_ptr<float>();
-
-    at::cuda::CUDAStream stream = at::cuda::getCurrentCUDAStream();
-    gather_points_kernel_launcher_fast(b, c, n, npoints, points, idx, out, stream);
+    CHECK_IS_FLOATING(points_tensor);
+    CHECK_SAME_TYPE(points_tensor, out_tensor);
+    CHECK_IS_INT(idx_tensor);
+
+    if (points_tensor.is_cuda()) {
+#ifdef WITH_CUDA
+        at::cuda::CUDAStream stream = at::cuda::getCurrentCUDAStream();
+        gather_points_kernel_launcher_fast(b, c, n, npoints, points_tensor, idx_tensor, out_tensor, stream);
+#else
+        NO_CUDA_ERROR(points_tensor);
+#endif
+    } else {
+        gather_points_cpu(b, c, n, npoints, points_tensor, idx_tensor, out_tensor);
+    }
     return 1;
 }
 
 
 int gather_points_grad_wrapper_fast(int b, int c, int n, int npoints,
     at::Tensor& grad_out_tensor, at::Tensor& idx_tensor, at::Tensor& grad_points_tensor) {
-
-    const float *grad_out = grad_out_tensor.data_ptr<float>();
-    const int *idx = idx_tensor.data_ptr<int>();
-    float *grad_points = grad_points_tensor.data_ptr<float>();
-
-    at::cuda::CUDAStream stream = at::cuda::getCurrentCUDAStream();
-    gather_points_grad_kernel_launcher_fast(b, c, n, npoints, grad_out, idx, grad_points, stream);
+    CHECK_IS_FLOATING(grad_out_tensor);
+    CHECK_SAME_TYPE(grad_out_tensor, grad_points_tensor);
+    CHECK_IS_INT(idx_tensor);
+
+    if (grad_out_tensor.is_cuda()) {
+#ifdef WITH_CUDA
+        at::cuda::CUDAStream stream = at::cuda::getCurrentCUDAStream();
+        gather_points_grad_kernel_launcher_fast(b, c, n, npoints, grad_out_tensor, idx_tensor, grad_points_tensor, stream);
+#else
+        NO_CUDA_ERROR(grad_out_tensor);
+#endif
+    } else {
+        gather_points_grad_cpu(b, c, n, npoints, grad_out_tensor, idx_tensor, grad_points_tensor);
+    }
     return 1;
 }
 
@@ -73,47 +139,157 @@ at::Tensor furthest_sampling_forward(
   at::Tensor& idx
 )
 {
-  CHECK_INPUT(input);
-  CHECK_INPUT(temp);
-  furthest_sampling_cuda_forward(m, seedIdx, input, temp, idx);
+  CHECK_CONTIGUOUS(input);
+  CHECK_CONTIGUOUS(temp);
+  CHECK_IS_FLOAT(input);
+  CHECK_IS_FLOAT(temp);
+  if (input.is_cuda()) {
+#ifdef WITH_CUDA
+    CHECK_CUDA(temp);
+    furthest_sampling_cuda_forward(m, seedIdx, input, temp, idx);
+#else
+    NO_CUDA_ERROR(input);
+#endif
+  } else {
+    furthest_sampling_cpu_forward(m, seedIdx, input, temp, idx);
+  }
+  return idx;
+}
+
+// continue furthest point sampling, idx (b, m) int32 holds `start` given samples in its first
+// columns, temp (b, n) the minimum squared distance to the first `applied` of them.
+// Fills idx[:, start:] and leaves the minimum distance to idx[:, :m-1] in temp.
+at::Tensor furthest_sampling_resume(const int m, const int start, const int applied,
+  const at::Tensor& input, at::Tensor& temp, at::Tensor& idx)
+{
+  CHECK_CONTIGUOUS(input);
+  CHECK_CONTIGUOUS(temp);
+  CHECK_CONTIGUOUS(idx);
+  CHECK_IS_FLOAT(input);
+  CHECK_IS_FLOAT(temp);
+  CHECK_IS_INT(idx);
+  TORCH_CHECK(0 <= applied && applied < start && start <= m, "need 0 <= applied < start <= m");
+  TORCH_CHECK(idx.size(1) == m, "idx must have m columns");
+  if (input.is_cuda()) {
+#ifdef WITH_CUDA
+    CHECK_CUDA(temp);
+    CHECK_CUDA(idx);
+    furthest_sampling_resume_cuda(m, start, applied, input, temp, idx);
+#else
+    NO_CUDA_ERROR(input);
+#endif
+  } else {
+    furthest_sampling_resume_cpu(m, start, applied, input, temp, idx);
+  }
+  return idx;
+}
+
+// grid-pruned furthest point sampling, eps = 0 is exact, eps > 0 picks every sample at least
+// (1 - eps) times as far as the furthest point, input (b, n, 3) -> idx (b, m)
+at::Tensor furthest_sampling_grid(const int m, const int seedIdx, const double eps, const at::Tensor& input)
+{
+  CHECK_CONTIGUOUS(input);
+  CHECK_IS_FLOAT(input);
+  TORCH_CHECK(!input.is_cuda(), "grid furthest sampling runs on cpu");
+  TORCH_CHECK(eps >= 0 && eps < 1, "eps must be in [0, 1)");
+  at::Tensor idx = torch::zeros({input.size(0), m}, input.options().dtype(at::kInt));
+  furthest_sampling_grid_cpu(m, seedIdx, eps, input, idx);
+  return idx;
+}
+
+// packed clouds: input (P, 3), cloud i owns the rows offsets[i]:offsets[i+1] and receives
+// sample_offsets[i+1]-sample_offsets[i] samples, returns global indices (sample_offsets[-1])
+at::Tensor furthest_sampling_packed(const int seedIdx, const at::Tensor& input,
+  const at::Tensor& offsets, const at::Tensor& sample_offsets)
+{
+  CHECK_CONTIGUOUS(input);
+  CHECK_IS_FLOAT(input);
+  TORCH_CHECK(!input.is_cuda(), "packed furthest sampling runs on cpu, sample cuda clouds one by one");
+  const auto off = offsets.to(at::kLong).contiguous();
+  const auto sample_off = sample_offsets.to(at::kLong).contiguous();
+  TORCH_CHECK(off.size(0) == sample_off.size(0), "offsets and sample_offsets must have the same size");
+  TORCH_CHECK(seedIdx >= 0, "seedIdx must be non-negative");
+  TORCH_CHECK(((sample_off.slice(0, 1) == sample_off.slice(0, 0, -1)) | (off.slice(0, 1) - off.slice(0, 0, -1) > seedIdx)).all().item<bool>(),
+      "seedIdx out of range of a sampled cloud");
+  at::Tensor idx = torch::zeros({sample_off[-1].item<int64_t>()}, input.options().dtype(at::kInt));
+  furthest_sampling_packed_cpu(seedIdx, input, off, sample_off, idx);
   return idx;
 }
 
+#ifdef WITH_CUDA
 void ball_query_kernel_launcher_fast(int b, int n, int m, float radius, int nsample,
-	const float *xyz, const float *new_xyz, int *idx, at::cuda::CUDAStream stream);
+	const at::Tensor& new_xyz, const at::Tensor& xyz, at::Tensor& idx, at::cuda::CUDAStream stream);
+#endif
+
+// packed clouds: the centers new_xyz[new_offsets[i]:new_offsets[i+1]] query xyz[offsets[i]:offsets[i+1]],
+// returns global indices (Q, nsample)
+at::Tensor ball_query_packed(const at::Tensor& new_xyz, const at::Tensor& new_offsets,
+      const at::Tensor& xyz, const at::Tensor& offsets, const float radius, const int nsample) {
+    CHECK_CONTIGUOUS(new_xyz);
+    CHECK_CONTIGUOUS(xyz);
+    CHECK_IS_FLOATING(xyz);
+    CHECK_SAME_TYPE(new_xyz, xyz);
+    TORCH_CHECK(!xyz.is_cuda(), "packed ball query runs on cpu, query cuda clouds one by one");
+    const auto new_off = new_offsets.to(at::kLong).contiguous();
+    const auto off = offsets.to(at::kLong).contiguous();
+    TORCH_CHECK(new_off.size(0) == off.size(0), "new_offsets and offsets must have the same size");
+    TORCH_CHECK(((off.slice(0, 1) > off.slice(0, 0, -1)) | (new_off.slice(0, 1) == new_off.slice(0, 0, -1))).all().item<bool>(),
+        "every cloud with centers must have at least one point");
+    at::Tensor idx = torch::zeros({new_xyz.size(0), nsample}, xyz.options().dtype(at::kInt));
+    ball_query_packed_cpu(new_xyz, new_off, xyz, off, radius, nsample, idx);
+    return idx;
+}
 
 at::Tensor ball_query_wrapper_fast(at::Tensor& new_xyz_tensor, at::Tensor& xyz_tensor,
       const float radius, const int nsample) {
-    CHECK_INPUT(new_xyz_tensor);
-    CHECK_INPUT(xyz_tensor);
-    CHECK_CUDA(new_xyz_tensor);
-    CHECK_CUDA(xyz_tensor);
-    const float *new_xyz = new_xyz_tensor.data_ptr<float>();
-    const float *xyz = xyz_tensor.data_ptr<float>();
+    CHECK_CONTIGUOUS(new_xyz_tensor);
+    CHECK_CONTIGUOUS(xyz_tensor);
+    CHECK_IS_FLOATING(xyz_tensor);
+    CHECK_SAME_TYPE(new_xyz_tensor, xyz_tensor);
+    if (new_xyz_tensor.is_cuda()) {
+      CHECK_CUDA(xyz_tensor);
+    }
     at::Tensor idx_tensor = torch::zeros({new_xyz_tensor.size(0), new_xyz_tensor.size(1), nsample},
                                   at::device(new_xyz_tensor.device()).dtype(at::ScalarType::Int));
-    int *idx = idx_tensor.data_ptr<int>();
 
     const int b = new_xyz_tensor.size(0);
     const int m = new_xyz_tensor.size(1);
     const int n = xyz_tensor.size(1);
 
-    at::cuda::CUDAStream stream = at::cuda::getCurrentCUDAStream();
-    ball_query_kernel_launcher_fast(b, n, m, radius, nsample, new_xyz, xyz, idx, stream);
+    if (new_xyz_tensor.is_cuda()) {
+#ifdef WITH_CUDA
+      at::cuda::CUDAStream stream = at::cuda::getCurrentCUDAStream();
+      ball_query_kernel_launcher_fast(b, n, m, radius, nsample, new_xyz_tensor, xyz_tensor, idx_tensor, stream);
+#else
+      NO_CUDA_ERROR(new_xyz_tensor);
+#endif
+    } else {
+      ball_query_cpu(b, n, m, radius, nsample, new_xyz_tensor, xyz_tensor, idx_tensor);
+    }
     return idx_tensor;
 }
+#ifdef WITH_CUDA
 void group_points_kernel_wrapper(int b, int c, int n, int npoints, int nsample,
-                                 const float *points, const int *idx,
-                                 float *out);
+                                 const at::Tensor& points, const at::Tensor& idx,
+                                 at::Tensor& out);
 
 void group_points_grad_kernel_wrapper(int b, int c, int n, int npoints,
-                                      int nsample, const float *grad_out,
-                                      const int *idx, float *grad_points);
+                                      int nsample, const at::Tensor& grad_out,
+                                      const at::Tensor& idx, at::Tensor& grad_points);
+
+void group_and_center_kernel_wrapper(int b, int c, int n, int npoints, int nsample, int cx,
+                                     const at::Tensor& new_xyz, const at::Tensor& xyz, const at::Tensor& features,
+                                     const at::Tensor& idx, at::Tensor& out);
+
+void group_and_center_grad_kernel_wrapper(int b, int c, int n, int npoints, int nsample, int cx,
+                                          const at::Tensor& grad_out, const at::Tensor& idx,
+                                          at::Tensor& grad_xyz, at::Tensor& grad_new_xyz, at::Tensor& grad_features);
+#endif
 
 at::Tensor group_points(at::Tensor points, at::Tensor idx) {
   CHECK_CONTIGUOUS(points);
   CHECK_CONTIGUOUS(idx);
-  CHECK_IS_FLOAT(points);
+  CHECK_IS_FLOATING(points);
   CHECK_IS_INT(idx);
 
   if (points.is_cuda()) {
@@ -122,14 +298,18 @@ at::Tensor group_points(at::Tensor points, at::Tensor idx) {
 
   at::Tensor output =
       torch::zeros({points.size(0), points.size(1), idx.size(1), idx.size(2)},
-                   at::device(points.device()).dtype(at::ScalarType::Float));
+                   points.options());
 
   if (points.is_cuda()) {
+#ifdef WITH_CUDA
     group_points_kernel_wrapper(points.size(0), points.size(1), points.size(2),
-                                idx.size(1), idx.size(2), points.data_ptr<float>(),
-                                idx.data_ptr<int>(), output.data_ptr<float>());
+                                idx.size(1), idx.size(2), points, idx, output);
+#else
+    NO_CUDA_ERROR(points);
+#endif
   } else {
-    TORCH_CHECK(false, "CPU not supported");
+    group_points_cpu(points.size(0), points.size(1), points.size(2),
+                     idx.size(1), idx.size(2), points, idx, output);
   }
 
   return output;
@@ -138,7 +318,7 @@ at::Tensor group_points(at::Tensor points, at::Tensor idx) {
 at::Tensor group_points_grad(at::Tensor grad_out, at::Tensor idx, const int n) {
   CHECK_CONTIGUOUS(grad_out);
   CHECK_CONTIGUOUS(idx);
-  CHECK_IS_FLOAT(grad_out);
+  CHECK_IS_FLOATING(grad_out);
   CHECK_IS_INT(idx);
 
   if (grad_out.is_cuda()) {
@@ -146,29 +326,116 @@ at::Tensor group_points_grad(at::Tensor grad_out, at::Tensor idx, const int n) {
   }
 
   at::Tensor output =
-      torch::zeros({grad_out.size(0), grad_out.size(1), n},
-                   at::device(grad_out.device()).dtype(at::ScalarType::Float));
+      torch::zeros({grad_out.size(0), grad_out.size(1), n}, grad_out.options());
 
   if (grad_out.is_cuda()) {
+#ifdef WITH_CUDA
     group_points_grad_kernel_wrapper(
         grad_out.size(0), grad_out.size(1), n, idx.size(1), idx.size(2),
-        grad_out.data_ptr<float>(), idx.data_ptr<int>(), output.data_ptr<float>());
+        grad_out, idx, output);
+#else
+    NO_CUDA_ERROR(grad_out);
+#endif
   } else {
-    TORCH_CHECK(false, "CPU not supported");
+    group_points_grad_cpu(
+        grad_out.size(0), grad_out.size(1), n, idx.size(1), idx.size(2),
+        grad_out, idx, output);
   }
 
   return output;
 }
 
+// ball query, grouping and recentering of QueryAndGroup without intermediate tensors,
+// features (b, c, n) may have c = 0. Returns out (b, 3 * use_xyz + c, m, nsample) with the
+// neighbor coordinates relative to their center first, and the ball query idx (b, m, nsample)
+std::vector<at::Tensor> query_and_group(at::Tensor new_xyz, at::Tensor xyz, at::Tensor features,
+    const float radius, const int nsample, const bool use_xyz) {
+  CHECK_CONTIGUOUS(new_xyz);
+  CHECK_CONTIGUOUS(xyz);
+  CHECK_CONTIGUOUS(features);
+  CHECK_IS_FLOATING(xyz);
+  CHECK_SAME_TYPE(new_xyz, xyz);
+  CHECK_SAME_TYPE(features, xyz);
+  if (new_xyz.is_cuda()) {
+    CHECK_CUDA(xyz);
+    CHECK_CUDA(features);
+  }
+  const int b = new_xyz.size(0);
+  const int m = new_xyz.size(1);
+  const int n = xyz.size(1);
+  const int c = features.size(1);
+  const int cx = use_xyz ? 3 : 0;
+  TORCH_CHECK(features.size(0) == b && features.size(2) == n, "features must be (b, c, n)");
+
+  at::Tensor idx = ball_query_wrapper_fast(new_xyz, xyz, radius, nsample);
+  at::Tensor out = torch::empty({b, cx + c, m, nsample}, new_xyz.options());
+  if (new_xyz.is_cuda()) {
+#ifdef WITH_CUDA
+    group_and_center_kernel_wrapper(b, c, n, m, nsample, cx, new_xyz, xyz, features, idx, out);
+#else
+    NO_CUDA_ERROR(new_xyz);
+#endif
+  } else {
+    group_and_center_cpu(b, c, n, m, nsample, cx, new_xyz, xyz, features, idx, out);
+  }
+  return {out, idx};
+}
+
+// gradients of query_and_group: grad_xyz (b, n, 3), grad_new_xyz (b, m, 3), grad_features (b, c, n)
+std::vector<at::Tensor> query_and_group_grad(at::Tensor grad_out, at::Tensor idx, const int n, const bool use_xyz) {
+  CHECK_CONTIGUOUS(grad_out);
+  CHECK_CONTIGUOUS(idx);
+  CHECK_IS_FLOATING(grad_out);
+  CHECK_IS_INT(idx);
+  if (grad_out.is_cuda()) {
+    CHECK_CUDA(idx);
+  }
+  const int b = grad_out.size(0);
+  const int m = idx.size(1);
+  const int nsample = idx.size(2);
+  const int cx = use_xyz ? 3 : 0;
+  const int c = grad_out.size(1) - cx;
+
+  at::Tensor grad_xyz = torch::zeros({b, n, 3}, grad_out.options());
+  at::Tensor grad_new_xyz = torch::zeros({b, m, 3}, grad_out.options());
+  at::Tensor grad_features = torch::zeros({b, c, n}, grad_out.options());
+  if (grad_out.is_cuda()) {
+#ifdef WITH_CUDA
+    group_and_center_grad_kernel_wrapper(b, c, n, m, nsample, cx, grad_out, idx, grad_xyz, grad_new_xyz, grad_features);
+#else
+    NO_CUDA_ERROR(grad_out);
+#endif
+  } else {
+    group_and_center_grad_cpu(b, c, n, m, nsample, cx, grad_out, idx, grad_xyz, grad_new_xyz, grad_features);
+  }
+  return {grad_xyz, grad_new_xyz, grad_features};
+}
+
 void three_nn_wrapper_fast(int b, int n, int m, at::Tensor unknown_tensor,
     at::Tensor known_tensor, at::Tensor dist2_tensor, at::Tensor idx_tensor) {
+    CHECK_CONTIGUOUS(unknown_tensor);
+    CHECK_CONTIGUOUS(known_tensor);
+    CHECK_CONTIGUOUS(dist2_tensor);
+    CHECK_CONTIGUOUS(idx_tensor);
+    CHECK_IS_FLOAT(unknown_tensor);
+    CHECK_IS_FLOAT(known_tensor);
+    CHECK_IS_FLOAT(dist2_tensor);
+    CHECK_IS_INT(idx_tensor);
     const float *unknown = unknown_tensor.data_ptr<float>();
     const float *known = known_tensor.data_ptr<float>();
     float *dist2 = dist2_tensor.data_ptr<float>();
     int *idx = idx_tensor.data_ptr<int>();
 
-    at::cuda::CUDAStream stream = at::cuda::getCurrentCUDAStream();
-    three_nn_kernel_launcher_fast(b, n, m, unknown, known, dist2, idx, stream);
+    if (unknown_tensor.is_cuda()) {
+#ifdef WITH_CUDA
+        at::cuda::CUDAStream stream = at::cuda::getCurrentCUDAStream();
+        three_nn_kernel_launcher_fast(b, n, m, unknown, known, dist2, idx, stream);
+#else
+        NO_CUDA_ERROR(unknown_tensor);
+#endif
+    } else {
+        three_nn_cpu(b, n, m, unknown, known, dist2, idx);
+    }
 }
 
 
@@ -178,13 +445,21 @@ void three_interpolate_wrapper_fast(int b, int c, int m, int n,
                          at::Tensor weight_tensor,
                          at::Tensor out_tensor) {
 
-    const float *points = points_tensor.data_ptr<float>();
-    const float *weight = weight_tensor.data_ptr<float>();
-    float *out = out_tensor.data_ptr<float>();
-    const int *idx = idx_tensor.data_ptr<int>();
-
-    at::cuda::CUDAStream stream = at::cuda::getCurrentCUDAStream();
-    three_interpolate_kernel_launcher_fast(b, c, m, n, points, idx, weight, out, stream);
+    CHECK_IS_FLOATING(points_tensor);
+    CHECK_SAME_TYPE(weight_tensor, points_tensor);
+    CHECK_SAME_TYPE(out_tensor, points_tensor);
+    CHECK_IS_INT(idx_tensor);
+
+    if (points_tensor.is_cuda()) {
+#ifdef WITH_CUDA
+        at::cuda::CUDAStream stream = at::cuda::getCurrentCUDAStream();
+        three_interpolate_kernel_launcher_fast(b, c, m, n, points_tensor, idx_tensor, weight_tensor, out_tensor, stream);
+#else
+        NO_CUDA_ERROR(points_tensor);
+#endif
+    } else {
+        three_interpolate_cpu(b, c, m, n, points_tensor, idx_tensor, weight_tensor, out_tensor);
+    }
 }
 
 void three_interpolate_grad_wrapper_fast(int b, int c, int n, int m,
@@ -193,13 +468,21 @@ void three_interpolate_grad_wrapper_fast(int b, int c, int n, int m,
                             at::Tensor weight_tensor,
                             at::Tensor grad_points_tensor) {
 
-    const float *grad_out = grad_out_tensor.data_ptr<float>();
-    const float *weight = weight_tensor.data_ptr<float>();
-    float *grad_points = grad_points_tensor.data_ptr<float>();
-    const int *idx = idx_tensor.data_ptr<int>();
-
-    at::cuda::CUDAStream stream = at::cuda::getCurrentCUDAStream();
-    three_interpolate_grad_kernel_launcher_fast(b, c, n, m, grad_out, idx, weight, grad_points, stream);
+    CHECK_IS_FLOATING(grad_out_tensor);
+    CHECK_SAME_TYPE(weight_tensor, grad_out_tensor);
+    CHECK_SAME_TYPE(grad_points_tensor, grad_out_tensor);
+    CHECK_IS_INT(idx_tensor);
+
+    if (grad_out_tensor.is_cuda()) {
+#ifdef WITH_CUDA
+        at::cuda::CUDAStream stream = at::cuda::getCurrentCUDAStream();
+        three_interpolate_grad_kernel_launcher_fast(b, c, n, m, grad_out_tensor, idx_tensor, weight_tensor, grad_points_tensor, stream);
+#else
+        NO_CUDA_ERROR(grad_out_tensor);
+#endif
+    } else {
+        three_interpolate_grad_cpu(b, c, n, m, grad_out_tensor, idx_tensor, weight_tensor, grad_points_tensor);
+    }
 }
 
 PYBIND11_MODULE(TORCH_EXTENSION_NAME, m)
@@ -208,8 +491,14 @@ PYBIND11_MODULE(TORCH_EXTENSION_NAME, m)
   m.def("gather_forward", &gather_points_wrapper_fast, "gather npoints points along an axis");
   m.def("gather_backward", &gather_points_grad_wrapper_fast, "gather npoints points along an axis backward");
   m.def("ball_query", &ball_query_wrapper_fast, "ball query");
+  m.def("furthest_sampling_resume", &furthest_sampling_resume, "continue furthest point sampling from given samples");
+  m.def("furthest_sampling_grid", &furthest_sampling_grid, "grid-pruned (approximate) furthest point sampling (CPU)");
+  m.def("furthest_sampling_packed", &furthest_sampling_packed, "furthest point sampling of packed clouds (CPU)");
+  m.def("ball_query_packed", &ball_query_packed, "ball query of packed clouds (CPU)");
   m.def("group_points", &group_points);
   m.def("group_points_grad", &group_points_grad);
+  m.def("query_and_group", &query_and_group, "fused ball query, grouping and recentering");
+  m.def("query_and_group_grad", &query_and_group_grad, "backward of query_and_group");
   m.def("three_nn_wrapper", &three_nn_wrapper_fast, "three_nn_wrapper_fast");
   m.def("three_interpolate_wrapper", &three_interpolate_wrapper_fast, "three_interpolate_wrapper_fast");
   m.def("three_interpolate_grad_wrapper", &three_interpolate_grad_wrapper_fast, "three_interpolate_grad_wrapper_fast");
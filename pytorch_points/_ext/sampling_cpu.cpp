@@ -0,0 +1,705 @@
+#include <torch/extension.h>
+#include <ATen/OpMathType.h>
+#include <ATen/Parallel.h>
+#include <algorithm>
+#include <vector>
+#include "cpu_utils.h"
+
+// CPU engines of the sampling extension, batches are processed in parallel with at::parallel_for.
+// Gathering, grouping, interpolation and ball query run in half, bfloat16, float and double,
+// sums and distances of the reduced types are computed in float (at::opmath_type)
+
+#define DISPATCH_POINT_TYPES(TYPE, NAME, ...) \
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, TYPE, NAME, __VA_ARGS__)
+
+
+// input: points(b, c, n) idx(b, m)
+// output: out(b, c, m)
+template <typename scalar_t>
+void gather_points_cpu_kernel(int b, int c, int n, int m,
+    const scalar_t *points, const int *idx, scalar_t *out) {
+    at::parallel_for(0, b * c, 1, [&](int64_t start, int64_t end) {
+        for (int64_t i = start; i < end; ++i) {
+            const int bs_idx = i / c;
+            const scalar_t *points_row = points + i * n;
+            const int *idx_row = idx + bs_idx * m;
+            scalar_t *out_row = out + i * m;
+            for (int j = 0; j < m; ++j) {
+                out_row[j] = points_row[idx_row[j]];
+            }
+        }
+    });
+}
+
+void gather_points_cpu(int b, int c, int n, int npoints,
+    const at::Tensor& points, const at::Tensor& idx, at::Tensor& out) {
+    DISPATCH_POINT_TYPES(points.scalar_type(), "gather_points_cpu", [&] {
+        gather_points_cpu_kernel<scalar_t>(b, c, n, npoints,
+            points.data_ptr<scalar_t>(), idx.data_ptr<int>(), out.data_ptr<scalar_t>());
+    });
+}
+
+// input: grad_out(b, c, m) idx(b, m)
+// output: grad_points(b, c, n)
+template <typename scalar_t>
+void gather_points_grad_cpu_kernel(int b, int c, int n, int m,
+    const scalar_t *grad_out, const int *idx, scalar_t *grad_points) {
+    using acc_t = at::opmath_type<scalar_t>;
+    // every (batch, channel) row is owned by a single thread, no atomics needed
+    at::parallel_for(0, b * c, 1, [&](int64_t start, int64_t end) {
+        std::vector<acc_t> acc(n);
+        for (int64_t i = start; i < end; ++i) {
+            const int bs_idx = i / c;
+            const scalar_t *grad_out_row = grad_out + i * m;
+            const int *idx_row = idx + bs_idx * m;
+            scalar_t *grad_points_row = grad_points + i * n;
+            for (int l = 0; l < n; ++l) acc[l] = grad_points_row[l];
+            for (int j = 0; j < m; ++j) {
+                acc[idx_row[j]] += grad_out_row[j];
+            }
+            for (int l = 0; l < n; ++l) grad_points_row[l] = acc[l];
+        }
+    });
+}
+
+void gather_points_grad_cpu(int b, int c, int n, int npoints,
+    const at::Tensor& grad_out, const at::Tensor& idx, at::Tensor& grad_points) {
+    DISPATCH_POINT_TYPES(grad_out.scalar_type(), "gather_points_grad_cpu", [&] {
+        gather_points_grad_cpu_kernel<scalar_t>(b, c, n, npoints,
+            grad_out.data_ptr<scalar_t>(), idx.data_ptr<int>(), grad_points.data_ptr<scalar_t>());
+    });
+}
+
+
+// furthest point sampling of one cloud points(n, 3), xs, ys, zs are scratch buffers of size n.
+// out[0:start] is given, dists(n) holds the minimum distance to out[0:applied] and the sampling
+// continues from there (0 <= applied < start <= m), a fresh run is start = 1, applied = 0.
+// On return dists holds the minimum distance to out[0:m-1].
+template <typename scalar_t>
+static void furthest_point_sampling_single(int n, int m, int start, int applied, const scalar_t *points,
+    scalar_t *dists, int *out, std::vector<scalar_t>& xs, std::vector<scalar_t>& ys, std::vector<scalar_t>& zs) {
+    if (m <= 0 || n <= 0) return;
+    // structure of arrays copy of the cloud, so that the distance update is vectorized
+    xs.resize(n);
+    ys.resize(n);
+    zs.resize(n);
+    for (int k = 0; k < n; ++k) {
+        xs[k] = points[k * 3 + 0];
+        ys[k] = points[k * 3 + 1];
+        zs[k] = points[k * 3 + 2];
+    }
+    const scalar_t *x = xs.data();
+    const scalar_t *y = ys.data();
+    const scalar_t *z = zs.data();
+    int old = out[applied];
+    // iteratively add m points
+    for (int j = applied + 1; j < m; ++j) {
+        const scalar_t x1 = x[old];
+        const scalar_t y1 = y[old];
+        const scalar_t z1 = z[old];
+        // update the closest distance to the existing set
+        scalar_t best = -1;
+        #pragma omp simd reduction(max:best)
+        for (int k = 0; k < n; ++k) {
+            const scalar_t d = (x[k] - x1) * (x[k] - x1) + (y[k] - y1) * (y[k] - y1) + (z[k] - z1) * (z[k] - z1);
+            const scalar_t d2 = std::min(d, dists[k]);
+            dists[k] = d2;
+            best = std::max(best, d2);
+        }
+        if (j < start) {
+            // replaying the given prefix
+            old = out[j];
+            continue;
+        }
+        // first point attaining the maximum
+        int besti = 0;
+        while (besti < n - 1 && dists[besti] != best) ++besti;
+        old = besti;
+        out[j] = old;
+    }
+}
+
+// input: points(b, n, 3) temp(b, n)
+// output: idx(b, m)
+template <typename scalar_t>
+void furthest_point_sampling_cpu_kernel(int b, int n, int m, const int first_idx,
+    const scalar_t *input, scalar_t *temp, int *idx) {
+    if (m <= 0 || n <= 0) return;
+    at::parallel_for(0, b, 1, [&](int64_t start, int64_t end) {
+        std::vector<scalar_t> xs, ys, zs;
+        for (int64_t i = start; i < end; ++i) {
+            idx[i * m] = first_idx;
+            furthest_point_sampling_single(n, m, 1, 0, input + i * n * 3, temp + i * n, idx + i * m, xs, ys, zs);
+        }
+    });
+}
+
+// resume the sampling of idx(b, m) whose first `start` columns are filled, temp(b, n) holds the
+// minimum distance to the first `applied` of them
+// input: points(b, n, 3) temp(b, n) idx(b, m)
+// output: idx(b, m) temp(b, n)
+template <typename scalar_t>
+void furthest_point_sampling_resume_cpu_kernel(int b, int n, int m, int start, int applied,
+    const scalar_t *input, scalar_t *temp, int *idx) {
+    if (m <= 0 || n <= 0) return;
+    at::parallel_for(0, b, 1, [&](int64_t i0, int64_t i1) {
+        std::vector<scalar_t> xs, ys, zs;
+        for (int64_t i = i0; i < i1; ++i) {
+            furthest_point_sampling_single(n, m, start, applied, input + i * n * 3, temp + i * n, idx + i * m, xs, ys, zs);
+        }
+    });
+}
+
+// packed clouds, cloud i is points[offsets[i]:offsets[i+1]] and gets m_i = sample_offsets[i+1] - sample_offsets[i]
+// samples, the indices are global, i.e. relative to the packed points
+// input: points(P, 3) offsets(b + 1) sample_offsets(b + 1)
+// output: idx(sample_offsets[b])
+template <typename scalar_t>
+void furthest_point_sampling_packed_cpu_kernel(int b, const int64_t *offsets, const int64_t *sample_offsets,
+    const int first_idx, const scalar_t *input, int *idx) {
+    at::parallel_for(0, b, 1, [&](int64_t start, int64_t end) {
+        std::vector<scalar_t> xs, ys, zs, dists;
+        for (int64_t i = start; i < end; ++i) {
+            const int n = offsets[i + 1] - offsets[i];
+            const int m = sample_offsets[i + 1] - sample_offsets[i];
+            int *out = idx + sample_offsets[i];
+            dists.assign(n, scalar_t(1e10));
+            if (m > 0) out[0] = first_idx;
+            furthest_point_sampling_single(n, m, 1, 0, input + offsets[i] * 3, dists.data(), out, xs, ys, zs);
+            for (int j = 0; j < m; ++j) out[j] += offsets[i];
+        }
+    });
+}
+
+// grid-pruned furthest point sampling of one cloud points(n, 3).
+// Every cell keeps the largest min-distance of its points, a new sample only updates the cells
+// whose bounding box is closer than that value, and shells further away than the global
+// maximum are never visited. With eps = 0 the result equals the exhaustive scan, with eps > 0 cells
+// are already skipped if they are closer than (1 - eps) times their largest min-distance, so every
+// sample is at least (1 - eps) times as far from the previous samples as the furthest point.
+template <typename scalar_t>
+static void furthest_point_sampling_grid_single(int n, int m, const int first_idx, const scalar_t *points,
+    double eps, int *out) {
+    if (m <= 0 || n <= 0) return;
+    DenseGrid grid;
+    grid.build(points, n, 16.0);
+    const int64_t n_cells = grid.cell_start.size() - 1;
+    // points in cell order (ascending index within a cell) as structure of arrays
+    std::vector<scalar_t> xs(n), ys(n), zs(n), dists(n, scalar_t(1e10));
+    std::vector<double> lo(n_cells * 3), hi(n_cells * 3);
+    MaxTree<scalar_t> tree;
+    tree.init(n_cells, scalar_t(-1));
+    for (int64_t c = 0; c < n_cells; ++c) {
+        for (int s = grid.cell_start[c]; s < grid.cell_start[c + 1]; ++s) {
+            const scalar_t *p = points + grid.points[s] * 3;
+            xs[s] = p[0];
+            ys[s] = p[1];
+            zs[s] = p[2];
+            for (int d = 0; d < 3; ++d) {
+                lo[c * 3 + d] = s == grid.cell_start[c] ? p[d] : std::min<double>(lo[c * 3 + d], p[d]);
+                hi[c * 3 + d] = s == grid.cell_start[c] ? p[d] : std::max<double>(hi[c * 3 + d], p[d]);
+            }
+        }
+        if (grid.cell_start[c + 1] > grid.cell_start[c]) tree.assign(c, scalar_t(1e10), grid.points[grid.cell_start[c]]);
+    }
+    tree.build();
+
+    // margin against rounding, it only ever prunes less, so that a skipped cell can't lower its
+    // distances and eps = 0 stays identical to the exhaustive scan
+    const double scale = (1 - eps) * (1 - eps) * (1 + 1e-5);
+    int old = first_idx;
+    out[0] = old;
+    for (int j = 1; j < m; ++j) {
+        const scalar_t x1 = points[old * 3 + 0];
+        const scalar_t y1 = points[old * 3 + 1];
+        const scalar_t z1 = points[old * 3 + 2];
+        auto update_cell = [&](int64_t c) {
+            const int start = grid.cell_start[c], end = grid.cell_start[c + 1];
+            if (start == end) return;
+            double lb = 0;
+            const double p[3] = {x1, y1, z1};
+            for (int d = 0; d < 3; ++d) {
+                const double gap = std::max(lo[c * 3 + d] - p[d], p[d] - hi[c * 3 + d]);
+                if (gap > 0) lb += gap * gap;
+            }
+            if (lb > scale * tree.val[tree.size + c]) return;
+            scalar_t best = -1;
+            int best_s = start;
+            for (int s = start; s < end; ++s) {
+                const scalar_t d = (xs[s] - x1) * (xs[s] - x1) + (ys[s] - y1) * (ys[s] - y1) + (zs[s] - z1) * (zs[s] - z1);
+                const scalar_t d2 = std::min(d, dists[s]);
+                dists[s] = d2;
+                if (d2 > best) {
+                    best = d2;
+                    best_s = s;
+                }
+            }
+            tree.set(c, best, grid.points[best_s]);
+        };
+        int64_t cell[3];
+        grid.cell_of(x1, y1, z1, cell);
+        for (int64_t r = 0; r <= grid.max_radius(); ++r) {
+            // cells on shell r are at least (r - 1) cells away
+            const double bound = std::max<int64_t>(r - 1, 0) * grid.cell;
+            if (bound * bound > scale * tree.top()) break;
+            if (!grid.visit_shell_cells(cell, r, update_cell)) break;
+        }
+        old = tree.top_arg();
+        out[j] = old;
+    }
+}
+
+// input: points(b, n, 3)
+// output: idx(b, m)
+template <typename scalar_t>
+void furthest_point_sampling_grid_cpu_kernel(int b, int n, int m, const int first_idx, double eps,
+    const scalar_t *input, int *idx) {
+    at::parallel_for(0, b, 1, [&](int64_t start, int64_t end) {
+        for (int64_t i = start; i < end; ++i) {
+            furthest_point_sampling_grid_single(n, m, first_idx, input + i * n * 3, eps, idx + i * m);
+        }
+    });
+}
+
+void furthest_sampling_cpu_forward(const int m, const int first_idx,
+    at::Tensor& input, at::Tensor& temp, at::Tensor& idx) {
+    const int b = input.size(0);
+    const int n = input.size(1);
+    furthest_point_sampling_cpu_kernel<float>(b, n, m, first_idx,
+        input.data_ptr<float>(), temp.data_ptr<float>(), idx.data_ptr<int32_t>());
+}
+
+void furthest_sampling_resume_cpu(const int m, const int start, const int applied,
+    const at::Tensor& input, at::Tensor& temp, at::Tensor& idx) {
+    const int b = input.size(0);
+    const int n = input.size(1);
+    furthest_point_sampling_resume_cpu_kernel<float>(b, n, m, start, applied,
+        input.data_ptr<float>(), temp.data_ptr<float>(), idx.data_ptr<int32_t>());
+}
+
+void furthest_sampling_grid_cpu(const int m, const int first_idx, const double eps,
+    const at::Tensor& input, at::Tensor& idx) {
+    const int b = input.size(0);
+    const int n = input.size(1);
+    furthest_point_sampling_grid_cpu_kernel<float>(b, n, m, first_idx, eps,
+        input.data_ptr<float>(), idx.data_ptr<int32_t>());
+}
+
+void furthest_sampling_packed_cpu(const int first_idx, const at::Tensor& input, const at::Tensor& offsets,
+    const at::Tensor& sample_offsets, at::Tensor& idx) {
+    const int b = offsets.size(0) - 1;
+    furthest_point_sampling_packed_cpu_kernel<float>(b, offsets.data_ptr<int64_t>(), sample_offsets.data_ptr<int64_t>(),
+        first_idx, input.data_ptr<float>(), idx.data_ptr<int32_t>());
+}
+
+
+// ball query of one center in the hash grid of points, writes the nsample smallest indices
+// inside the ball padded with the first one (plus index_offset), out is untouched without hits
+template <typename scalar_t, typename acc_t = at::opmath_type<scalar_t>>
+static void ball_query_single(const HashGrid& grid, const scalar_t *points, const scalar_t *center,
+    acc_t radius2, int nsample, int index_offset, std::vector<int>& hits, int *out) {
+    const acc_t new_x = center[0];
+    const acc_t new_y = center[1];
+    const acc_t new_z = center[2];
+    int buckets[27];
+    hits.clear();
+    const int n_buckets = grid.neighbor_buckets(new_x, new_y, new_z, buckets);
+    for (int u = 0; u < n_buckets; ++u) {
+        for (int s = grid.bucket_start[buckets[u]]; s < grid.bucket_start[buckets[u] + 1]; ++s) {
+            const int k = grid.points[s];
+            const acc_t x = points[k * 3 + 0];
+            const acc_t y = points[k * 3 + 1];
+            const acc_t z = points[k * 3 + 2];
+            const acc_t d2 = (new_x - x) * (new_x - x) + (new_y - y) * (new_y - y) + (new_z - z) * (new_z - z);
+            if (d2 < radius2) hits.push_back(k);
+        }
+    }
+    if (hits.empty()) return;
+    // keep the nsample smallest indices, i.e. the same points as the brute-force scan
+    const int cnt = std::min(static_cast<int>(hits.size()), nsample);
+    std::partial_sort(hits.begin(), hits.begin() + cnt, hits.end());
+    for (int l = 0; l < nsample; ++l) {
+        out[l] = (l < cnt ? hits[l] : hits[0]) + index_offset;
+    }
+}
+
+// input: new_xyz(b, m, 3) xyz(b, n, 3)
+// output: idx(b, m, nsample)
+template <typename scalar_t>
+void ball_query_cpu_kernel(int b, int n, int m, float radius, int nsample,
+    const scalar_t *new_xyz, const scalar_t *xyz, int *idx) {
+    // without a positive radius nothing is found, idx stays zero as in the cuda kernel
+    if (!(radius > 0) || nsample <= 0 || n <= 0) return;
+    // cell size equals radius, hence every hit lies in one of the 27 cells around the center
+    std::vector<HashGrid> grids(b);
+    at::parallel_for(0, b, 1, [&](int64_t start, int64_t end) {
+        for (int64_t i = start; i < end; ++i) {
+            grids[i].build(xyz + i * n * 3, n, radius);
+        }
+    });
+
+    const at::opmath_type<scalar_t> radius2 = radius * radius;
+    at::parallel_for(0, static_cast<int64_t>(b) * m, 64, [&](int64_t start, int64_t end) {
+        std::vector<int> hits;
+        for (int64_t q = start; q < end; ++q) {
+            const int64_t bs_idx = q / m;
+            ball_query_single(grids[bs_idx], xyz + bs_idx * n * 3, new_xyz + q * 3, radius2, nsample, 0,
+                              hits, idx + q * nsample);
+        }
+    });
+}
+
+// packed clouds, the centers new_xyz[new_offsets[i]:new_offsets[i+1]] query xyz[offsets[i]:offsets[i+1]],
+// the indices are global, i.e. relative to the packed points
+// input: new_xyz(Q, 3) xyz(P, 3) new_offsets(b + 1) offsets(b + 1)
+// output: idx(Q, nsample)
+template <typename scalar_t>
+void ball_query_packed_cpu_kernel(int b, const int64_t *new_offsets, const int64_t *offsets, float radius, int nsample,
+    const scalar_t *new_xyz, const scalar_t *xyz, int *idx) {
+    if (nsample <= 0) return;
+    // centers without hits keep the first point of their own cloud, i.e. local 0 as in ball_query
+    at::parallel_for(0, b, 1, [&](int64_t start, int64_t end) {
+        for (int64_t i = start; i < end; ++i) {
+            std::fill(idx + new_offsets[i] * nsample, idx + new_offsets[i + 1] * nsample, static_cast<int>(offsets[i]));
+        }
+    });
+    if (!(radius > 0)) return;
+    std::vector<HashGrid> grids(b);
+    at::parallel_for(0, b, 1, [&](int64_t start, int64_t end) {
+        for (int64_t i = start; i < end; ++i) {
+            grids[i].build(xyz + offsets[i] * 3, offsets[i + 1] - offsets[i], radius);
+        }
+    });
+
+    const at::opmath_type<scalar_t> radius2 = radius * radius;
+    at::parallel_for(0, new_offsets[b], 64, [&](int64_t start, int64_t end) {
+        std::vector<int> hits;
+        // cloud of the first center in the range
+        int64_t i = std::upper_bound(new_offsets, new_offsets + b + 1, start) - new_offsets - 1;
+        for (int64_t q = start; q < end; ++q) {
+            while (q >= new_offsets[i + 1]) ++i;
+            ball_query_single(grids[i], xyz + offsets[i] * 3, new_xyz + q * 3, radius2, nsample,
+                              static_cast<int>(offsets[i]), hits, idx + q * nsample);
+        }
+    });
+}
+
+void ball_query_cpu(int b, int n, int m, float radius, int nsample,
+    const at::Tensor& new_xyz, const at::Tensor& xyz, at::Tensor& idx) {
+    DISPATCH_POINT_TYPES(xyz.scalar_type(), "ball_query_cpu", [&] {
+        ball_query_cpu_kernel<scalar_t>(b, n, m, radius, nsample,
+            new_xyz.data_ptr<scalar_t>(), xyz.data_ptr<scalar_t>(), idx.data_ptr<int>());
+    });
+}
+
+void ball_query_packed_cpu(const at::Tensor& new_xyz, const at::Tensor& new_offsets, const at::Tensor& xyz,
+    const at::Tensor& offsets, float radius, int nsample, at::Tensor& idx) {
+    const int b = offsets.size(0) - 1;
+    DISPATCH_POINT_TYPES(xyz.scalar_type(), "ball_query_packed_cpu", [&] {
+        ball_query_packed_cpu_kernel<scalar_t>(b, new_offsets.data_ptr<int64_t>(), offsets.data_ptr<int64_t>(), radius, nsample,
+            new_xyz.data_ptr<scalar_t>(), xyz.data_ptr<scalar_t>(), idx.data_ptr<int32_t>());
+    });
+}
+
+
+// input: points(b, c, n) idx(b, npoints, nsample)
+// output: out(b, c, npoints, nsample)
+template <typename scalar_t>
+void group_points_cpu_kernel(int b, int c, int n, int npoints, int nsample,
+    const scalar_t *points, const int *idx, scalar_t *out) {
+    const int64_t k = static_cast<int64_t>(npoints) * nsample;
+    at::parallel_for(0, b * c, 1, [&](int64_t start, int64_t end) {
+        for (int64_t i = start; i < end; ++i) {
+            const int64_t bs_idx = i / c;
+            const scalar_t *points_row = points + i * n;
+            const int *idx_row = idx + bs_idx * k;
+            scalar_t *out_row = out + i * k;
+            for (int64_t j = 0; j < k; ++j) {
+                out_row[j] = points_row[idx_row[j]];
+            }
+        }
+    });
+}
+
+void group_points_cpu(int b, int c, int n, int npoints, int nsample,
+    const at::Tensor& points, const at::Tensor& idx, at::Tensor& out) {
+    DISPATCH_POINT_TYPES(points.scalar_type(), "group_points_cpu", [&] {
+        group_points_cpu_kernel<scalar_t>(b, c, n, npoints, nsample,
+            points.data_ptr<scalar_t>(), idx.data_ptr<int>(), out.data_ptr<scalar_t>());
+    });
+}
+
+// inverse of a grouping index (k, ) -> (n, ): for every point the ascending list of
+// the positions in idx which refer to it (CSR layout)
+static void invert_group_index(int n, int64_t k, const int *idx,
+    std::vector<int64_t>& point_start, std::vector<int64_t>& positions) {
+    point_start.assign(n + 1, 0);
+    for (int64_t j = 0; j < k; ++j) ++point_start[idx[j] + 1];
+    for (int i = 0; i < n; ++i) point_start[i + 1] += point_start[i];
+    std::vector<int64_t> fill(point_start.begin(), point_start.end() - 1);
+    positions.resize(k);
+    for (int64_t j = 0; j < k; ++j) positions[fill[idx[j]]++] = j;
+}
+
+// input: grad_out(b, c, npoints, nsample), idx(b, npoints, nsample)
+// output: grad_points(b, c, n)
+template <typename scalar_t>
+void group_points_grad_cpu_kernel(int b, int c, int n, int npoints, int nsample,
+    const scalar_t *grad_out, const int *idx, scalar_t *grad_points) {
+    using acc_t = at::opmath_type<scalar_t>;
+    const int64_t k = static_cast<int64_t>(npoints) * nsample;
+    // segmented reduction instead of atomics: every output is summed by one thread
+    // in a fixed order, hence the result is deterministic
+    std::vector<std::vector<int64_t>> point_start(b), positions(b);
+    at::parallel_for(0, b, 1, [&](int64_t start, int64_t end) {
+        for (int64_t i = start; i < end; ++i) {
+            invert_group_index(n, k, idx + i * k, point_start[i], positions[i]);
+        }
+    });
+    at::parallel_for(0, b * c, 1, [&](int64_t start, int64_t end) {
+        for (int64_t i = start; i < end; ++i) {
+            const int64_t bs_idx = i / c;
+            const int64_t *segment = point_start[bs_idx].data();
+            const int64_t *position = positions[bs_idx].data();
+            const scalar_t *grad_out_row = grad_out + i * k;
+            scalar_t *grad_points_row = grad_points + i * n;
+            for (int l = 0; l < n; ++l) {
+                acc_t acc = 0;
+                for (int64_t s = segment[l]; s < segment[l + 1]; ++s) {
+                    acc += grad_out_row[position[s]];
+                }
+                grad_points_row[l] = acc;
+            }
+        }
+    });
+}
+
+void group_points_grad_cpu(int b, int c, int n, int npoints, int nsample,
+    const at::Tensor& grad_out, const at::Tensor& idx, at::Tensor& grad_points) {
+    DISPATCH_POINT_TYPES(grad_out.scalar_type(), "group_points_grad_cpu", [&] {
+        group_points_grad_cpu_kernel<scalar_t>(b, c, n, npoints, nsample,
+            grad_out.data_ptr<scalar_t>(), idx.data_ptr<int>(), grad_points.data_ptr<scalar_t>());
+    });
+}
+
+// grouping of QueryAndGroup in one pass, the first cx (3 or 0) channels are the recentered
+// neighbor coordinates, followed by the c grouped features
+// input: new_xyz(b, m, 3) xyz(b, n, 3) features(b, c, n) idx(b, m, nsample)
+// output: out(b, cx + c, m, nsample)
+template <typename scalar_t>
+void group_and_center_cpu_kernel(int b, int c, int n, int m, int nsample, int cx,
+    const scalar_t *new_xyz, const scalar_t *xyz, const scalar_t *features, const int *idx, scalar_t *out) {
+    const int ct = cx + c;
+    const int64_t k = static_cast<int64_t>(m) * nsample;
+    at::parallel_for(0, static_cast<int64_t>(b) * ct, 1, [&](int64_t start, int64_t end) {
+        for (int64_t i = start; i < end; ++i) {
+            const int64_t bs_idx = i / ct;
+            const int ch = i % ct;
+            const int *idx_row = idx + bs_idx * k;
+            scalar_t *out_row = out + i * k;
+            if (ch < cx) {
+                const scalar_t *points = xyz + bs_idx * n * 3 + ch;
+                const scalar_t *centers = new_xyz + bs_idx * m * 3 + ch;
+                for (int j = 0; j < m; ++j) {
+                    const at::opmath_type<scalar_t> center = centers[j * 3];
+                    for (int s = 0; s < nsample; ++s) {
+                        out_row[j * nsample + s] = points[idx_row[j * nsample + s] * 3] - center;
+                    }
+                }
+            } else {
+                const scalar_t *points_row = features + (bs_idx * c + ch - cx) * n;
+                for (int64_t j = 0; j < k; ++j) {
+                    out_row[j] = points_row[idx_row[j]];
+                }
+            }
+        }
+    });
+}
+
+// input: grad_out(b, cx + c, m, nsample) idx(b, m, nsample)
+// output: grad_xyz(b, n, 3) grad_new_xyz(b, m, 3) grad_features(b, c, n)
+template <typename scalar_t>
+void group_and_center_grad_cpu_kernel(int b, int c, int n, int m, int nsample, int cx,
+    const scalar_t *grad_out, const int *idx, scalar_t *grad_xyz, scalar_t *grad_new_xyz, scalar_t *grad_features) {
+    using acc_t = at::opmath_type<scalar_t>;
+    const int ct = cx + c;
+    const int64_t k = static_cast<int64_t>(m) * nsample;
+    // deterministic segmented reduction as in group_points_grad_cpu_kernel
+    std::vector<std::vector<int64_t>> point_start(b), positions(b);
+    at::parallel_for(0, b, 1, [&](int64_t start, int64_t end) {
+        for (int64_t i = start; i < end; ++i) {
+            invert_group_index(n, k, idx + i * k, point_start[i], positions[i]);
+        }
+    });
+    at::parallel_for(0, static_cast<int64_t>(b) * ct, 1, [&](int64_t start, int64_t end) {
+        for (int64_t i = start; i < end; ++i) {
+            const int64_t bs_idx = i / ct;
+            const int ch = i % ct;
+            const int64_t *segment = point_start[bs_idx].data();
+            const int64_t *position = positions[bs_idx].data();
+            const scalar_t *grad_out_row = grad_out + i * k;
+            // stride between consecutive points of the destination row
+            scalar_t *grad_row = ch < cx ? grad_xyz + bs_idx * n * 3 + ch : grad_features + (bs_idx * c + ch - cx) * n;
+            const int stride = ch < cx ? 3 : 1;
+            for (int l = 0; l < n; ++l) {
+                acc_t acc = 0;
+                for (int64_t s = segment[l]; s < segment[l + 1]; ++s) {
+                    acc += grad_out_row[position[s]];
+                }
+                grad_row[l * stride] = acc;
+            }
+            if (ch < cx) {
+                scalar_t *grad_centers = grad_new_xyz + bs_idx * m * 3 + ch;
+                for (int j = 0; j < m; ++j) {
+                    acc_t acc = 0;
+                    for (int s = 0; s < nsample; ++s) acc += grad_out_row[j * nsample + s];
+                    grad_centers[j * 3] = -acc;
+                }
+            }
+        }
+    });
+}
+
+void group_and_center_cpu(int b, int c, int n, int m, int nsample, int cx,
+    const at::Tensor& new_xyz, const at::Tensor& xyz, const at::Tensor& features, const at::Tensor& idx, at::Tensor& out) {
+    DISPATCH_POINT_TYPES(out.scalar_type(), "group_and_center_cpu", [&] {
+        group_and_center_cpu_kernel<scalar_t>(b, c, n, m, nsample, cx, new_xyz.data_ptr<scalar_t>(), xyz.data_ptr<scalar_t>(),
+            features.data_ptr<scalar_t>(), idx.data_ptr<int>(), out.data_ptr<scalar_t>());
+    });
+}
+
+void group_and_center_grad_cpu(int b, int c, int n, int m, int nsample, int cx,
+    const at::Tensor& grad_out, const at::Tensor& idx, at::Tensor& grad_xyz, at::Tensor& grad_new_xyz, at::Tensor& grad_features) {
+    DISPATCH_POINT_TYPES(grad_out.scalar_type(), "group_and_center_grad_cpu", [&] {
+        group_and_center_grad_cpu_kernel<scalar_t>(b, c, n, m, nsample, cx, grad_out.data_ptr<scalar_t>(), idx.data_ptr<int>(),
+            grad_xyz.data_ptr<scalar_t>(), grad_new_xyz.data_ptr<scalar_t>(), grad_features.data_ptr<scalar_t>());
+    });
+}
+
+
+// input: unknown(b, n, 3) known(b, m, 3)
+// output: dist2(b, n, 3) idx(b, n, 3)
+template <typename scalar_t>
+void three_nn_cpu_kernel(int b, int n, int m, const scalar_t *unknown,
+    const scalar_t *known, scalar_t *dist2, int *idx) {
+    std::vector<DenseGrid> grids(b);
+    at::parallel_for(0, b, 1, [&](int64_t start, int64_t end) {
+        for (int64_t i = start; i < end; ++i) {
+            grids[i].build(known + i * m * 3, m);
+        }
+    });
+
+    at::parallel_for(0, static_cast<int64_t>(b) * n, 64, [&](int64_t start, int64_t end) {
+        for (int64_t q = start; q < end; ++q) {
+            const int64_t bs_idx = q / n;
+            const DenseGrid& grid = grids[bs_idx];
+            const scalar_t *points = known + bs_idx * m * 3;
+            const scalar_t ux = unknown[q * 3 + 0];
+            const scalar_t uy = unknown[q * 3 + 1];
+            const scalar_t uz = unknown[q * 3 + 2];
+
+            double best1 = 1e40, best2 = 1e40, best3 = 1e40;
+            int besti1 = 0, besti2 = 0, besti3 = 0;
+            // ties are broken by the index, like the sequential scan of the cuda kernel
+            auto visit = [&](int k) {
+                const scalar_t x = points[k * 3 + 0];
+                const scalar_t y = points[k * 3 + 1];
+                const scalar_t z = points[k * 3 + 2];
+                const double d = (ux - x) * (ux - x) + (uy - y) * (uy - y) + (uz - z) * (uz - z);
+                if (d < best1 || (d == best1 && k < besti1)) {
+                    best3 = best2; besti3 = besti2;
+                    best2 = best1; besti2 = besti1;
+                    best1 = d; besti1 = k;
+                }
+                else if (d < best2 || (d == best2 && k < besti2)) {
+                    best3 = best2; besti3 = besti2;
+                    best2 = d; besti2 = k;
+                }
+                else if (d < best3 || (d == best3 && k < besti3)) {
+                    best3 = d; besti3 = k;
+                }
+            };
+            // grow shells of cells around the query until no unvisited point can be closer
+            int64_t c[3];
+            grid.cell_of(ux, uy, uz, c);
+            for (int64_t r = 0; r <= grid.max_radius(); ++r) {
+                if (!grid.visit_shell(c, r, visit)) break;
+                const double bound = r * grid.cell;
+                if (best3 < bound * bound) break;
+            }
+            dist2[q * 3 + 0] = best1; dist2[q * 3 + 1] = best2; dist2[q * 3 + 2] = best3;
+            idx[q * 3 + 0] = besti1; idx[q * 3 + 1] = besti2; idx[q * 3 + 2] = besti3;
+        }
+    });
+}
+
+void three_nn_cpu(int b, int n, int m, const float *unknown,
+    const float *known, float *dist2, int *idx) {
+    three_nn_cpu_kernel<float>(b, n, m, unknown, known, dist2, idx);
+}
+
+
+// input: points(b, c, m) idx(b, n, 3) weight(b, n, 3)
+// output: out(b, c, n)
+template <typename scalar_t>
+void three_interpolate_cpu_kernel(int b, int c, int m, int n,
+    const scalar_t *points, const int *idx, const scalar_t *weight, scalar_t *out) {
+    using acc_t = at::opmath_type<scalar_t>;
+    at::parallel_for(0, b * c, 1, [&](int64_t start, int64_t end) {
+        for (int64_t i = start; i < end; ++i) {
+            const int64_t bs_idx = i / c;
+            const scalar_t *points_row = points + i * m;
+            const int *idx_row = idx + bs_idx * n * 3;
+            const scalar_t *weight_row = weight + bs_idx * n * 3;
+            scalar_t *out_row = out + i * n;
+            for (int j = 0; j < n; ++j) {
+                out_row[j] = static_cast<acc_t>(weight_row[j * 3 + 0]) * points_row[idx_row[j * 3 + 0]] +
+                             static_cast<acc_t>(weight_row[j * 3 + 1]) * points_row[idx_row[j * 3 + 1]] +
+                             static_cast<acc_t>(weight_row[j * 3 + 2]) * points_row[idx_row[j * 3 + 2]];
+            }
+        }
+    });
+}
+
+void three_interpolate_cpu(int b, int c, int m, int n,
+    const at::Tensor& points, const at::Tensor& idx, const at::Tensor& weight, at::Tensor& out) {
+    DISPATCH_POINT_TYPES(points.scalar_type(), "three_interpolate_cpu", [&] {
+        three_interpolate_cpu_kernel<scalar_t>(b, c, m, n, points.data_ptr<scalar_t>(), idx.data_ptr<int>(),
+            weight.data_ptr<scalar_t>(), out.data_ptr<scalar_t>());
+    });
+}
+
+// input: grad_out(b, c, n) idx(b, n, 3) weight(b, n, 3)
+// output: grad_points(b, c, m)
+template <typename scalar_t>
+void three_interpolate_grad_cpu_kernel(int b, int c, int n, int m,
+    const scalar_t *grad_out, const int *idx, const scalar_t *weight, scalar_t *grad_points) {
+    using acc_t = at::opmath_type<scalar_t>;
+    // every (batch, channel) row is owned by a single thread, no atomics needed
+    at::parallel_for(0, b * c, 1, [&](int64_t start, int64_t end) {
+        std::vector<acc_t> acc(m);
+        for (int64_t i = start; i < end; ++i) {
+            const int64_t bs_idx = i / c;
+            const scalar_t *grad_out_row = grad_out + i * n;
+            const int *idx_row = idx + bs_idx * n * 3;
+            const scalar_t *weight_row = weight + bs_idx * n * 3;
+            scalar_t *grad_points_row = grad_points + i * m;
+            for (int l = 0; l < m; ++l) acc[l] = grad_points_row[l];
+            for (int j = 0; j < n; ++j) {
+                const acc_t g = grad_out_row[j];
+                acc[idx_row[j * 3 + 0]] += g * weight_row[j * 3 + 0];
+                acc[idx_row[j * 3 + 1]] += g * weight_row[j * 3 + 1];
+                acc[idx_row[j * 3 + 2]] += g * weight_row[j * 3 + 2];
+            }
+            for (int l = 0; l < m; ++l) grad_points_row[l] = acc[l];
+        }
+    });
+}
+
+void three_interpolate_grad_cpu(int b, int c, int n, int m,
+    const at::Tensor& grad_out, const at::Tensor& idx, const at::Tensor& weight, at::Tensor& grad_points) {
+    DISPATCH_POINT_TYPES(grad_out.scalar_type(), "three_interpolate_grad_cpu", [&] {
+        three_interpolate_grad_cpu_kernel<scalar_t>(b, c, n, m, grad_out.data_ptr<scalar_t>(), idx.data_ptr<int>(),
+            weight.data_ptr<scalar_t>(), grad_points.data_ptr<scalar_t>());
+    });
+}
@@ -1,13 +1,33 @@
-#include <THC/THCAtomics.cuh>
+#include <ATen/ATen.h>
+#include <ATen/OpMathType.h>
+#include <ATen/cuda/Atomic.cuh>
+#include <ATen/cuda/CUDAContext.h>
 #include <stdlib.h>
 #include <vector>
 
 #include "cuda_utils.h"
 
+// gathering, grouping and ball query run in half, bfloat16, float and double. Distances and
+// sums of the reduced types are computed in float (at::opmath_type), their gradients are
+// accumulated in a float buffer, atomics in half precision would lose most of the small terms
+#define DISPATCH_POINT_TYPES(TYPE, NAME, ...) \
+    AT_DISPATCH_FLOATING_TYPES_AND2(at::ScalarType::Half, at::ScalarType::BFloat16, TYPE, NAME, __VA_ARGS__)
+
+// grad itself for float and double, otherwise a float copy to accumulate into
+static at::Tensor accumulation_buffer(const at::Tensor& grad) {
+    const bool reduced = grad.scalar_type() == at::ScalarType::Half || grad.scalar_type() == at::ScalarType::BFloat16;
+    return reduced ? grad.to(at::ScalarType::Float) : grad;
+}
+
+static void copy_accumulation(at::Tensor& grad, const at::Tensor& acc) {
+    if (!acc.is_same(grad)) grad.copy_(acc);
+}
 
 
+
+template <typename scalar_t>
 __global__ void gather_points_kernel_fast(int b, int c, int n, int m,
-    const float *__restrict__ points, const int *__restrict__ idx, float *__restrict__ out) {
+    const scalar_t *__restrict__ points, const int *__restrict__ idx, scalar_t *__restrict__ out) {
     // points: (B, C, N)
     // idx: (B, M)
     // output:
@@ -25,7 +45,7 @@ __global__ void gather_points_kernel_fast(int b, int c, int n, int m,
 }
 
 void gather_points_kernel_launcher_fast(int b, int c, int n, int npoints,
-    const float *points, const int *idx, float *out, at::cuda::CUDAStream stream) {
+    const at::Tensor& points, const at::Tensor& idx, at::Tensor& out, at::cuda::CUDAStream stream) {
     // points: (B, C, N)
     // idx: (B, npoints)
     // output:
@@ -35,7 +55,10 @@ void gather_points_kernel_launcher_fast(int b, int c, int n, int npoints,
     dim3 blocks(DIVUP(npoints, THREADS_PER_BLOCK), c, b);  // blockIdx.x(col), blockIdx.y(row)
     dim3 threads(THREADS_PER_BLOCK);
 
-    gather_points_kernel_fast<<<blocks, threads, 0, stream>>>(b, c, n, npoints, points, idx, out);
+    DISPATCH_POINT_TYPES(points.scalar_type(), "gather_points_kernel_fast", [&] {
+        gather_points_kernel_fast<scalar_t><<<blocks, threads, 0, stream>>>(b, c, n, npoints,
+            points.data_ptr<scalar_t>(), idx.data_ptr<int>(), out.data_ptr<scalar_t>());
+    });
 
     err = cudaGetLastError();
     if (cudaSuccess != err) {
@@ -44,8 +67,9 @@ void gather_points_kernel_launcher_fast(int b, int c, int n, int npoints,
     }
 }
 
-__global__ void gather_points_grad_kernel_fast(int b, int c, int n, int m, const float *__restrict__ grad_out,
-    const int *__restrict__ idx, float *__restrict__ grad_points) {
+template <typename scalar_t, typename acc_t>
+__global__ void gather_points_grad_kernel_fast(int b, int c, int n, int m, const scalar_t *__restrict__ grad_out,
+    const int *__restrict__ idx, acc_t *__restrict__ grad_points) {
     // grad_out: (B, C, M)
     // idx: (B, M)
     // output:
@@ -60,11 +84,11 @@ __global__ void gather_points_grad_kernel_fast(int b, int c, int n, int m, const
     idx += bs_idx * m + pt_idx;
     grad_points += bs_idx * c * n + c_idx * n;
 
-    atomicAdd(grad_points + idx[0], grad_out[0]);
+    gpuAtomicAdd(grad_points + idx[0], static_cast<acc_t>(grad_out[0]));
 }
 
 void gather_points_grad_kernel_launcher_fast(int b, int c, int n, int npoints,
-    const float *grad_out, const int *idx, float *grad_points, at::cuda::CUDAStream stream) {
+    const at::Tensor& grad_out, const at::Tensor& idx, at::Tensor& grad_points, at::cuda::CUDAStream stream) {
     // grad_out: (B, C, npoints)
     // idx: (B, npoints)
     // output:
@@ -74,7 +98,13 @@ void gather_points_grad_kernel_launcher_fast(int b, int c, int n, int npoints,
     dim3 blocks(DIVUP(npoints, THREADS_PER_BLOCK), c, b);  // blockIdx.x(col), blockIdx.y(row)
     dim3 threads(THREADS_PER_BLOCK);
 
-    gather_points_grad_kernel_fast<<<blocks, threads, 0, stream>>>(b, c, n, npoints, grad_out, idx, grad_points);
+    at::Tensor acc = accumulation_buffer(grad_points);
+    DISPATCH_POINT_TYPES(grad_out.scalar_type(), "gather_points_grad_kernel_fast", [&] {
+        using acc_t = at::opmath_type<scalar_t>;
+        gather_points_grad_kernel_fast<scalar_t, acc_t><<<blocks, threads, 0, stream>>>(b, c, n, npoints,
+            grad_out.data_ptr<scalar_t>(), idx.data_ptr<int>(), acc.data_ptr<acc_t>());
+    });
+    copy_accumulation(grad_points, acc);
 
     err = cudaGetLastError();
     if (cudaSuccess != err) {
@@ -161,24 +191,26 @@ void gather_points_grad_kernel_launcher_fast(int b, int c, int n, int npoints,
 
 template <unsigned int block_size>
 __global__ void furthest_point_sampling_forward_kernel(int b, int n, int m, const int first_idx,
+    const int start, const int applied,
     const float * __restrict__ input, float * __restrict__ temp, int * __restrict__ idx) {
     // temp: (nxb) the closest distance from each of the n points to the existing set
+    // idx[:, :start] is given when first_idx < 0 and temp already holds the distance to idx[:, :applied]
     if (m <= 0) return;
     __shared__ float dists[block_size];
     __shared__ int dists_i[block_size];
     const unsigned int buffer_size = block_size;
     __shared__ float buf[block_size*3];
     for (int i=blockIdx.x; i<b; i+=gridDim.x){
-        int old=first_idx;
+        int old=first_idx>=0 ? first_idx : idx[i*m+applied];
         // first out of sought m points is point0
-        if (threadIdx.x==0) idx[i*m+0]=old;
+        if (first_idx>=0 && threadIdx.x==0) idx[i*m+0]=old;
         // fill buffer in the shared memory with input *once* for faster read
         for (int j=threadIdx.x;j<min(buffer_size,n)*3;j+=blockDim.x){
           buf[j]=input[i*n*3+j];
         }
         __syncthreads();
         // iteratively add m points
-        for (int j=1; j<m; j++){
+        for (int j=applied+1; j<m; j++){
               int besti=0;
               float best=-1;
               // position of the last point
@@ -208,6 +240,11 @@ __global__ void furthest_point_sampling_forward_kernel(int b, int n, int m, cons
                   besti=k;
                 }
               }
+              if (j<start){
+                // replaying the given samples, the choice is known
+                old=idx[i*m+j];
+                continue;
+              }
               dists[threadIdx.x]=best;
               dists_i[threadIdx.x]=besti;
               // u from 0~log2(block_size)
@@ -232,8 +269,8 @@ __global__ void furthest_point_sampling_forward_kernel(int b, int n, int m, cons
           }
         }
 
-void furthest_sampling_cuda_forward(const int m, const int first_idx,
-    at::Tensor& input, at::Tensor& temp, at::Tensor& idx) {
+static void furthest_sampling_cuda_launch(const int m, const int first_idx, const int start, const int applied,
+    const at::Tensor& input, at::Tensor& temp, at::Tensor& idx) {
     const int b = input.size(0);
     const int n = input.size(1);
     unsigned int n_threads = opt_n_threads(n);
@@ -241,76 +278,77 @@ void furthest_sampling_cuda_forward(const int m, const int first_idx,
     switch (n_threads) {
       case 512:
       furthest_point_sampling_forward_kernel<512><<<b, n_threads>>>(
-          b, n, m, first_idx, input.data_ptr<float>(),
+          b, n, m, first_idx, start, applied,
+          input.data_ptr<float>(),
           temp.data_ptr<float>(),
           idx.data_ptr<int32_t>());
       break;
       case 256:
       furthest_point_sampling_forward_kernel<256><<<b, n_threads>>>(
-          b, n, m, first_idx,
+          b, n, m, first_idx, start, applied,
           input.data_ptr<float>(),
           temp.data_ptr<float>(),
           idx.data_ptr<int32_t>());
       break;
       case 128:
       furthest_point_sampling_forward_kernel<128><<<b, n_threads>>>(
-          b, n, m, first_idx,
+          b, n, m, first_idx, start, applied,
           input.data_ptr<float>(),
           temp.data_ptr<float>(),
           idx.data_ptr<int32_t>());
       break;
       case 64:
       furthest_point_sampling_forward_kernel<64><<<b, n_threads>>>(
-          b, n, m, first_idx,
+          b, n, m, first_idx, start, applied,
           input.data_ptr<float>(),
           temp.data_ptr<float>(),
           idx.data_ptr<int32_t>());
       break;
       case 32:
       furthest_point_sampling_forward_kernel<32><<<b, n_threads>>>(
-          b, n, m, first_idx,
+          b, n, m, first_idx, start, applied,
           input.data_ptr<float>(),
           temp.data_ptr<float>(),
           idx.data_ptr<int32_t>());
       break;
       case 16:
       furthest_point_sampling_forward_kernel<16><<<b, n_threads>>>(
-          b, n, m, first_idx,
+          b, n, m, first_idx, start, applied,
           input.data_ptr<float>(),
           temp.data_ptr<float>(),
           idx.data_ptr<int32_t>());
       break;
       case 8:
       furthest_point_sampling_forward_kernel<8><<<b, n_threads>>>(
-          b, n, m, first_idx,
+          b, n, m, first_idx, start, applied,
           input.data_ptr<float>(),
           temp.data_ptr<float>(),
           idx.data_ptr<int32_t>());
       break;
       case 4:
       furthest_point_sampling_forward_kernel<4><<<b, n_threads>>>(
-          b, n, m, first_idx,
+          b, n, m, first_idx, start, applied,
           input.data_ptr<float>(),
           temp.data_ptr<float>(),
           idx.data_ptr<int32_t>());
       break;
       case 2:
       furthest_point_sampling_forward_kernel<2><<<b, n_threads>>>(
-          b, n, m, first_idx,
+          b, n, m, first_idx, start, applied,
           input.data_ptr<float>(),
           temp.data_ptr<float>(),
           idx.data_ptr<int32_t>());
       break;
       case 1:
       furthest_point_sampling_forward_kernel<1><<<b, n_threads>>>(
-          b, n, m, first_idx,
+          b, n, m, first_idx, start, applied,
           input.data_ptr<float>(),
           temp.data_ptr<float>(),
           idx.data_ptr<int32_t>());
       break;
       default:
       furthest_point_sampling_forward_kernel<512><<<b, n_threads>>>(
-          b, n, m, first_idx,
+          b, n, m, first_idx, start, applied,
           input.data_ptr<float>(),
           temp.data_ptr<float>(),
           idx.data_ptr<int32_t>());
@@ -324,6 +362,16 @@ void furthest_sampling_cuda_forward(const int m, const int first_idx,
     return;
 }
 
+void furthest_sampling_cuda_forward(const int m, const int first_idx,
+    at::Tensor& input, at::Tensor& temp, at::Tensor& idx) {
+    furthest_sampling_cuda_launch(m, first_idx, 1, 0, input, temp, idx);
+}
+
+void furthest_sampling_resume_cuda(const int m, const int start, const int applied,
+    const at::Tensor& input, at::Tensor& temp, at::Tensor& idx) {
+    furthest_sampling_cuda_launch(m, -1, start, applied, input, temp, idx);
+}
+
 
 template <typename scalar_t>
 __device__ scalar_t euDistance2(const scalar_t * x1, const scalar_t* x2, const int c) {
@@ -337,8 +385,10 @@ __device__ scalar_t euDistance2(const scalar_t * x1, const scalar_t* x2, const i
 
 // input: new_xyz(b, m, 3) xyz(b, n, 3)
 // output: idx(b, m, nsample)
+template <typename scalar_t>
 __global__ void ball_query_kernel_fast(int b, int n, int m, float radius, int nsample,
-    const float *__restrict__ new_xyz, const float *__restrict__ xyz, int *__restrict__ idx) {
+    const scalar_t *__restrict__ new_xyz, const scalar_t *__restrict__ xyz, int *__restrict__ idx) {
+    using acc_t = at::opmath_type<scalar_t>;
     // new_xyz: (B, M, 3)
     // xyz: (B, N, 3)
     // output:
@@ -351,17 +401,17 @@ __global__ void ball_query_kernel_fast(int b, int n, int m, float radius, int ns
     xyz += bs_idx * n * 3;
     idx += bs_idx * m * nsample + pt_idx * nsample;
 
-    float radius2 = radius * radius;
-    float new_x = new_xyz[0];
-    float new_y = new_xyz[1];
-    float new_z = new_xyz[2];
+    acc_t radius2 = radius * radius;
+    acc_t new_x = new_xyz[0];
+    acc_t new_y = new_xyz[1];
+    acc_t new_z = new_xyz[2];
 
     int cnt = 0;
     for (int k = 0; k < n; ++k) {
-        float x = xyz[k * 3 + 0];
-        float y = xyz[k * 3 + 1];
-        float z = xyz[k * 3 + 2];
-        float d2 = (new_x - x) * (new_x - x) + (new_y - y) * (new_y - y) + (new_z - z) * (new_z - z);
+        acc_t x = xyz[k * 3 + 0];
+        acc_t y = xyz[k * 3 + 1];
+        acc_t z = xyz[k * 3 + 2];
+        acc_t d2 = (new_x - x) * (new_x - x) + (new_y - y) * (new_y - y) + (new_z - z) * (new_z - z);
         if (d2 < radius2){
             if (cnt == 0){
                 for (int l = 0; l < nsample; ++l) {
@@ -377,7 +427,7 @@ __global__ void ball_query_kernel_fast(int b, int n, int m, float radius, int ns
 
 
 void ball_query_kernel_launcher_fast(int b, int n, int m, float radius, int nsample, \
-    const float *new_xyz, const float *xyz, int *idx, at::cuda::CUDAStream stream) {
+    const at::Tensor& new_xyz, const at::Tensor& xyz, at::Tensor& idx, at::cuda::CUDAStream stream) {
     // new_xyz: (B, M, 3)
     // xyz: (B, N, 3)
     // output:
@@ -388,7 +438,10 @@ void ball_query_kernel_launcher_fast(int b, int n, int m, float radius, int nsam
     dim3 blocks(DIVUP(m, THREADS_PER_BLOCK), b);  // blockIdx.x(col), blockIdx.y(row)
     dim3 threads(THREADS_PER_BLOCK);
 
-    ball_query_kernel_fast<<<blocks, threads, 0, stream>>>(b, n, m, radius, nsample, new_xyz, xyz, idx);
+    DISPATCH_POINT_TYPES(xyz.scalar_type(), "ball_query_kernel_fast", [&] {
+        ball_query_kernel_fast<scalar_t><<<blocks, threads, 0, stream>>>(b, n, m, radius, nsample,
+            new_xyz.data_ptr<scalar_t>(), xyz.data_ptr<scalar_t>(), idx.data_ptr<int>());
+    });
     // cudaDeviceSynchronize();  // for using printf in kernel function
     err = cudaGetLastError();
     if (cudaSuccess != err) {
@@ -444,11 +497,12 @@ void ball_query_kernel_launcher_fast(int b, int n, int m, float radius, int nsam
 
 // input: points(b, c, n) idx(b, npoints, nsample)
 // output: out(b, c, npoints, nsample)
+template <typename scalar_t>
 __global__ void group_points_kernel(int b, int c, int n, int npoints,
                                     int nsample,
-                                    const float *__restrict__ points,
+                                    const scalar_t *__restrict__ points,
                                     const int *__restrict__ idx,
-                                    float *__restrict__ out) {
+                                    scalar_t *__restrict__ out) {
   int batch_index = blockIdx.x;
   points += batch_index * n * c;
   idx += batch_index * npoints * nsample;
@@ -467,23 +521,26 @@ __global__ void group_points_kernel(int b, int c, int n, int npoints,
 }
 
 void group_points_kernel_wrapper(int b, int c, int n, int npoints, int nsample,
-                                 const float *points, const int *idx,
-                                 float *out) {
+                                 const at::Tensor& points, const at::Tensor& idx,
+                                 at::Tensor& out) {
   at::cuda::CUDAStream stream = at::cuda::getCurrentCUDAStream();
 
-  group_points_kernel<<<b, opt_block_config(npoints, c), 0, stream>>>(
-      b, c, n, npoints, nsample, points, idx, out);
+  DISPATCH_POINT_TYPES(points.scalar_type(), "group_points_kernel", [&] {
+    group_points_kernel<scalar_t><<<b, opt_block_config(npoints, c), 0, stream>>>(
+        b, c, n, npoints, nsample, points.data_ptr<scalar_t>(), idx.data_ptr<int>(), out.data_ptr<scalar_t>());
+  });
 
   CUDA_CHECK_ERRORS();
 }
 
 // input: grad_out(b, c, npoints, nsample), idx(b, npoints, nsample)
 // output: grad_points(b, c, n)
+template <typename scalar_t, typename acc_t>
 __global__ void group_points_grad_kernel(int b, int c, int n, int npoints,
                                          int nsample,
-                                         const float *__restrict__ grad_out,
+                                         const scalar_t *__restrict__ grad_out,
                                          const int *__restrict__ idx,
-                                         float *__restrict__ grad_points) {
+                                         acc_t *__restrict__ grad_points) {
   int batch_index = blockIdx.x;
   grad_out += batch_index * npoints * nsample * c;
   idx += batch_index * npoints * nsample;
@@ -496,19 +553,138 @@ __global__ void group_points_grad_kernel(int b, int c, int n, int npoints,
     const int j = i % npoints;
     for (int k = 0; k < nsample; ++k) {
       int ii = idx[j * nsample + k];
-      atomicAdd(grad_points + l * n + ii,
-                grad_out[(l * npoints + j) * nsample + k]);
+      gpuAtomicAdd(grad_points + l * n + ii,
+                   static_cast<acc_t>(grad_out[(l * npoints + j) * nsample + k]));
     }
   }
 }
 
 void group_points_grad_kernel_wrapper(int b, int c, int n, int npoints,
-                                      int nsample, const float *grad_out,
-                                      const int *idx, float *grad_points) {
+                                      int nsample, const at::Tensor& grad_out,
+                                      const at::Tensor& idx, at::Tensor& grad_points) {
+  at::cuda::CUDAStream stream = at::cuda::getCurrentCUDAStream();
+
+  at::Tensor acc = accumulation_buffer(grad_points);
+  DISPATCH_POINT_TYPES(grad_out.scalar_type(), "group_points_grad_kernel", [&] {
+    using acc_t = at::opmath_type<scalar_t>;
+    group_points_grad_kernel<scalar_t, acc_t><<<b, opt_block_config(npoints, c), 0, stream>>>(
+        b, c, n, npoints, nsample, grad_out.data_ptr<scalar_t>(), idx.data_ptr<int>(), acc.data_ptr<acc_t>());
+  });
+  copy_accumulation(grad_points, acc);
+
+  CUDA_CHECK_ERRORS();
+}
+
+// grouping of QueryAndGroup in one pass, the first cx (3 or 0) channels are the recentered
+// neighbor coordinates, followed by the c grouped features
+// input: new_xyz(b, npoints, 3) xyz(b, n, 3) features(b, c, n) idx(b, npoints, nsample)
+// output: out(b, cx + c, npoints, nsample)
+template <typename scalar_t>
+__global__ void group_and_center_kernel(int b, int c, int n, int npoints, int nsample, int cx,
+                                        const scalar_t *__restrict__ new_xyz,
+                                        const scalar_t *__restrict__ xyz,
+                                        const scalar_t *__restrict__ features,
+                                        const int *__restrict__ idx,
+                                        scalar_t *__restrict__ out) {
+  const int ct = cx + c;
+  int batch_index = blockIdx.x;
+  new_xyz += batch_index * npoints * 3;
+  xyz += batch_index * n * 3;
+  features += batch_index * n * c;
+  idx += batch_index * npoints * nsample;
+  out += batch_index * npoints * nsample * ct;
+
+  const int index = threadIdx.y * blockDim.x + threadIdx.x;
+  const int stride = blockDim.y * blockDim.x;
+  for (int i = index; i < ct * npoints; i += stride) {
+    const int l = i / npoints;
+    const int j = i % npoints;
+    if (l < cx) {
+      const at::opmath_type<scalar_t> center = new_xyz[j * 3 + l];
+      for (int k = 0; k < nsample; ++k) {
+        int ii = idx[j * nsample + k];
+        out[(l * npoints + j) * nsample + k] = static_cast<at::opmath_type<scalar_t>>(xyz[ii * 3 + l]) - center;
+      }
+    } else {
+      for (int k = 0; k < nsample; ++k) {
+        int ii = idx[j * nsample + k];
+        out[(l * npoints + j) * nsample + k] = features[(l - cx) * n + ii];
+      }
+    }
+  }
+}
+
+void group_and_center_kernel_wrapper(int b, int c, int n, int npoints, int nsample, int cx,
+                                     const at::Tensor& new_xyz, const at::Tensor& xyz, const at::Tensor& features,
+                                     const at::Tensor& idx, at::Tensor& out) {
+  at::cuda::CUDAStream stream = at::cuda::getCurrentCUDAStream();
+
+  DISPATCH_POINT_TYPES(out.scalar_type(), "group_and_center_kernel", [&] {
+    group_and_center_kernel<scalar_t><<<b, opt_block_config(npoints, cx + c), 0, stream>>>(
+        b, c, n, npoints, nsample, cx, new_xyz.data_ptr<scalar_t>(), xyz.data_ptr<scalar_t>(),
+        features.data_ptr<scalar_t>(), idx.data_ptr<int>(), out.data_ptr<scalar_t>());
+  });
+
+  CUDA_CHECK_ERRORS();
+}
+
+// input: grad_out(b, cx + c, npoints, nsample) idx(b, npoints, nsample)
+// output: grad_xyz(b, n, 3) grad_new_xyz(b, npoints, 3) grad_features(b, c, n), zero initialized
+template <typename scalar_t, typename acc_t>
+__global__ void group_and_center_grad_kernel(int b, int c, int n, int npoints, int nsample, int cx,
+                                             const scalar_t *__restrict__ grad_out,
+                                             const int *__restrict__ idx,
+                                             acc_t *__restrict__ grad_xyz,
+                                             scalar_t *__restrict__ grad_new_xyz,
+                                             acc_t *__restrict__ grad_features) {
+  const int ct = cx + c;
+  int batch_index = blockIdx.x;
+  grad_out += batch_index * npoints * nsample * ct;
+  idx += batch_index * npoints * nsample;
+  grad_xyz += batch_index * n * 3;
+  grad_new_xyz += batch_index * npoints * 3;
+  grad_features += batch_index * n * c;
+
+  const int index = threadIdx.y * blockDim.x + threadIdx.x;
+  const int stride = blockDim.y * blockDim.x;
+  for (int i = index; i < ct * npoints; i += stride) {
+    const int l = i / npoints;
+    const int j = i % npoints;
+    if (l < cx) {
+      acc_t acc = 0;
+      for (int k = 0; k < nsample; ++k) {
+        int ii = idx[j * nsample + k];
+        const acc_t g = grad_out[(l * npoints + j) * nsample + k];
+        gpuAtomicAdd(grad_xyz + ii * 3 + l, g);
+        acc += g;
+      }
+      // every center is reduced by a single thread
+      grad_new_xyz[j * 3 + l] = -acc;
+    } else {
+      for (int k = 0; k < nsample; ++k) {
+        int ii = idx[j * nsample + k];
+        gpuAtomicAdd(grad_features + (l - cx) * n + ii,
+                     static_cast<acc_t>(grad_out[(l * npoints + j) * nsample + k]));
+      }
+    }
+  }
+}
+
+void group_and_center_grad_kernel_wrapper(int b, int c, int n, int npoints, int nsample, int cx,
+                                          const at::Tensor& grad_out, const at::Tensor& idx,
+                                          at::Tensor& grad_xyz, at::Tensor& grad_new_xyz, at::Tensor& grad_features) {
   at::cuda::CUDAStream stream = at::cuda::getCurrentCUDAStream();
 
-  group_points_grad_kernel<<<b, opt_block_config(npoints, c), 0, stream>>>(
-      b, c, n, npoints, nsample, grad_out, idx, grad_points);
+  at::Tensor acc_xyz = accumulation_buffer(grad_xyz);
+  at::Tensor acc_features = accumulation_buffer(grad_features);
+  DISPATCH_POINT_TYPES(grad_out.scalar_type(), "group_and_center_grad_kernel", [&] {
+    using acc_t = at::opmath_type<scalar_t>;
+    group_and_center_grad_kernel<scalar_t, acc_t><<<b, opt_block_config(npoints, cx + c), 0, stream>>>(
+        b, c, n, npoints, nsample, cx, grad_out.data_ptr<scalar_t>(), idx.data_ptr<int>(),
+        acc_xyz.data_ptr<acc_t>(), grad_new_xyz.data_ptr<scalar_t>(), acc_features.data_ptr<acc_t>());
+  });
+  copy_accumulation(grad_xyz, acc_xyz);
+  copy_accumulation(grad_features, acc_features);
 
   CUDA_CHECK_ERRORS();
 }
\ No newline at end of file
@@ -1,5 +1,7 @@
 #include <torch/extension.h>
+#ifdef WITH_CUDA
 #include <ATen/cuda/CUDAContext.h>
+#endif
 //#undef NDEBUG
 
 #include <cstdio>
@@ -8,15 +10,18 @@
 #include <algorithm>
 #include <vector>
 
+#ifdef WITH_CUDA
 #include <cuda_runtime.h>
 #include <cublas_v2.h>
 #include <cusolver_common.h>
 #include <cusolverDn.h>
+#endif
 
 
 namespace torch_batch_svd
 {
 
+#ifdef WITH_CUDA
 template<int success = CUSOLVER_STATUS_SUCCESS, class T, class Status> // , class A = Status(*)(P), class D = Status(*)(T)>
 std::unique_ptr<T, Status(*)(T*)> unique_allocate(Status(allocator)(T**),  Status(deleter)(T*))
 {
@@ -33,13 +38,24 @@ std::unique_ptr<T, decltype(&cudaFree)> unique_cuda_ptr(size_t len) {
     TORCH_CHECK(stat == cudaSuccess);
     return {ptr, cudaFree};
 }
+#endif
+
+// CPU forward declarations
+std::tuple<at::Tensor, at::Tensor, at::Tensor>
+batch_svd_cpu_forward(at::Tensor a, bool is_sort, double tol, int max_sweeps);
 
 // solve U S V = svd(A)  a.k.a. syevj, where A (b, m, n), U (b, m, m), S (b, min(m, n)), V (b, n, n)
 // see also https://docs.nvidia.com/cuda/cusolver/index.html#batchgesvdj-example1
 std::tuple<at::Tensor, at::Tensor, at::Tensor>
 batch_svd_forward(at::Tensor a, bool is_sort, double tol=1e-7, int max_sweeps=100)
 {
-    TORCH_CHECK(a.is_cuda(), "only cuda tensor is supported");
+    if (!a.is_cuda()) {
+        return batch_svd_cpu_forward(a, is_sort, tol, max_sweeps);
+    }
+#ifndef WITH_CUDA
+    TORCH_CHECK(false, "a is a CUDA tensor, but pytorch_points was built without CUDA");
+    return {};
+#else
     TORCH_CHECK(a.scalar_type() == at::kFloat, "only float is supported");
 
     auto handle_ptr = unique_allocate(cusolverDnCreate, cusolverDnDestroy);
@@ -140,6 +156,7 @@ batch_svd_forward(at::Tensor a, bool is_sort, double tol=1e-7, int max_sweeps=10
       exit(-1);
     }
     return std::make_tuple(U, s, V);
+#endif
 }
 
 
@@ -239,7 +256,7 @@ at::Tensor batch_svd_backward(const std::vector<at::Tensor> &grads, const at::Te
 // FIXME do not use legacy preprocessor macro
 PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
     m.def("batch_svd_forward", &torch_batch_svd::batch_svd_forward,
-          "cusolver based batch svd implementation");
+          "batch svd implementation (cusolver/CPU Jacobi)");
     m.def("batch_svd_backward", &torch_batch_svd::batch_svd_backward,
           "batch svd backward");
 }
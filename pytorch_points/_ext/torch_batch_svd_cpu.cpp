@@ -0,0 +1,176 @@
+#include <torch/extension.h>
+#include <ATen/Parallel.h>
+
+#include <cmath>
+#include <algorithm>
+#include <numeric>
+#include <vector>
+
+
+namespace torch_batch_svd
+{
+
+// complete the columns [k, m) of the column-major (m, m) matrix u to an orthonormal basis
+// with Gram-Schmidt on the canonical basis vectors, columns [0, k) must be orthonormal
+static void complete_basis(double *u, int m, int k)
+{
+    int e = 0;
+    for (int j = k; j < m; ++j) {
+        double *col = u + j * m;
+        for (; e < m; ++e) {
+            std::fill(col, col + m, 0.0);
+            col[e] = 1.0;
+            // two passes for numerical orthogonality
+            for (int pass = 0; pass < 2; ++pass) {
+                for (int l = 0; l < j; ++l) {
+                    const double *other = u + l * m;
+                    double d = 0;
+                    for (int i = 0; i < m; ++i) d += other[i] * col[i];
+                    for (int i = 0; i < m; ++i) col[i] -= d * other[i];
+                }
+            }
+            double norm = 0;
+            for (int i = 0; i < m; ++i) norm += col[i] * col[i];
+            norm = std::sqrt(norm);
+            if (norm > 1e-6) {
+                for (int i = 0; i < m; ++i) col[i] /= norm;
+                ++e;
+                break;
+            }
+        }
+    }
+}
+
+// one-sided (Hestenes) Jacobi svd of a single (rows, cols) matrix with rows >= cols,
+// g holds the columns of the matrix (column-major) and is orthogonalized in place,
+// v (cols, cols, column-major) accumulates the rotations
+static int one_sided_jacobi(double *g, double *v, int rows, int cols, double tol, int max_sweeps)
+{
+    std::fill(v, v + cols * cols, 0.0);
+    for (int j = 0; j < cols; ++j) v[j * cols + j] = 1.0;
+    for (int sweep = 0; sweep < max_sweeps; ++sweep) {
+        bool rotated = false;
+        for (int p = 0; p < cols - 1; ++p) {
+            for (int q = p + 1; q < cols; ++q) {
+                double *gp = g + p * rows, *gq = g + q * rows;
+                double alpha = 0, beta = 0, gamma = 0;
+                for (int i = 0; i < rows; ++i) {
+                    alpha += gp[i] * gp[i];
+                    beta += gq[i] * gq[i];
+                    gamma += gp[i] * gq[i];
+                }
+                if (gamma == 0 || std::abs(gamma) <= tol * std::sqrt(alpha * beta)) continue;
+                rotated = true;
+                const double zeta = (beta - alpha) / (2 * gamma);
+                const double t = (zeta >= 0 ? 1.0 : -1.0) / (std::abs(zeta) + std::sqrt(1 + zeta * zeta));
+                const double c = 1 / std::sqrt(1 + t * t);
+                const double s = c * t;
+                for (int i = 0; i < rows; ++i) {
+                    const double a = gp[i], b = gq[i];
+                    gp[i] = c * a - s * b;
+                    gq[i] = s * a + c * b;
+                }
+                double *vp = v + p * cols, *vq = v + q * cols;
+                for (int i = 0; i < cols; ++i) {
+                    const double a = vp[i], b = vq[i];
+                    vp[i] = c * a - s * b;
+                    vq[i] = s * a + c * b;
+                }
+            }
+        }
+        if (!rotated) return 0;
+    }
+    return 1;
+}
+
+template <typename scalar_t>
+static void batch_svd_cpu_kernel(const scalar_t *a, scalar_t *u_out, scalar_t *s_out, scalar_t *v_out,
+                                 int64_t batch_size, int m, int n, double tol, int max_sweeps,
+                                 int *not_converged)
+{
+    // work on the transpose for wide matrices, A^T = V S U^T
+    const bool wide = m < n;
+    const int rows = wide ? n : m;
+    const int cols = wide ? m : n;
+    at::parallel_for(0, batch_size, 0, [&](int64_t start, int64_t end) {
+        std::vector<double> g(rows * cols), v(cols * cols), left(rows * rows);
+        std::vector<double> right(cols * cols), sigma(cols);
+        std::vector<int> order(cols);
+        for (int64_t b = start; b < end; ++b) {
+            const scalar_t *ab = a + b * m * n;
+            // column j of the working matrix
+            for (int j = 0; j < cols; ++j)
+                for (int i = 0; i < rows; ++i)
+                    g[j * rows + i] = wide ? ab[j * n + i] : ab[i * n + j];
+            not_converged[b] = one_sided_jacobi(g.data(), v.data(), rows, cols, tol, max_sweeps);
+
+            for (int j = 0; j < cols; ++j) {
+                double norm = 0;
+                for (int i = 0; i < rows; ++i) norm += g[j * rows + i] * g[j * rows + i];
+                sigma[j] = std::sqrt(norm);
+            }
+            // always sorted in descending order, the rank-deficient columns are then the trailing ones
+            std::iota(order.begin(), order.end(), 0);
+            std::stable_sort(order.begin(), order.end(), [&](int i, int j) { return sigma[i] > sigma[j]; });
+
+            // left singular vectors of the nonzero singular values, the rest spans the complement
+            const double cutoff = sigma[order[0]] * rows * 1e-15;
+            int k = 0;
+            for (; k < cols && sigma[order[k]] > cutoff && sigma[order[k]] > 0; ++k) {
+                const double *gj = g.data() + order[k] * rows;
+                for (int i = 0; i < rows; ++i) left[k * rows + i] = gj[i] / sigma[order[k]];
+            }
+            complete_basis(left.data(), rows, k);
+
+            scalar_t *ub = u_out + b * m * m;
+            scalar_t *sb = s_out + b * cols;
+            scalar_t *vb = v_out + b * n * n;
+            // the right singular vectors of the working matrix in the sorted order
+            for (int j = 0; j < cols; ++j) {
+                sb[j] = static_cast<scalar_t>(sigma[order[j]]);
+                std::copy(v.begin() + order[j] * cols, v.begin() + (order[j] + 1) * cols, right.begin() + j * cols);
+            }
+            // U (m, m) and V (n, n) are row-major with the singular vectors as columns
+            const double *u_cols = wide ? right.data() : left.data();
+            const double *v_cols = wide ? left.data() : right.data();
+            for (int i = 0; i < m; ++i)
+                for (int j = 0; j < m; ++j)
+                    ub[i * m + j] = static_cast<scalar_t>(u_cols[j * m + i]);
+            for (int i = 0; i < n; ++i)
+                for (int j = 0; j < n; ++j)
+                    vb[i * n + j] = static_cast<scalar_t>(v_cols[j * n + i]);
+        }
+    });
+}
+
+// same outputs as batch_svd_forward, A (b, m, n), U (b, m, m), S (b, min(m, n)), V (b, n, n),
+// the singular values are sorted in descending order regardless of is_sort
+std::tuple<at::Tensor, at::Tensor, at::Tensor>
+batch_svd_cpu_forward(at::Tensor a, bool is_sort, double tol, int max_sweeps)
+{
+    TORCH_CHECK(a.dim() == 3, "input must be a batch of matrices");
+    TORCH_CHECK(a.scalar_type() == at::kFloat || a.scalar_type() == at::kDouble,
+                "only float and double are supported");
+    const auto A = a.contiguous();
+    const auto batch_size = A.size(0);
+    const int m = A.size(1);
+    const int n = A.size(2);
+    auto s = at::empty({batch_size, std::min(m, n)}, A.options());
+    auto U = at::empty({batch_size, m, m}, A.options());
+    auto V = at::empty({batch_size, n, n}, A.options());
+    std::vector<int> not_converged(batch_size, 0);
+    if (batch_size == 0 || m == 0 || n == 0) return std::make_tuple(U, s, V);
+
+    AT_DISPATCH_FLOATING_TYPES(A.scalar_type(), "batch_svd_cpu_forward", [&] {
+        batch_svd_cpu_kernel<scalar_t>(
+            A.data_ptr<scalar_t>(), U.data_ptr<scalar_t>(), s.data_ptr<scalar_t>(), V.data_ptr<scalar_t>(),
+            batch_size, m, n, tol, max_sweeps, not_converged.data());
+    });
+    for (int64_t i = 0; i < batch_size; ++i) {
+        if (not_converged[i])
+            printf("WARNING: matrix %ld : Jacobi method does not converge \n", static_cast<long>(i));
+    }
+    return std::make_tuple(U, s, V);
+}
+
+} // namespace torch_batch_svd
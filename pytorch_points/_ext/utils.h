@@ -1,9 +1,14 @@
 #pragma once
+#ifdef WITH_CUDA
 #include <ATen/cuda/CUDAContext.h>
+#endif
 #include <torch/extension.h>
 // C++ interface
 #define CHECK_CUDA(x) AT_ASSERTM(x.is_cuda(), #x " must be a CUDA tensor")
 #define CHECK_CONTIGUOUS(x) AT_ASSERTM(x.is_contiguous(), #x " must be contiguous")
+// cuda input of an extension built without WITH_CUDA
+#define NO_CUDA_ERROR(x) \
+  TORCH_CHECK(false, #x " is a CUDA tensor, but pytorch_points was built without CUDA")
 #define CHECK_INPUT(x) \
   CHECK_CUDA(x);       \
   CHECK_CONTIGUOUS(x)
@@ -18,3 +23,19 @@
     TORCH_CHECK(x.scalar_type() == at::ScalarType::Float, \
              #x " must be a float tensor");            \
   } while (0)
+
+// half, bfloat16, float or double, the point types of gathering, grouping and interpolation
+#define CHECK_IS_FLOATING(x)                                       \
+  do {                                                             \
+    TORCH_CHECK(x.scalar_type() == at::ScalarType::Half ||         \
+                x.scalar_type() == at::ScalarType::BFloat16 ||     \
+                x.scalar_type() == at::ScalarType::Float ||        \
+                x.scalar_type() == at::ScalarType::Double,         \
+             #x " must be a half, bfloat16, float or double tensor"); \
+  } while (0)
+
+#define CHECK_SAME_TYPE(x, y)                                      \
+  do {                                                             \
+    TORCH_CHECK(x.scalar_type() == y.scalar_type(),                \
+             #x " and " #y " must have the same dtype");          \
+  } while (0)
@@ -0,0 +1,39 @@
+"""
+Deferred imports for the compiled extensions and heavy optional dependencies.
+"""
+import importlib
+import importlib.util
+import types
+
+
+class LazyModule(types.ModuleType):
+    """
+    Proxy that imports module `name` on first attribute access.
+    Relative names are resolved against `package`, like importlib.import_module.
+    A failed import (e.g. an extension that is not built) is raised when the
+    module is first used instead of when the importing module is loaded.
+    """
+
+    def __init__(self, name, package=None):
+        name = importlib.util.resolve_name(name, package)
+        super(LazyModule, self).__init__(name)
+        self._lazy_name = name
+        self._lazy_module = None
+
+    def _load(self):
+        if self._lazy_module is None:
+            self._lazy_module = importlib.import_module(self._lazy_name)
+        return self._lazy_module
+
+    def __getattr__(self, attr):
+        # only called for attributes missing on the proxy itself
+        if attr.startswith("_lazy_"):
+            raise AttributeError(attr)
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self._lazy_module is not None else "not loaded"
+        return "<lazy module '%s' (%s)>" % (self._lazy_name, state)
@@ -0,0 +1,252 @@
+"""
+Backend registry for the point operations.
+
+Every op (e.g. "ball_query") has one or more engines: the compiled extension, a pure-torch
+reference, pytorch3d, ... An engine is used only if it is available (its dependency imports)
+and supports the device of the inputs. Without autotuning the first registered engine wins,
+which keeps the historical behavior. With autotuning every engine is timed once per
+(op, device, dtype, size bucket) and the fastest is remembered in a json file on disk.
+
+usage:
+    from pytorch_points.network import backends
+    backends.engines("knn_points")              # ['pytorch3d', 'torch']
+    backends.set_engine("knn_points", "torch")  # force an engine, None to reset
+    backends.set_autotune(True)                 # or PYTORCH_POINTS_AUTOTUNE=1
+"""
+import importlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+import torch
+
+from ..misc.logger import get_logger
+
+logger = get_logger(__name__)
+
+_OPS = OrderedDict()
+_FORCED = {}
+_DEFAULT_CACHE = {}
+_AVAILABLE = {}
+
+
+class _Op(object):
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        self.engines = OrderedDict()
+
+
+class _Engine(object):
+    def __init__(self, name, fn, available, devices):
+        self.name = name
+        self.fn = fn
+        self.available = available
+        self.devices = devices
+
+    def supports(self, device_type):
+        if self.devices is not None and device_type not in self.devices:
+            return False
+        return self.available is None or self.available()
+
+
+class _Autotuner(object):
+    def __init__(self):
+        self.enabled = os.environ.get("PYTORCH_POINTS_AUTOTUNE", "0") not in ("", "0")
+        self.cache_file = os.environ.get(
+            "PYTORCH_POINTS_AUTOTUNE_CACHE",
+            os.path.join(os.path.expanduser("~"), ".cache", "pytorch_points", "autotune.json"))
+        self.repeat = 3
+        self._choices = None
+
+    @property
+    def choices(self):
+        if self._choices is None:
+            self._choices = {}
+            if self.cache_file and os.path.isfile(self.cache_file):
+                try:
+                    with open(self.cache_file) as f:
+                        self._choices = json.load(f)
+                except (OSError, ValueError):
+                    logger.warning("Ignoring unreadable autotune cache {}".format(self.cache_file))
+        return self._choices
+
+    def save(self):
+        if not self.cache_file:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_file)), exist_ok=True)
+            tmp = "{}.{}.tmp".format(self.cache_file, os.getpid())
+            with open(tmp, "w") as f:
+                json.dump(self.choices, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.cache_file)
+        except OSError:
+            logger.warning("Could not write autotune cache {}".format(self.cache_file))
+
+    def time_engine(self, engine, device, args, kwargs):
+        """
+        best of self.repeat runs in seconds, None if the engine fails on these inputs.
+        Every run gets fresh clones of the tensor arguments, engines that write into their
+        inputs then leave the caller's tensors untouched.
+        """
+        try:
+            with torch.no_grad():
+                engine.fn(*_clone_tensors(args), **_clone_tensors(kwargs))
+                best = float("inf")
+                for _ in range(self.repeat):
+                    run_args, run_kwargs = _clone_tensors(args), _clone_tensors(kwargs)
+                    _synchronize(device)
+                    start = time.perf_counter()
+                    engine.fn(*run_args, **run_kwargs)
+                    _synchronize(device)
+                    best = min(best, time.perf_counter() - start)
+            return best
+        except (RuntimeError, ValueError, TypeError, AssertionError, NotImplementedError, ImportError):
+            return None
+
+
+_autotuner = _Autotuner()
+
+
+def _clone_tensors(args):
+    if isinstance(args, dict):
+        return {k: v.clone() if isinstance(v, torch.Tensor) else v for k, v in args.items()}
+    return [a.clone() if isinstance(a, torch.Tensor) else a for a in args]
+
+
+def _synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def _first_tensor(args, kwargs):
+    for a in list(args) + list(kwargs.values()):
+        if isinstance(a, torch.Tensor):
+            return a
+    return None
+
+
+def _device_key(device):
+    if device.type == "cuda":
+        return "cuda:" + torch.cuda.get_device_name(device)
+    return "{}:{}threads".format(device.type, torch.get_num_threads())
+
+
+def module_available(name):
+    """availability check for engines that need module `name`, e.g. a compiled extension"""
+    def available():
+        if name not in _AVAILABLE:
+            try:
+                importlib.import_module(name)
+                _AVAILABLE[name] = True
+            except ImportError:
+                _AVAILABLE[name] = False
+        return _AVAILABLE[name]
+    return available
+
+
+def register_op(op, size=None):
+    """
+    declare an op, size(*args, **kwargs) returns a work estimate used for the autotune buckets
+    """
+    if op not in _OPS:
+        _OPS[op] = _Op(op, size)
+    elif size is not None:
+        _OPS[op].size = size
+    return _OPS[op]
+
+
+def register_engine(op, name, fn, available=None, devices=None):
+    """
+    add engine `name` to `op`, engines registered first are preferred without autotuning
+    params:
+        fn          callable with the signature of the op
+        available   callable returning False if the engine cannot be used, e.g. module_available(...)
+        devices     device types the engine runs on, e.g. ("cuda",), None for any
+    """
+    register_op(op).engines[name] = _Engine(name, fn, available, None if devices is None else tuple(devices))
+    _DEFAULT_CACHE.clear()
+    return fn
+
+
+def engines(op, device=None):
+    """names of the engines of op, restricted to those usable on device if given"""
+    candidates = _OPS[op].engines.values()
+    if device is not None:
+        device_type = torch.device(device).type
+        candidates = [e for e in candidates if e.supports(device_type)]
+    return [e.name for e in candidates]
+
+
+def set_engine(op, name):
+    """always use engine `name` for op, None restores the automatic choice"""
+    if name is None:
+        _FORCED.pop(op, None)
+    else:
+        if name not in _OPS[op].engines:
+            raise ValueError("unknown engine {} for {}, choose from {}".format(name, op, engines(op)))
+        _FORCED[op] = name
+
+
+def set_autotune(enabled=True, cache_file=None):
+    """enable the autotuner, choices are stored in cache_file (no persistence if cache_file is '')"""
+    _autotuner.enabled = enabled
+    if cache_file is not None:
+        _autotuner.cache_file = cache_file
+        _autotuner._choices = None
+
+
+def clear_autotune_cache():
+    _autotuner._choices = {}
+    _autotuner.save()
+
+
+def _select(op, args, kwargs):
+    entry = _OPS[op]
+    if op in _FORCED:
+        return entry.engines[_FORCED[op]]
+    tensor = _first_tensor(args, kwargs)
+    device = tensor.device if tensor is not None else torch.device("cpu")
+
+    if _autotuner.enabled and entry.size is not None and tensor is not None:
+        bucket = max(int(entry.size(*args, **kwargs)), 1).bit_length()
+        key = "{}/{}/{}/{}".format(op, _device_key(device), str(tensor.dtype).replace("torch.", ""), bucket)
+        choice = _autotuner.choices.get(key)
+        if choice in entry.engines and entry.engines[choice].supports(device.type):
+            return entry.engines[choice]
+        timings = {}
+        for engine in entry.engines.values():
+            if engine.supports(device.type):
+                t = _autotuner.time_engine(engine, device, args, kwargs)
+                if t is not None:
+                    timings[engine.name] = t
+        if timings:
+            choice = min(timings, key=timings.get)
+            logger.info("autotune {}: {} ({})".format(
+                key, choice, ", ".join("{} {:.3g}ms".format(k, v * 1e3) for k, v in timings.items())))
+            _autotuner.choices[key] = choice
+            _autotuner.save()
+            return entry.engines[choice]
+
+    cache_key = (op, device.type)
+    if cache_key not in _DEFAULT_CACHE:
+        usable = [e for e in entry.engines.values() if e.supports(device.type)]
+        if not usable:
+            raise RuntimeError("no engine of {} runs on {}, registered: {}".format(op, device.type, engines(op)))
+        _DEFAULT_CACHE[cache_key] = usable[0]
+    return _DEFAULT_CACHE[cache_key]
+
+
+def dispatch(op, *args, **kwargs):
+    """run op with the selected engine"""
+    return _select(op, args, kwargs).fn(*args, **kwargs)
+
+
+def dispatcher(op, doc=None):
+    """function that dispatches op, to be bound as the public name of the op"""
+    def fn(*args, **kwargs):
+        return _select(op, args, kwargs).fn(*args, **kwargs)
+    fn.__name__ = op
+    fn.__doc__ = doc
+    return fn
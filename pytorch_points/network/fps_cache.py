@@ -0,0 +1,196 @@
+"""
+Opt-in cache of furthest point sampling indices.
+
+Clouds that are fed unchanged every epoch (no augmentation before the sampling) get the same
+samples every time. The cache maps a content hash of every cloud, plus npoint, seed, eps and
+the device type, to the sampled indices. Within a device type the first engine that fills an
+entry wins, e.g. with eps the grid-pruned samples of the extension are also served when the
+exhaustive torch engine is selected later. It has a bounded in-memory LRU and an optional directory store with one
+file per entry, written atomically, that DataLoader workers and later runs can share.
+Only the clouds of a batch that miss are sampled.
+
+usage:
+    from pytorch_points.network import fps_cache
+    fps_cache.enable(maxsize=4096, cache_dir="/tmp/fps")   # or PYTORCH_POINTS_FPS_CACHE=/tmp/fps
+    ... train an epoch ...
+    print(fps_cache.stats())
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+from ..misc.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class FPSCache(object):
+    """
+    params:
+        maxsize     number of clouds kept in memory, least recently used are dropped first
+        cache_dir   directory of the persistent store, None keeps the cache in memory only
+    """
+
+    def __init__(self, maxsize=1024, cache_dir=None):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # time spent hashing and reading vs sampling the misses
+        self.lookup_seconds = 0.0
+        self.compute_seconds = 0.0
+
+    def stats(self):
+        """counters since the last reset_stats, saved_seconds estimates the sampling time saved by the hits"""
+        lookups = self.hits + self.disk_hits + self.misses
+        per_miss = self.compute_seconds / self.misses if self.misses else 0.0
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "lookup_seconds": self.lookup_seconds, "compute_seconds": self.compute_seconds,
+                "saved_seconds": per_miss * (self.hits + self.disk_hits) - self.lookup_seconds}
+
+    def clear(self, disk=False):
+        """drop the in-memory entries, and the files of the store if disk is True"""
+        with self._lock:
+            self._entries.clear()
+        if disk and self.cache_dir:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".npy"):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+    @staticmethod
+    def keys(xyz, npoint, seedIdx, eps):
+        """hex digests of the content of every cloud of xyz (B, N, 3) and the sampling parameters"""
+        data = xyz.detach()
+        params = "{}/{}/{}/{}/{}/{}".format(
+            tuple(data.shape[1:]), data.dtype, npoint, seedIdx, eps, data.device.type).encode()
+        # one transfer for the whole batch, numpy has no bfloat16
+        data = data.cpu().contiguous()
+        if data.dtype == torch.bfloat16:
+            data = data.view(torch.int16)
+        data = data.numpy()
+        keys = []
+        for cloud in data:
+            h = hashlib.blake2b(digest_size=16)
+            h.update(params)
+            h.update(cloud.tobytes())
+            keys.append(h.hexdigest())
+        return keys
+
+    @staticmethod
+    def key(cloud, npoint, seedIdx, eps):
+        """hex digest of the cloud (N, 3) content and the sampling parameters"""
+        return FPSCache.keys(cloud.unsqueeze(0), npoint, seedIdx, eps)[0]
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".npy")
+
+    def get(self, key):
+        """cached indices (npoint,) int32 or None"""
+        with self._lock:
+            idx = self._entries.get(key)
+            if idx is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return idx
+        if self.cache_dir:
+            try:
+                idx = torch.from_numpy(np.load(self._path(key)))
+            except (OSError, ValueError):
+                idx = None
+            if idx is not None:
+                self._insert(key, idx)
+                with self._lock:
+                    self.disk_hits += 1
+                return idx
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, idx):
+        idx = idx.detach().to("cpu", torch.int32).contiguous()
+        self._insert(key, idx)
+        if self.cache_dir:
+            # write then rename, concurrent readers never see a partial file
+            tmp = "{}.{}.{}.tmp.npy".format(self._path(key)[:-4], os.getpid(), threading.get_ident())
+            try:
+                np.save(tmp, idx.numpy())
+                os.replace(tmp, self._path(key))
+            except OSError:
+                logger.warning("Could not write fps cache entry {}".format(self._path(key)))
+
+    def _insert(self, key, idx):
+        with self._lock:
+            self._entries[key] = idx
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def sample(self, xyz, npoint, seedIdx, eps, fps):
+        """
+        indices of fps(xyz, npoint, seedIdx, eps) for xyz (B, N, 3), only the clouds without
+        cache entry are passed to fps
+        """
+        start = time.perf_counter()
+        keys = self.keys(xyz, npoint, seedIdx, eps)
+        found = [self.get(k) for k in keys]
+        self.lookup_seconds += time.perf_counter() - start
+        missing = [i for i, idx in enumerate(found) if idx is None]
+        if missing:
+            start = time.perf_counter()
+            sub = xyz if len(missing) == len(keys) else xyz[missing]
+            computed = fps(sub.contiguous(), npoint, seedIdx, eps)
+            # one transfer for all the misses, also waits for cuda
+            host = computed.detach().to("cpu", torch.int32)
+            self.compute_seconds += time.perf_counter() - start
+            for j, i in enumerate(missing):
+                # a copy, entries must not keep the whole batch alive
+                found[i] = host[j].clone()
+                self.put(keys[i], found[i])
+            if len(missing) == len(keys):
+                return computed
+        return torch.stack([idx.to(torch.int32) for idx in found]).to(xyz.device)
+
+
+_active = None
+
+
+def enable(maxsize=1024, cache_dir=None):
+    """make furthest_point_sample use a new FPSCache(maxsize, cache_dir) and return it"""
+    global _active
+    _active = FPSCache(maxsize, cache_dir)
+    return _active
+
+
+def disable():
+    global _active
+    _active = None
+
+
+def active():
+    """the cache used by furthest_point_sample or None"""
+    return _active
+
+
+def stats():
+    return _active.stats() if _active is not None else None
+
+
+# PYTORCH_POINTS_FPS_CACHE=1 enables the in-memory cache, any other value is the store directory
+_env = os.environ.get("PYTORCH_POINTS_FPS_CACHE", "")
+if _env not in ("", "0"):
+    enable(int(os.environ.get("PYTORCH_POINTS_FPS_CACHE_SIZE", "1024")), None if _env == "1" else _env)
@@ -1,17 +1,20 @@
 import torch
-import pytorch3d.ops as ops
-from .._ext import sampling
+from ..misc.lazy import LazyModule
 from ..utils.pytorch_utils import check_values, save_grad, saved_variables
-from .operations import batch_svd, normalize, dot_product, scatter_add, cross_product_2D, gather_points
+from . import backends, fps_cache, topology_cache
+from .operations import sampling, knn_points, lengths_to_offsets, batch_svd, batch_eigh3x3, normalize, dot_product, scatter_add, cross_product_2D, gather_points
 import numpy as np
-from scipy import sparse
+
+sparse = LazyModule("scipy.sparse")
+splinalg = LazyModule("scipy.sparse.linalg")
+cholmod = LazyModule("sksparse.cholmod")
 
 PI = 3.1415927
 
 class FurthestPointSampling(torch.autograd.Function):
 
     @staticmethod
-    def forward(ctx, xyz, npoint, seedIdx):
+    def forward(ctx, xyz, npoint, seedIdx, eps=None):
         r"""
         Uses iterative furthest point sampling to select a set of npoint features that have the largest
         minimum distance
@@ -21,14 +24,24 @@ class FurthestPointSampling(torch.autograd.Function):
             (B, N, 3) tensor where N > npoint
         npoint : int32
             number of features in the sampled set
+        eps : float
+            if given, cpu inputs use the grid-pruned sampler which only updates the cells near
+            every new sample; eps=0 is exact, ties go to the smallest index as in the exhaustive
+            cpu scan, eps>0 picks each sample at least (1-eps) times as far from the previous
+            ones as the furthest point. Ignored on gpu (exact sampling)
         Returns
         -------
         torch.LongTensor
             (B, npoint) tensor containing the indices
 
         """
+        xyz = xyz.contiguous()
         B, N, _ = xyz.size()
 
+        if eps is not None and not xyz.is_cuda:
+            idx = sampling.furthest_sampling_grid(npoint, seedIdx, eps, xyz)
+            ctx.mark_non_differentiable(idx)
+            return idx
         idx = torch.empty([B, npoint], dtype=torch.int32, device=xyz.device)
         temp = torch.full([B, N], 1e10, dtype=torch.float32, device=xyz.device)
         sampling.furthest_sampling(
@@ -38,14 +51,34 @@ class FurthestPointSampling(torch.autograd.Function):
         return idx
 
 
-__furthest_point_sample = FurthestPointSampling.apply  # type: ignore
+def _furthest_point_sample_torch(xyz, npoint, seedIdx, eps=None):
+    """reference of FurthestPointSampling, ties go to the smallest index, always exact"""
+    B, N, _ = xyz.shape
+    batch = torch.arange(B, device=xyz.device)
+    idx = torch.empty(B, npoint, dtype=torch.int32, device=xyz.device)
+    temp = torch.full((B, N), 1e10, dtype=xyz.dtype, device=xyz.device)
+    farthest = torch.full((B,), seedIdx, dtype=torch.long, device=xyz.device)
+    for i in range(npoint):
+        idx[:, i] = farthest
+        temp = torch.min(temp, torch.sum((xyz - xyz[batch, farthest].unsqueeze(1))**2, dim=-1))
+        farthest = torch.argmax(temp, dim=-1)
+    return idx
+
+
+backends.register_op("furthest_point_sample", size=lambda xyz, npoint, seedIdx, eps=None: xyz.shape[0]*xyz.shape[1]*npoint)
+backends.register_engine("furthest_point_sample", "ext", FurthestPointSampling.apply, available=backends.module_available(sampling.__name__))
+backends.register_engine("furthest_point_sample", "torch", _furthest_point_sample_torch)
+__furthest_point_sample = backends.dispatcher("furthest_point_sample", FurthestPointSampling.forward.__doc__)
 
 
-def furthest_point_sample(xyz, npoint, NCHW=True, seedIdx=0):
+def furthest_point_sample(xyz, npoint, NCHW=True, seedIdx=0, eps=None):
     """
     :param
         xyz (B, 3, N) or (B, N, 3)
         npoint a constant
+        eps None for the exhaustive sampler, otherwise the tolerance of the grid-pruned sampler
+            (cpu only, eps=0 gives the same samples, see FurthestPointSampling)
+    the indices come from the fps_cache if it is enabled
     :return
         torch.LongTensor
             (B, npoint) tensor containing the indices
@@ -57,13 +90,146 @@ def furthest_point_sample(xyz, npoint, NCHW=True, seedIdx=0):
         xyz = xyz.transpose(2, 1).contiguous()
 
     assert(xyz.size(2) == 3), "furthest sampling is implemented for 3D points"
-    idx = __furthest_point_sample(xyz, npoint, seedIdx)
+    cache = fps_cache.active()
+    if cache is not None:
+        idx = cache.sample(xyz, npoint, seedIdx, eps, __furthest_point_sample)
+    else:
+        idx = __furthest_point_sample(xyz, npoint, seedIdx, eps)
     sampled_pc = gather_points(xyz.transpose(2, 1).contiguous(), idx)
     if not NCHW:
         sampled_pc = sampled_pc.transpose(2, 1).contiguous()
     return idx, sampled_pc
 
 
+def _furthest_point_sample_resume_ext(xyz, idx, temp, start, applied):
+    sampling.furthest_sampling_resume(idx.size(1), start, applied, xyz, temp, idx)
+    return idx, temp
+
+
+def _furthest_point_sample_resume_torch(xyz, idx, temp, start, applied):
+    """reference of sampling.furthest_sampling_resume, fills idx[:, start:] and updates temp in place"""
+    batch = torch.arange(xyz.shape[0], device=xyz.device)
+    farthest = idx[:, applied].long()
+    for j in range(applied+1, idx.size(1)):
+        torch.min(temp, torch.sum((xyz - xyz[batch, farthest].unsqueeze(1))**2, dim=-1), out=temp)
+        if j < start:
+            farthest = idx[:, j].long()
+        else:
+            farthest = torch.argmax(temp, dim=-1)
+            idx[:, j] = farthest
+    return idx, temp
+
+
+# writes into idx and temp, registered without size so that it is never autotuned
+backends.register_op("furthest_point_sample_resume")
+backends.register_engine("furthest_point_sample_resume", "ext", _furthest_point_sample_resume_ext,
+                         available=backends.module_available(sampling.__name__))
+backends.register_engine("furthest_point_sample_resume", "torch", _furthest_point_sample_resume_torch)
+
+
+def resume_furthest_point_sample(xyz, npoint, prefix=None, temp=None, NCHW=True, seedIdx=0):
+    """
+    furthest point sampling that continues from already chosen samples, so that a coarse-to-fine
+    hierarchy (e.g. 512, 2048, 8192 points) costs as much as sampling the finest level once.
+    Chained calls return exactly the indices of a single furthest_point_sample(xyz, npoint, seedIdx=seedIdx).
+        idx1, _, temp = resume_furthest_point_sample(xyz, 512)
+        idx2, _, temp = resume_furthest_point_sample(xyz, 2048, prefix=idx1, temp=temp)
+    :param
+        xyz (B, 3, N) or (B, N, 3)
+        npoint total number of samples including the prefix
+        prefix (B, K) indices of the first samples, None starts at seedIdx
+        temp (B, N) state returned by the call that produced prefix; if None the distances to
+            the prefix are recomputed, which also allows an arbitrary prefix
+    :return
+        torch.IntTensor
+            (B, npoint) indices, idx[:, :K] == prefix
+        torch.FloatTensor
+            (B, npoint, 3) or (B, 3, npoint) point sets
+        torch.FloatTensor
+            (B, N) squared distance of every point to idx[:, :npoint-1], pass it on with idx
+    """
+    assert(xyz.dim() == 3), "input for furthest sampling must be a 3D-tensor, but xyz.size() is {}".format(xyz.size())
+    if NCHW:
+        xyz = xyz.transpose(2, 1)
+    xyz = xyz.contiguous()
+    assert(xyz.size(2) == 3), "furthest sampling is implemented for 3D points"
+    B, N, _ = xyz.shape
+    idx = torch.empty([B, npoint], dtype=torch.int32, device=xyz.device)
+    if prefix is None:
+        assert(temp is None), "temp without the prefix it belongs to"
+        idx[:, 0] = seedIdx
+        start = 1
+    else:
+        start = prefix.size(1)
+        assert(prefix.size(0) == B and 0 < start <= npoint), "prefix must be (B, K) with 0 < K <= npoint"
+        idx[:, :start] = prefix
+    if temp is None:
+        temp = torch.full([B, N], 1e10, dtype=xyz.dtype, device=xyz.device)
+        applied = 0
+    else:
+        assert(temp.shape == (B, N)), "temp must be (B, N)"
+        temp = temp.to(device=xyz.device, dtype=xyz.dtype, copy=True).contiguous()
+        applied = start - 1
+    with torch.no_grad():
+        idx, temp = backends.dispatch("furthest_point_sample_resume", xyz, idx, temp, start, applied)
+    sampled_pc = gather_points(xyz.transpose(2, 1).contiguous(), idx)
+    if not NCHW:
+        sampled_pc = sampled_pc.transpose(2, 1).contiguous()
+    return idx, sampled_pc, temp
+
+
+def _packed_furthest_point_sample_ext(xyz, offsets, sample_offsets, seedIdx):
+    return sampling.furthest_sampling_packed(seedIdx, xyz, offsets, sample_offsets)
+
+
+def _packed_furthest_point_sample_torch(xyz, offsets, sample_offsets, seedIdx):
+    """reference of sampling.furthest_sampling_packed, samples the clouds one by one"""
+    idx = torch.zeros(int(sample_offsets[-1]), dtype=torch.int32, device=xyz.device)
+    offsets, sample_offsets = offsets.tolist(), sample_offsets.tolist()
+    for i in range(len(offsets)-1):
+        if sample_offsets[i+1] > sample_offsets[i]:
+            idx[sample_offsets[i]:sample_offsets[i+1]] = __furthest_point_sample(
+                xyz[None, offsets[i]:offsets[i+1]], sample_offsets[i+1]-sample_offsets[i], seedIdx)[0] + offsets[i]
+    return idx
+
+
+backends.register_op("packed_furthest_point_sample", size=lambda xyz, offsets, sample_offsets, seedIdx:
+                     xyz.shape[0]*int(sample_offsets[-1])//max(offsets.numel()-1, 1))
+backends.register_engine("packed_furthest_point_sample", "ext", _packed_furthest_point_sample_ext,
+                         available=backends.module_available(sampling.__name__), devices=("cpu",))
+backends.register_engine("packed_furthest_point_sample", "torch", _packed_furthest_point_sample_torch)
+
+
+def packed_furthest_point_sample(xyz, lengths, npoint, seedIdx=0):
+    """
+    furthest point sampling of packed clouds, identical to furthest_point_sample on every cloud
+    :param
+        xyz (P, 3) concatenated clouds
+        lengths (B,) number of points per cloud
+        npoint a constant or (B,) number of samples per cloud
+    :return
+        torch.IntTensor
+            (S,) indices into the packed xyz
+        torch.FloatTensor
+            (S, 3) sampled points
+        torch.LongTensor
+            (B,) number of samples per cloud
+    """
+    assert(xyz.dim() == 2 and xyz.size(1) == 3), "packed furthest sampling expects (P, 3) points"
+    xyz = xyz.contiguous()
+    offsets = lengths_to_offsets(lengths)
+    if isinstance(npoint, int):
+        sample_lengths = torch.full((offsets.numel()-1,), npoint, dtype=torch.int64)
+    else:
+        sample_lengths = torch.as_tensor(npoint, dtype=torch.int64).cpu()
+    assert(torch.all(sample_lengths <= offsets[1:]-offsets[:-1])), "more samples than points"
+    assert(torch.all((sample_lengths == 0) | (offsets[1:]-offsets[:-1] > seedIdx))), \
+        "seedIdx {} out of range of a sampled cloud".format(seedIdx)
+    sample_offsets = lengths_to_offsets(sample_lengths)
+    idx = backends.dispatch("packed_furthest_point_sample", xyz, offsets, sample_offsets, seedIdx)
+    return idx, xyz[idx.long()], sample_lengths
+
+
 def normalize_point_batch_to_sphere(pc: torch.Tensor, NCHW=True):
     """
     normalize a batch of point clouds
@@ -109,17 +275,23 @@ def batch_normals(points, base=None, nn_size=20, NCHW=True, idx=None):
     batch_size, M, C = points.shape
     # B,M,k,C
     if idx is None:
-        _, idx, grouped_points = ops.knn_points(points, base, K=nn_size, return_nn=True)
+        _, idx, grouped_points = knn_points(points, base, K=nn_size, return_nn=True)
     else:
         grouped_points = torch.gather(base.unsqueeze(1).expand(-1,M,-1,-1), 2, idx.unsqueeze(-1).expand(-1,-1,-1,C))
     group_center = torch.mean(grouped_points, dim=2, keepdim=True)
     points = grouped_points - group_center
-    allpoints = points.view(-1, nn_size, C).contiguous()
-    # MB,C,k
-    U, S, V = batch_svd(allpoints)
-    # V is MBxCxC, last_u MBxC
-    normals = V[:, :, -1]
-    normals = normals.view(batch_size, M, C)
+    if C == 3:
+        # B,M,3,3 covariance, the normal is the eigenvector of the smallest eigenvalue
+        cov = torch.matmul(points.transpose(-1, -2), points)
+        _, eigvec = batch_eigh3x3(cov)
+        normals = eigvec[..., 0]
+    else:
+        allpoints = points.view(-1, nn_size, C).contiguous()
+        # MB,C,k
+        U, S, V = batch_svd(allpoints)
+        # V is MBxCxC, last_u MBxC
+        normals = V[:, :, -1]
+        normals = normals.view(batch_size, M, C)
     if NCHW:
         normals = normals.transpose(1, 2)
     return normals, idx
@@ -136,7 +308,7 @@ def pointUniformLaplacian(points, knn_idx=None, nn_size=3):
     batch_size, num_points, _ = points.shape
     if knn_idx is None:
         # find neighborhood, (B,N,K,3), (B,N,K)
-        _, knn_idx, group_points = ops.knn_points(points, points, K=nn_size+1, return_nn=True)
+        _, knn_idx, group_points = knn_points(points, points, K=nn_size+1, return_nn=True)
         knn_idx = knn_idx[:, :, 1:]
         group_points = group_points[:, :, 1:, :]
     else:
@@ -157,12 +329,24 @@ class UniformLaplacian(torch.nn.Module):
     uniform laplacian for mesh
     vertex B,N,D
     faces  B,F,L
+    shared_topology: all meshes of the batch share faces[0], a single (N,N) operator is kept and
+                     applied to the whole batch at once with the batch folded into the columns
     """
-    def __init__(self):
+    def __init__(self, shared_topology=False):
         super().__init__()
         self.L = None
+        self.shared_topology = shared_topology
 
     def computeLaplacian(self, V, F):
+        if self.shared_topology:
+            V, F = V[:1], F[:1] if F.dim() == 3 else F
+        batch, nv = V.shape[:2]
+        # the laplacian and the degrees Lii only depend on the connectivity
+        self.L, self.Lii = topology_cache.get("uniform_laplacian", F, lambda: self._laplacian(V, F),
+                                              batch, nv, V.dtype, V.device)
+
+    @staticmethod
+    def _laplacian(V, F):
         batch, nv = V.shape[:2]
         V = V.reshape(-1, V.shape[-1])
         face_deg = F.shape[-1]
@@ -181,8 +365,7 @@ class UniformLaplacian(torch.nn.Module):
         Lii = -torch.sparse.sum(L, dim=[1]).to_dense()
         M = torch.sparse_coo_tensor(torch.arange(nv*batch).unsqueeze(0).expand(2, -1), Lii, size=(nv*batch, nv*batch))
         L = L + M
-        self.L = L
-        self.Lii = Lii
+        return L, Lii
 
     def forward(self, verts, faces=None):
         batch, nv = verts.shape[:2]
@@ -193,11 +376,13 @@ class UniformLaplacian(torch.nn.Module):
             assert(faces is not None)
             self.computeLaplacian(verts, faces)
 
-        if self.L.shape[0] != (verts.shape[0]*verts.shape[1]):
+        if self.L.shape[0] != (verts.shape[0]*verts.shape[1]) or self.shared_topology:
             # during initialization, used a single batch point set
             assert(self.L.shape[0] == verts.shape[1])
-            x = [torch.sparse.mm(self.L, verts[b])/(self.Lii.unsqueeze(-1)+1e-12) for b in range(batch)]
-            x = torch.stack(x, dim=0)
+            # (N,B*D) one product for the whole batch
+            x = torch.sparse.mm(self.L, verts.transpose(0, 1).reshape(nv, -1))
+            x = x / (self.Lii.unsqueeze(-1)+1e-12)
+            x = x.view(nv, batch, -1).transpose(0, 1)
         else:
             x = torch.sparse.mm(self.L, verts.reshape(-1,3))
             x = x / (self.Lii.unsqueeze(-1)+1e-12)
@@ -207,101 +392,62 @@ class UniformLaplacian(torch.nn.Module):
 #############
 ### cotangent laplacian from 3D-coded ###
 #############
-def convert_as(src, trg):
-    src = src.type_as(trg)
-    if src.is_cuda:
-        src = src.cuda(device=trg.get_device())
-
-    src.requires_grad_(trg.requires_grad)
-    return src
-
 class CotLaplacian(torch.nn.Module):
     def __init__(self):
         """
-        Faces is B x F x 3, cuda torch Variabe.
-        Reuse faces.
+        cotangent laplacian as a torch sparse CSR matrix (BN,BN) on the device of the vertices.
+        Faces is B x F x 3, reused until L is reset to None.
+        The sparsity pattern and the map from the per-face cotangents to the CSR values are kept,
+        updateLaplacian recomputes the weights for moved vertices without rebuilding them.
         """
         super().__init__()
         self.L = None
 
     def computeLaplacian(self, V, F):
-        print('Computing the Laplacian!')
-        F_np = F.data.cpu().numpy()
-        F = F.data
-        B,N,_ = V.shape
-        # Compute cotangents
-        C = cotangent(V, F)
-        assert(check_values(C))
-        C_np = C.cpu().numpy()
-        batchC = C_np.reshape(-1, 3)
-        # Adjust face indices to stack:
-        offset = np.arange(0, V.size(0)).reshape(-1, 1, 1) * V.size(1)
-        F_np = F_np + offset
-        batchF = F_np.reshape(-1, 3)
+        B, N, _ = V.shape
+        self._crow, self._col, self._value_index = topology_cache.get(
+            "cotangent_pattern", F, lambda: self._pattern(B, N, F, V.device), B, N, V.device)
+        self._faces = F.to(device=V.device, dtype=torch.long).expand(B, -1, -1)
+        self.updateLaplacian(V)
 
+    @staticmethod
+    def _pattern(B, N, F, device):
+        """CSR row pointers and columns of L, and the index of the values each cotangent is added to"""
+        F = F.to(device=device, dtype=torch.long).expand(B, -1, -1)
+        # Adjust face indices to stack:
+        batchF = (F + torch.arange(B, device=device).view(-1, 1, 1) * N).reshape(-1, 3)
         rows = batchF[:, [1, 2, 0]].reshape(-1) #1,2,0 i.e to vertex 2-3 associate cot(23)
         cols = batchF[:, [2, 0, 1]].reshape(-1) #2,0,1 This works because triangles are oriented ! (otherwise 23 could be associated to more than 1 cot))
-
-        # Final size is BN x BN
+        # every cotangent enters (r,c) and (c,r), and with negative sign the diagonal (r,r) and (c,c)
         BN = B*N
-        L = sparse.csr_matrix((batchC.reshape(-1), (rows, cols)), shape=(BN,BN))
-        L = L + L.T
-        # np.sum on sparse is type 'matrix', so convert to np.array
-        M = sparse.diags(np.array(np.sum(L, 1)).reshape(-1), format='csr')
-        L = L - M
-        # remember this
-        self.L = L
+        keys = torch.cat([rows*BN+cols, cols*BN+rows, rows*(BN+1), cols*(BN+1)])
+        keys, value_index = torch.unique(keys, sorted=True, return_inverse=True)
+        crow = torch.zeros(BN+1, dtype=torch.long, device=device)
+        crow[1:] = torch.cumsum(torch.bincount(keys // BN, minlength=BN), 0)
+        return crow, keys % BN, value_index
+
+    def updateLaplacian(self, V):
+        """recompute the weights of L for the vertices V (B,N,3) with the sparsity pattern of computeLaplacian"""
+        # Compute cotangents
+        C = cotangent(V.detach(), self._faces).reshape(-1)
+        assert(check_values(C))
+        values = torch.zeros(self._col.shape[0], dtype=C.dtype, device=C.device)
+        values.index_add_(0, self._value_index, torch.cat([C, C, -C, -C]))
+        BN = self._crow.shape[0] - 1
+        self.L = torch.sparse_csr_tensor(self._crow, self._col, values, size=(BN, BN))
 
     def forward(self, V, F=None):
         """
-        If forward is explicitly called, V is still a Parameter or Variable
-        But if called through __call__ it's a tensor.
-        This assumes __call__ was used.
-
         Input:
            V: B x N x 3
            F: B x F x 3
         Outputs: L x B x N x 3
-
-        Numpy also doesnt support sparse tensor, so stack along the batch
         """
         if self.L is None:
             assert(F is not None)
             self.computeLaplacian(V, F)
-        Lx = _cotLx(V, self.L)
-        Lx.requires_grad_(V.requires_grad)
-        return Lx
-
-
-class _CotLaplacianBatchLx(torch.autograd.Function):
-    @staticmethod
-    def forward(ctx, V, L):
-        """V: (B,N,3), L: numpy sparse matrix (BN, 3)"""
-        ctx.L = L
-        batchV = V.reshape(-1, 3).cpu().numpy()
-        Lx = L.dot(batchV)
-        Lx = Lx.reshape(V.shape)
-        Lx = convert_as(torch.Tensor(Lx), V)
-        return Lx
-
-    @staticmethod
-    def backward(ctx, grad_out):
-        """
-        Just L'g = Lg
-        Args:
-           grad_out: B x N x 3
-        Returns:
-           grad_vertices: B x N x 3
-        """
-        L = ctx.L
-        sh = grad_out.shape
-        g_o = grad_out.cpu().numpy()
-        # Stack
-        g_o = g_o.reshape(-1, 3)
-        Lg = L.dot(g_o).reshape(sh)
-        return convert_as(torch.Tensor(Lg), grad_out), None
+        return torch.sparse.mm(self.L, V.reshape(-1, V.shape[-1])).view(V.shape)
 
-_cotLx = _CotLaplacianBatchLx.apply  # type: ignore
 
 def cotangent(V, F):
     """
@@ -313,17 +459,12 @@ def cotangent(V, F):
         angles for triangles, columns correspond to edges 23,31,12
     B x F x 3 x 3
     """
-    B, N, _ = V.shape
-    indices_repeat = torch.stack([F, F, F], dim=2).to(device=V.device).expand(B, -1, -1, -1)
-
-    #v1 is the list of first triangles B*F*3, v2 second and v3 third
-    v1 = torch.gather(V, 1, indices_repeat[:, :, :, 0].long())
-    v2 = torch.gather(V, 1, indices_repeat[:, :, :, 1].long())
-    v3 = torch.gather(V, 1, indices_repeat[:, :, :, 2].long())
-
-    l1 = torch.sqrt(((v2 - v3)**2).sum(2)) #distance of edge 2-3 for every face B*F
-    l2 = torch.sqrt(((v3 - v1)**2).sum(2))
-    l3 = torch.sqrt(((v1 - v2)**2).sum(2))
+    B, N, D = V.shape
+    F = F.to(device=V.device, dtype=torch.long).expand(B, -1, -1)
+    # (B,F,3,D) the three corners v1, v2, v3 of every face
+    v = torch.gather(V, 1, F.reshape(B, -1, 1).expand(-1, -1, D)).view(B, -1, 3, D)
+    # distance of the edges 2-3, 3-1, 1-2 for every face B*F
+    l1, l2, l3 = torch.norm(v[:, :, [1, 2, 0]] - v[:, :, [2, 0, 1]], dim=-1).unbind(-1)
 
     # semiperimieters
     sp = (l1 + l2 + l3) * 0.5
@@ -332,8 +473,7 @@ def cotangent(V, F):
     inside_sqrt = sp * (sp-l1)*(sp-l2)*(sp-l3)
     inside_sqrt.masked_fill_(inside_sqrt<0, 0)
     A = 2*torch.sqrt(inside_sqrt)
-    if not check_values(A):
-        import pdb; pdb.set_trace()
+    assert(check_values(A))
 
     # Theoreme d Al Kashi : c2 = a2 + b2 - 2ab cos(angle(ab))
     cot23 = (l2**2 + l3**2 - l1**2)
@@ -346,15 +486,169 @@ def cotangent(V, F):
     return C
 
 
-def mean_value_coordinates_3D(query, vertices, faces, verbose=False):
+class _LaplacianSolve(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, rhs, solver):
+        ctx.solver = solver
+        return solver._solve(rhs)
+
+    @staticmethod
+    def backward(ctx, grad_x):
+        # the system is symmetric, A^-T g = A^-1 g reuses the factorization
+        return ctx.solver._solve(grad_x.contiguous()), None
+
+
+def _pcg(A, diag, b, tol, maxiter):
+    """jacobi preconditioned conjugate gradient for all columns of b (n,K) at once, A sparse (n,n)"""
+    x = torch.zeros_like(b)
+    r = b.clone()
+    z = r / diag.unsqueeze(-1)
+    p = z.clone()
+    rz = (r*z).sum(0)
+    b_norm = b.norm(dim=0)
+    for _ in range(maxiter):
+        if bool((r.norm(dim=0) <= tol*b_norm).all()):
+            break
+        Ap = torch.sparse.mm(A, p)
+        pAp = (p*Ap).sum(0)
+        # converged columns have p = 0, keep them where they are
+        alpha = rz / torch.where(pAp == 0, torch.ones_like(pAp), pAp)
+        x = x + alpha*p
+        r = r - alpha*Ap
+        z = r / diag.unsqueeze(-1)
+        rz_new = (r*z).sum(0)
+        p = z + rz_new / torch.where(rz == 0, torch.ones_like(rz), rz) * p
+        rz = rz_new
+    return x
+
+
+class LaplacianSolver(object):
     """
-    Tao Ju et.al. MVC for 3D triangle meshes
+    solve (I + lam*L) x = b, or L x = b if lam is None, for a fixed laplacian L. The system is
+    factorized once, every right hand side and the backward are then back-substitutions.
+    usage:
+        smooth = LaplacianSolver(uniform.L, lam=0.1)   # or -cot.L of a CotLaplacian
+        x = smooth(b)                        # b (N,D) or (B,N,D)
+        arap = LaplacianSolver(-cot.L, fixed=handles)
+        x = arap(b, x_fixed)                 # x_fixed (C,D) or (B,C,D)
     params:
-        query    (B,P,3)
-        vertices (B,N,3)
-        faces    (B,F,3)
+        L        sparse (N,N) positive semi-definite laplacian, i.e. positive diagonal, or block
+                 diagonal (BN,BN) for a batch of meshes. Its values are treated as constants.
+        lam      weight of the implicit smoothing, None solves with L itself
+        fixed    indices of vertices whose values are given in solve, e.g. ARAP handles. Without
+                 them L x = b is singular and solved with L + eps*mean(diag(L))*I
+        method   "cholmod" (sparse LDL^T of scikit-sparse), "splu" (scipy), "cg" (jacobi preconditioned
+                 conjugate gradient on the device of L), "auto" picks the first available on cpu and
+                 "cg" for cuda
+    """
+    def __init__(self, L, lam=None, fixed=None, method="auto", eps=1e-8, tol=1e-6, maxiter=1000):
+        L = (L if L.layout == torch.sparse_coo else L.to_sparse()).detach().coalesce()
+        n = L.shape[0]
+        device = L.device
+        idx, val = L.indices(), L.values()
+        diag = val[idx[0] == idx[1]]
+        if diag.sum() < 0:
+            raise ValueError("L must be positive semi-definite, pass -L for CotLaplacian")
+        if lam is not None:
+            val, shift = lam*val, 1.0
+        else:
+            shift = 0.0 if fixed is not None else eps*diag.abs().mean().item()
+        eye = torch.arange(n, device=device)
+        A = torch.sparse_coo_tensor(torch.cat([idx, torch.stack([eye, eye])], dim=1),
+                                    torch.cat([val, torch.full((n,), shift, dtype=val.dtype, device=device)]),
+                                    (n, n)).coalesce()
+        self.n = n
+        self.fixed = self.free = None
+        if fixed is not None:
+            # A_ff x_f = b_f - A_fc x_c for the free vertices
+            fixed = torch.as_tensor(fixed, dtype=torch.long, device=device).reshape(-1)
+            is_fixed = torch.zeros(n, dtype=torch.bool, device=device)
+            is_fixed[fixed] = True
+            self.fixed, self.free = fixed, torch.nonzero(~is_fixed).squeeze(-1)
+            remap = torch.full((n,), -1, dtype=torch.long, device=device)
+            remap[self.free] = torch.arange(self.free.shape[0], device=device)
+            remap[fixed] = torch.arange(fixed.shape[0], device=device)
+            (r, c), val = A.indices(), A.values()
+            free_r, free_c = ~is_fixed[r], ~is_fixed[c]
+            ff, fc = free_r & free_c, free_r & ~free_c
+            self._A_fc = torch.sparse_coo_tensor(torch.stack([remap[r[fc]], remap[c[fc]]]), val[fc],
+                                                 (self.free.shape[0], fixed.shape[0])).coalesce().to_sparse_csr()
+            A = torch.sparse_coo_tensor(torch.stack([remap[r[ff]], remap[c[ff]]]), val[ff],
+                                        (self.free.shape[0],)*2).coalesce()
+
+        if method == "auto":
+            if A.is_cuda:
+                method = "cg"
+            elif backends.module_available("sksparse.cholmod")():
+                method = "cholmod"
+            elif backends.module_available("scipy.sparse.linalg")():
+                method = "splu"
+            else:
+                method = "cg"
+        self.method = method
+        if method == "cg":
+            (r, c), val = A.indices(), A.values()
+            self._A = A.to_sparse_csr()
+            self._diag = torch.zeros(A.shape[0], dtype=val.dtype, device=device).index_add_(0, r[r == c], val[r == c])
+            self.tol, self.maxiter = tol, maxiter
+            return
+        (r, c), val = A.cpu().indices().numpy(), A.cpu().values().double().numpy()
+        A = sparse.csc_matrix((val, (r, c)), shape=A.shape)
+        if method == "cholmod":
+            self._factor = cholmod.cholesky(A)
+        elif method == "splu":
+            self._factor = splinalg.splu(A).solve
+        else:
+            raise ValueError("Unknown method {}, expected auto, cholmod, splu or cg".format(method))
+
+    def _solve(self, rhs):
+        """A^-1 rhs for rhs (n,K) of the (reduced) system"""
+        if self.method == "cg":
+            x = _pcg(self._A, self._diag, rhs.to(self._A.dtype), self.tol, self.maxiter)
+            return x.to(rhs.dtype)
+        x = self._factor(rhs.detach().cpu().double().numpy())
+        return torch.from_numpy(x).to(device=rhs.device, dtype=rhs.dtype)
+
+    def _columns(self, t, n):
+        """(n,K) view of t (n,K), (B,n,D) folded into the columns or (B,N,D) stacked to (B*N,D)"""
+        if t.dim() == 2:
+            return t
+        if t.shape[1] == n:
+            return t.transpose(0, 1).reshape(n, -1)
+        return t.reshape(-1, t.shape[-1])
+
+    def solve(self, b, x_fixed=None):
+        """
+        params:
+            b        (N,D) or (B,N,D)
+            x_fixed  (C,D) or (B,C,D) values of the fixed vertices, zero if None
+        return:
+            x        shaped as b
+        """
+        rhs = self._columns(b, self.n)
+        if self.fixed is not None:
+            C = self.fixed.shape[0]
+            x_c = rhs.new_zeros(C, rhs.shape[1]) if x_fixed is None else self._columns(x_fixed, C).to(rhs.dtype)
+            rhs = rhs[self.free] - torch.sparse.mm(self._A_fc.to(rhs.dtype), x_c)
+            x = rhs.new_zeros(self.n, rhs.shape[1]).index_copy(0, self.free, _LaplacianSolve.apply(rhs, self))
+            x = x.index_copy(0, self.fixed, x_c)
+        else:
+            x = _LaplacianSolve.apply(rhs, self)
+        if b.dim() == 3 and b.shape[1] == self.n:
+            return x.view(self.n, b.shape[0], -1).transpose(0, 1)
+        return x.view(b.shape)
+
+    __call__ = solve
+
+
+def _mean_value_face_terms(query, vertices, faces):
+    """
+    per-face part of mean_value_coordinates_3D
     return:
-        wj       (B,P,N)
+        wi              (B,P,F,3) weights of the face vertices, zero for coplanar faces
+        bary            (B,P,F,3) 2D barycentric weights, used if the query lies on the face
+        inside_triangle (B,P,F) query lies on the face
+        dj              (B,P,N,1) distance to the vertices
     """
     B, F, _ = faces.shape
     _, P, _ = query.shape
@@ -427,14 +721,13 @@ def mean_value_coordinates_3D(query, vertices, faces, verbose=False):
     # if π −h < ε, x lies on t, use 2D barycentric coordinates
     # inside triangle
     inside_triangle = (PI-h).squeeze(-1)<1e-4
-    # set all F for this P to zero
-    wi = torch.where(torch.any(inside_triangle, dim=-1, keepdim=True).unsqueeze(-1), torch.zeros_like(wi), wi)
     # CHECK is it di https://www.cse.wustl.edu/~taoju/research/meanvalue.pdf or li http://citeseerx.ist.psu.edu/viewdoc/download?doi=10.1.1.516.1856&rep=rep1&type=pdf
-    wi = torch.where(inside_triangle.unsqueeze(-1).expand(-1,-1,-1,wi.shape[-1]), torch.sin(theta_i)*di[:,:,:,[2,0,1]]*di[:,:,:,[1,2,0]], wi)
+    bary = torch.sin(theta_i)*di[:,:,:,[2,0,1]]*di[:,:,:,[1,2,0]]
+    return wi, bary, inside_triangle, dj
 
-    # sum over all faces face -> vertex (B,P,F*3) -> (B,P,N)
-    wj = scatter_add(wi.reshape(B,P,-1).contiguous(), faces.unsqueeze(1).expand(-1,P,-1,-1).reshape(B,P,-1), 2, out_size=(B,P,N))
 
+def _mean_value_normalize(wj, dj):
+    """snap queries at a vertex to it and normalize wj (B,P,N) to partition of unity"""
     # close to vertex (B,P,N)
     close_to_point = dj.squeeze(-1) < 1e-8
     # set all F for this P to zero
@@ -445,7 +738,31 @@ def mean_value_coordinates_3D(query, vertices, faces, verbose=False):
     sumWj = torch.sum(wj, dim=-1, keepdim=True)
     sumWj = torch.where(sumWj==0, torch.ones_like(sumWj), sumWj)
 
-    wj_normalised = wj / sumWj
+    return wj / sumWj
+
+
+def mean_value_coordinates_3D(query, vertices, faces, verbose=False):
+    """
+    Tao Ju et.al. MVC for 3D triangle meshes
+    params:
+        query    (B,P,3)
+        vertices (B,N,3)
+        faces    (B,F,3)
+    return:
+        wj       (B,P,N)
+    """
+    B, F, _ = faces.shape
+    _, P, _ = query.shape
+    _, N, _ = vertices.shape
+    wi, bary, inside_triangle, dj = _mean_value_face_terms(query, vertices, faces)
+    # set all F for this P to zero
+    wi = torch.where(torch.any(inside_triangle, dim=-1, keepdim=True).unsqueeze(-1), torch.zeros_like(wi), wi)
+    wi = torch.where(inside_triangle.unsqueeze(-1).expand(-1,-1,-1,wi.shape[-1]), bary, wi)
+
+    # sum over all faces face -> vertex (B,P,F*3) -> (B,P,N)
+    wj = scatter_add(wi.reshape(B,P,-1).contiguous(), faces.unsqueeze(1).expand(-1,P,-1,-1).reshape(B,P,-1), 2, out_size=(B,P,N))
+
+    wj_normalised = _mean_value_normalize(wj, dj)
     # if wj.requires_grad:
     #     saved_variables["mvc/wi"] = wi
     #     wi.register_hook(save_grad("mvc/dwi"))
@@ -635,15 +952,27 @@ def green_coordinates_3D(query, vertices, faces, face_normals=None, verbose=Fals
         psi_j    (B,P,F)
         exterior_flag (B,P)
     """
-    B, F, _ = faces.shape
-    _, P, D = query.shape
-    _, N, D = vertices.shape
     # (B,F,D)
     n_t = face_normals
     if n_t is None:
         # compute face normal
         n_t, _ = compute_face_normals_and_areas(vertices, faces)
 
+    GC_vertex, GC_face = _green_face_terms(query, vertices, faces, n_t)
+    GC_vertex, exterior_flag = _green_normalize(GC_vertex)
+    return GC_vertex, GC_face, exterior_flag
+
+
+def _green_face_terms(query, vertices, faces, n_t):
+    """
+    per-face part of green_coordinates_3D
+    return:
+        GC_vertex (B,P,N) unnormalized vertex coordinates, summed over the faces
+        GC_face   (B,P,F)
+    """
+    B, F, _ = faces.shape
+    _, P, D = query.shape
+    _, N, D = vertices.shape
     vertices = vertices.detach()
     # (B,N,D) (B,F,3) -> (B,F,3,3) face points
     v_jl = torch.gather(vertices.unsqueeze(1).expand(-1,F,-1,-1), 2, faces.unsqueeze(-1).expand(-1,-1,-1,3))
@@ -683,16 +1012,18 @@ def green_coordinates_3D(query, vertices, faces, face_normals=None, verbose=Fals
     # NOTE the point is inside the face, remember factor 2
     # insideFace = (torch.norm(omega,dim=-1)<1e-5)&torch.all(s_l>0,dim=-1)
     # phi_jl = torch.where(insideFace.unsqueeze(-1), phi_jl, torch.zeros_like(phi_jl))
+    return GC_vertex, GC_face
+
 
-    # normalize
+def _green_normalize(GC_vertex):
+    """normalize GC_vertex (B,P,N), returns it and the exterior flag (B,P,1)"""
     sumGC_V = torch.sum(GC_vertex, dim=2, keepdim=True)
 
     exterior_flag = sumGC_V<0.5
 
     GC_vertex = GC_vertex/(sumGC_V+1e-10)
     # GC_vertex.masked_fill_(sumGC_V.abs()<eps, 0.0)
-
-    return GC_vertex, GC_face, exterior_flag
+    return GC_vertex, exterior_flag
 
 
 def _gcTriInt(p, v1, v2, x):
@@ -771,6 +1102,372 @@ def _gcTriInt(p, v1, v2, x):
     return myInt
 
 
+def _mean_value_partial(query, vertices, faces, face_normals, N):
+    """sums of the per-face mean value terms over the given faces, see _ChunkedCoordinates"""
+    B, F, _ = faces.shape
+    P = query.shape[1]
+    wi, bary, inside_triangle, _ = _mean_value_face_terms(query, vertices, faces)
+    index = faces.unsqueeze(1).expand(-1,P,-1,-1).reshape(B,P,-1)
+    # weights if the query lies on none of the faces, and the barycentric weights of the faces it lies on
+    wj_out = scatter_add(wi.reshape(B,P,-1).contiguous(), index, 2, out_size=(B,P,N))
+    wi_in = torch.where(inside_triangle.unsqueeze(-1).expand(-1,-1,-1,bary.shape[-1]), bary, torch.zeros_like(bary))
+    wj_in = scatter_add(wi_in.reshape(B,P,-1).contiguous(), index, 2, out_size=(B,P,N))
+    n_inside = torch.sum(inside_triangle, dim=-1, keepdim=True).to(dtype=wj_out.dtype)
+    return (wj_out, wj_in, n_inside), ()
+
+
+def _mean_value_finish(query, vertices, sums, parts):
+    wj_out, wj_in, n_inside = sums
+    wj = torch.where(n_inside > 0, wj_in, wj_out)
+    dj = torch.norm(vertices.unsqueeze(1) - query.unsqueeze(2), dim=-1, p=2, keepdim=True)
+    return (_mean_value_normalize(wj, dj),)
+
+
+def _green_partial(query, vertices, faces, face_normals, N):
+    GC_vertex, GC_face = _green_face_terms(query, vertices, faces, face_normals)
+    return (GC_vertex,), (GC_face,)
+
+
+def _green_finish(query, vertices, sums, parts):
+    GC_vertex, exterior_flag = _green_normalize(sums[0])
+    return GC_vertex, parts[0], exterior_flag
+
+
+def _coordinates_chunk(partial, finish, face_chunk, query, vertices, faces, face_normals):
+    """finish(sum of partial over the face chunks) for one chunk of query points"""
+    N = vertices.shape[1]
+    F = faces.shape[1]
+    sums, parts = None, []
+    for f in range(0, F, face_chunk):
+        s, p = partial(query, vertices, faces[:, f:f+face_chunk],
+                       None if face_normals is None else face_normals[:, f:f+face_chunk], N)
+        sums = list(s) if sums is None else [a + b for a, b in zip(sums, s)]
+        parts.append(p)
+    parts = [torch.cat(p, dim=2) if len(p) > 1 else p[0] for p in zip(*parts)]
+    return finish(query, vertices, sums, parts), sums, parts
+
+
+class _ChunkedCoordinates(torch.autograd.Function):
+    """
+    cage coordinates evaluated in chunks of query points and faces. partial(query, vertices, faces,
+    face_normals, N) returns the terms that are summed over the faces and the per-face outputs,
+    finish(query, vertices, sums, parts) the coordinates. Only the outputs are kept, backward
+    recomputes the intermediates of one chunk at a time.
+    """
+    @staticmethod
+    def forward(ctx, partial, finish, query_chunk, face_chunk, query, vertices, faces, face_normals=None):
+        P = query.shape[1]
+        outputs = []
+        for q in range(0, P, query_chunk):
+            out, _, _ = _coordinates_chunk(partial, finish, face_chunk, query[:, q:q+query_chunk],
+                                           vertices, faces, face_normals)
+            outputs.append(out)
+        outputs = [torch.cat(o, dim=1) if len(o) > 1 else o[0] for o in zip(*outputs)]
+        ctx.chunks = (partial, finish, query_chunk, face_chunk)
+        ctx.save_for_backward(query, vertices, faces, face_normals)
+        ctx.mark_non_differentiable(*[o for o in outputs if not o.is_floating_point()])
+        return tuple(outputs)
+
+    @staticmethod
+    def backward(ctx, *grad_outputs):
+        partial, finish, query_chunk, face_chunk = ctx.chunks
+        query, vertices, faces, face_normals = ctx.saved_tensors
+        P, F = query.shape[1], faces.shape[1]
+        need_query, need_vertices, need_normals = ctx.needs_input_grad[4], ctx.needs_input_grad[5], ctx.needs_input_grad[7]
+        grad_query = torch.zeros_like(query) if need_query else None
+        grad_vertices = torch.zeros_like(vertices) if need_vertices else None
+        grad_normals = torch.zeros_like(face_normals) if need_normals else None
+        vertices = vertices.detach().requires_grad_(need_vertices)
+        normals = None if face_normals is None else face_normals.detach().requires_grad_(need_normals)
+
+        def accumulate(outputs, grads, query_c, q):
+            pairs = [(o, g) for o, g in zip(outputs, grads) if g is not None and o.requires_grad]
+            inputs = [t for t, need in ((query_c, need_query), (vertices, need_vertices), (normals, need_normals)) if need]
+            if not pairs or not inputs:
+                return
+            grads = iter(torch.autograd.grad([o for o, _ in pairs], inputs, [g for _, g in pairs], allow_unused=True))
+            if need_query:
+                g = next(grads)
+                if g is not None:
+                    grad_query[:, q:q+query_chunk] += g
+            if need_vertices:
+                g = next(grads)
+                if g is not None:
+                    grad_vertices.add_(g)
+            if need_normals:
+                g = next(grads)
+                if g is not None:
+                    grad_normals.add_(g)
+
+        for q in range(0, P, query_chunk):
+            query_c = query[:, q:q+query_chunk].detach().requires_grad_(need_query)
+            grads = [None if g is None else g[:, q:q+query_chunk] for g in grad_outputs]
+            if face_chunk >= F:
+                with torch.enable_grad():
+                    outputs, _, _ = _coordinates_chunk(partial, finish, face_chunk, query_c, vertices, faces, normals)
+                accumulate(outputs, grads, query_c, q)
+                continue
+            # several face chunks: backpropagate to the face sums first, then through every face chunk
+            with torch.no_grad():
+                _, sums, parts = _coordinates_chunk(partial, finish, face_chunk, query_c, vertices, faces, normals)
+            sums = [t.detach().requires_grad_(t.is_floating_point()) for t in sums]
+            parts = [t.detach().requires_grad_(t.is_floating_point()) for t in parts]
+            with torch.enable_grad():
+                outputs = finish(query_c, vertices, sums, parts)
+            leaves = [t for t in sums + parts if t.requires_grad]
+            pairs = [(o, g) for o, g in zip(outputs, grads) if g is not None and o.requires_grad]
+            leaf_grads = torch.autograd.grad([o for o, _ in pairs], leaves, [g for _, g in pairs], allow_unused=True)
+            leaf_grads = dict(zip(map(id, leaves), leaf_grads))
+            grad_sums = [leaf_grads.get(id(t)) for t in sums]
+            grad_parts = [leaf_grads.get(id(t)) for t in parts]
+            for f in range(0, F, face_chunk):
+                with torch.enable_grad():
+                    s, p = partial(query_c, vertices, faces[:, f:f+face_chunk],
+                                   None if normals is None else normals[:, f:f+face_chunk], vertices.shape[1])
+                accumulate(list(s) + list(p), grad_sums + [None if g is None else g[:, :, f:f+face_chunk] for g in grad_parts],
+                           query_c, q)
+        return None, None, None, None, grad_query, grad_vertices, None, grad_normals
+
+
+# elements of the intermediates per (query point, face) pair that autograd keeps alive in
+# mean_value_coordinates_3D and green_coordinates_3D, measured with benchmarks.common.peak_memory
+_MVC_PAIR_ELEMENTS = 192
+_GREEN_PAIR_ELEMENTS = 600
+
+
+def _coordinate_chunks(query, faces, pair_elements, memory_budget, face_chunk):
+    B, P, _ = query.shape
+    F = faces.shape[1]
+    face_chunk = F if face_chunk is None else max(1, min(int(face_chunk), F))
+    query_chunk = int(memory_budget // (B * face_chunk * pair_elements * query.element_size()))
+    return max(1, min(P, query_chunk)), face_chunk
+
+
+def chunked_mean_value_coordinates_3D(query, vertices, faces, memory_budget=2**28, face_chunk=None):
+    """
+    mean_value_coordinates_3D in chunks of query points whose intermediates fit in memory_budget
+    bytes, the backward recomputes them chunk by chunk instead of storing them. The result is
+    identical to mean_value_coordinates_3D. face_chunk also splits the faces for cages too large
+    for a single query, the face sums are then added in a different order.
+    params:
+        query    (B,P,3)
+        vertices (B,N,3)
+        faces    (B,F,3)
+    return:
+        wj       (B,P,N)
+    """
+    query_chunk, face_chunk = _coordinate_chunks(query, faces, _MVC_PAIR_ELEMENTS, memory_budget, face_chunk)
+    return _ChunkedCoordinates.apply(_mean_value_partial, _mean_value_finish, query_chunk, face_chunk,
+                                     query, vertices, faces, None)[0]
+
+
+def chunked_green_coordinates_3D(query, vertices, faces, face_normals=None, memory_budget=2**28, face_chunk=None):
+    """
+    green_coordinates_3D in chunks of query points (and faces), see chunked_mean_value_coordinates_3D
+    return:
+        phi_i    (B,P,N)
+        psi_j    (B,P,F)
+        exterior_flag (B,P)
+    """
+    if face_normals is None:
+        face_normals, _ = compute_face_normals_and_areas(vertices, faces)
+    query_chunk, face_chunk = _coordinate_chunks(query, faces, _GREEN_PAIR_ELEMENTS, memory_budget, face_chunk)
+    return _ChunkedCoordinates.apply(_green_partial, _green_finish, query_chunk, face_chunk,
+                                     query, vertices, faces, face_normals)
+
+
+def _block_diagonal_csr(weights):
+    """(B,P,N) dense or sparse COO -> block diagonal sparse CSR (B*P,B*N) of the nonzero weights"""
+    B, P, N = weights.shape
+    weights = weights.to_sparse() if weights.layout == torch.strided else weights.coalesce()
+    b, p, n = weights.indices()
+    indices = torch.stack([b*P+p, b*N+n], dim=0)
+    return torch.sparse_coo_tensor(indices, weights.values(), (B*P, B*N)).coalesce().to_sparse_csr()
+
+
+def truncate_coordinates(weights, topk=None, threshold=None, renormalize=True):
+    """
+    keep per query point only the topk weights of largest magnitude and/or those whose magnitude
+    is at least threshold, the others are set to zero. The kept weights are rescaled to the sum of
+    the original ones (1 for mvc and the vertex green coordinates), unless renormalize is False.
+    params:
+        weights (B,P,N)
+    return:
+        weights (B,P,N)
+    """
+    keep = torch.ones_like(weights, dtype=torch.bool)
+    if topk is not None and topk < weights.shape[-1]:
+        idx = torch.topk(weights.abs(), topk, dim=-1).indices
+        keep = torch.zeros_like(keep).scatter_(-1, idx, True)
+    if threshold is not None:
+        keep = keep & (weights.abs() >= threshold)
+    truncated = torch.where(keep, weights, torch.zeros_like(weights))
+    if renormalize:
+        total = truncated.sum(dim=-1, keepdim=True)
+        scale = weights.sum(dim=-1, keepdim=True) / torch.where(total == 0, torch.ones_like(total), total)
+        truncated = truncated * torch.where(total == 0, torch.ones_like(scale), scale)
+    return truncated
+
+
+def _green_face_scale(rest_cage, cage, faces):
+    """
+    stretch factor s_j of Lipman et.al. that scales the deformed face normals
+    params:
+        rest_cage (B,N,3)
+        cage      (T,N,3), T=B or B=1
+        faces     (B,F,3)
+    return:
+        s_j       (T,F,1)
+    """
+    def edges(v):
+        f = faces.expand(v.shape[0], -1, -1)
+        v0, v1, v2 = [torch.gather(v, 1, f[:, :, i:i+1].expand(-1, -1, 3)) for i in range(3)]
+        return v1 - v0, v2 - v0
+    u, v = edges(rest_cage)
+    u_, v_ = edges(cage)
+    area = torch.norm(torch.cross(u, v, dim=-1), dim=-1, keepdim=True) / 2
+    s = (dot_product(u_, u_, dim=-1, keepdim=True)*dot_product(v, v, dim=-1, keepdim=True)
+         - 2*dot_product(u_, v_, dim=-1, keepdim=True)*dot_product(u, v, dim=-1, keepdim=True)
+         + dot_product(v_, v_, dim=-1, keepdim=True)*dot_product(u, u, dim=-1, keepdim=True))
+    return torch.sqrt(s.clamp(min=0)) / (np.sqrt(8)*area + 1e-10)
+
+
+def _linear_precision(weights, vertices, target):
+    """
+    smallest change of the nonzero weights (B,P,N) after which they sum to 1 and reproduce
+    target (B,P,3) from vertices (B,N,3), i.e. truncated coordinates that still reproduce the
+    identity and affine maps of the cage
+    """
+    mask = (weights != 0).to(weights.dtype)
+    # (B,N,4) rows [1, v_j]
+    a = torch.cat([torch.ones_like(vertices[..., :1]), vertices], dim=-1)
+    # (B,P,4,4) gram matrix of the kept rows
+    gram = torch.bmm(mask, (a.unsqueeze(-1)*a.unsqueeze(-2)).flatten(2)).view(*weights.shape[:2], 4, 4)
+    residual = torch.cat([torch.ones_like(target[..., :1]), target], dim=-1) - torch.bmm(weights, a)
+    lam = torch.matmul(torch.linalg.pinv(gram), residual.unsqueeze(-1)).squeeze(-1)
+    return weights + mask*torch.bmm(lam, a.transpose(1, 2))
+
+
+class CageDeformer(torch.nn.Module):
+    """
+    deform fixed query points with a cage of fixed rest pose and topology. The coordinates of the
+    query points wrt the rest cage are computed once, each deformed cage then costs one matmul
+    (plus one for the face normals of green coordinates).
+    usage:
+        deformer = CageDeformer.precompute(query, rest_cage, faces, method="green")
+        deformer.save("cage.pth")
+        deformer = CageDeformer.load("cage.pth", map_location="cuda")
+        deformed = deformer(cage)  # (T,N,3) -> (T,P,3)
+    params:
+        rest_cage (B,N,3)
+        faces     (B,F,3)
+        phi       (B,P,N) vertex coordinates, or block diagonal sparse CSR (B*P,B*N), optionally
+                  truncated to the topk per query point for large cages
+        psi       (B,P,F) face coordinates of green coordinates, or sparse (B*P,B*F), None for mvc
+        exterior  (B,P,1) exterior_flag of green coordinates
+    """
+    def __init__(self, rest_cage, faces, phi, psi=None, exterior=None):
+        super().__init__()
+        self.register_buffer("rest_cage", rest_cage)
+        self.register_buffer("faces", faces)
+        self.register_buffer("phi", phi)
+        self.register_buffer("psi", psi)
+        self.register_buffer("exterior", exterior)
+
+    @classmethod
+    def precompute(cls, query, rest_cage, faces, method="mvc", sparse=False, topk=None, threshold=None,
+                   memory_budget=2**28):
+        """
+        compute the coordinates of query (B,P,3) wrt rest_cage (B,N,3) with faces (B,F,3)
+        params:
+            method         "mvc" (mean value) or "green"
+            sparse         store the nonzero coordinates as sparse CSR matrices, computed and
+                           converted in blocks of query points so the dense (B,P,N) never exists
+            topk           keep the topk vertex (and face) coordinates per query point
+            threshold      keep the coordinates of magnitude above threshold, see truncate_coordinates.
+                           The kept vertex coordinates are adjusted to sum to 1 and reproduce the
+                           query points on the rest cage, the face coordinates are kept as they are
+            memory_budget  bytes of intermediates, see chunked_mean_value_coordinates_3D
+        """
+        if method not in ("mvc", "green"):
+            raise ValueError("Unknown cage coordinates {}, expected mvc or green".format(method))
+        B, P, _ = query.shape
+        K = rest_cage.shape[1] + (faces.shape[1] if method == "green" else 0)
+        block = max(1, memory_budget // (B*K*query.element_size())) if sparse else P
+        phi, psi, exterior = [], [], []
+        with torch.no_grad():
+            normals, _ = compute_face_normals_and_areas(rest_cage, faces)
+            for start in range(0, P, block):
+                q = query[:, start:start+block]
+                if method == "mvc":
+                    coords = (chunked_mean_value_coordinates_3D(q, rest_cage, faces, memory_budget=memory_budget),)
+                else:
+                    coords = chunked_green_coordinates_3D(q, rest_cage, faces, memory_budget=memory_budget)
+                coords = list(coords)
+                if topk is not None or threshold is not None:
+                    # truncated vertex coordinates are corrected to reproduce the rest pose
+                    target = q
+                    coords[0] = truncate_coordinates(coords[0], topk, threshold, renormalize=False)
+                    if method == "green":
+                        coords[1] = truncate_coordinates(coords[1], topk, threshold, renormalize=False)
+                        target = q - torch.bmm(coords[1], normals)
+                    coords[0] = _linear_precision(coords[0], rest_cage, target)
+                if sparse:
+                    coords[:2] = [c.to_sparse() for c in coords[:2]]
+                for out, c in zip((phi, psi, exterior), coords):
+                    out.append(c)
+        phi = torch.cat(phi, dim=1)
+        psi = torch.cat(psi, dim=1) if psi else None
+        exterior = torch.cat(exterior, dim=1) if exterior else None
+        if sparse:
+            phi = _block_diagonal_csr(phi)
+            psi = _block_diagonal_csr(psi) if psi is not None else None
+        return cls(rest_cage.detach(), faces, phi, psi, exterior)
+
+    @property
+    def is_sparse(self):
+        return self.phi.layout != torch.strided
+
+    @property
+    def num_points(self):
+        return self.phi.shape[0] // self.rest_cage.shape[0] if self.is_sparse else self.phi.shape[1]
+
+    def save(self, path):
+        torch.save({"rest_cage": self.rest_cage, "faces": self.faces, "phi": self.phi,
+                    "psi": self.psi, "exterior": self.exterior}, path)
+
+    @classmethod
+    def load(cls, path, map_location=None):
+        return cls(**torch.load(path, map_location=map_location))
+
+    def _product(self, weights, values):
+        """weights (B,P,K) or sparse (B*P,B*K), values (T,K,D), T=B or B=1 -> (T,P,D)"""
+        B, P = self.rest_cage.shape[0], self.num_points
+        T, K, D = values.shape
+        if B == 1:
+            # the frames share the weights, fold them into the columns of a single product
+            weights = weights if self.is_sparse else weights[0]
+            out = weights @ values.transpose(0, 1).reshape(K, T*D)
+            return out.view(P, T, D).transpose(0, 1)
+        assert(T == B), "cage batch {} does not match the precomputed batch {}".format(T, B)
+        if self.is_sparse:
+            return (weights @ values.reshape(B*K, D)).view(B, P, D)
+        return torch.bmm(weights, values)
+
+    def forward(self, cage):
+        """
+        params:
+            cage  (T,N,3) deformed cages, T equals the precomputed batch or any T if it was 1
+        return:
+            deformed query points (T,P,3)
+        """
+        deformed = self._product(self.phi, cage)
+        if self.psi is not None:
+            normals, _ = compute_face_normals_and_areas(cage, self.faces.expand(cage.shape[0], -1, -1))
+            normals = normals * _green_face_scale(self.rest_cage, cage, self.faces)
+            deformed = deformed + self._product(self.psi, normals)
+        return deformed
+
 
 def dihedral_angle(vertices: torch.Tensor, edge_points: torch.Tensor):
     """
@@ -1,7 +1,6 @@
 import torch
 import torch.nn as nn
-import pytorch3d.ops as ops
-from .operations import gather_points
+from .operations import gather_points, knn_points
 from .geo_operations import furthest_point_sample
 from typing import List
 
@@ -49,7 +48,7 @@ class DenseEdgeConv(nn.Module):
         """
         if idx is None:
             # BCN(K+1), BN(K+1)
-            _, idx, knn_point = ops.knn_points(x.transpose(1,2), x.transpose(1,2), K=k+1, return_nn=True)
+            _, idx, knn_point = knn_points(x.transpose(1,2), x.transpose(1,2), K=k+1, return_nn=True)
             idx = idx[:, :, 1:]
             knn_point = knn_point.permute(0, 2, 3, 1)
             knn_point = knn_point[:, :, :, 1:]
@@ -96,7 +95,7 @@ class SampledDenseEdgeConv(DenseEdgeConv):
         """
         if idx is None:
             # BCN(K+1), BN(K+1)
-            idx, knn_point = ops.knn_points(query.transpose(1, 2), x.transpose(1, 2), K=k + 1, return_nn=True)
+            _, idx, knn_point = knn_points(query.transpose(1, 2), x.transpose(1, 2), K=k + 1, return_nn=True)
             idx = idx[:, :, 1:]
             knn_point = knn_point.permute(0, 2, 3, 1)
             knn_point = knn_point[:, :, :, 1:]
@@ -112,7 +111,7 @@ class SampledDenseEdgeConv(DenseEdgeConv):
         if nsample == 1:
             sampled_idx = None
             sampled_xyz = torch.mean(xyz, dim=-1, keepdim=True)
-            _, sampled_idx, sampled_xyz = ops.knn_points(sampled_xyz.transpose(1,2), xyz.transpose(1,2), return_nn=True)
+            _, sampled_idx, sampled_xyz = knn_points(sampled_xyz.transpose(1,2), xyz.transpose(1,2), return_nn=True)
             sampled_xyz = sampled_xyz.squeeze(2)
             sampled_idx = sampled_idx.squeeze(1)
         else:
@@ -1,8 +1,12 @@
 import torch
-import pytorch3d.ops as ops
 import numpy as np
-from .._ext import losses
+from ..misc.lazy import LazyModule
+from . import backends, topology_cache
 from . import geo_operations as geo_op
+from .operations import knn_points, lengths_to_offsets
+
+losses = LazyModule(".._ext.losses", __package__)
+spatial = LazyModule("scipy.spatial")
 
 
 class UniformLaplacianSmoothnessLoss(torch.nn.Module):
@@ -117,7 +121,7 @@ class PointEdgeLengthLoss(torch.nn.Module):
         point2: (B,N,D) pred points, uses connectivity of point1
         """
         # find neighborhood, (B,N,K,3), (B,N,K)
-        _, knn_idx, group_points = ops.knn_points(points_ref, points_ref, K=self.nn_size+1, return_nn=True)
+        _, knn_idx, group_points = knn_points(points_ref, points_ref, K=self.nn_size+1, return_nn=True)
         knn_idx = knn_idx[:, :, 1:]
         group_points= group_points[:,:,1:,:]
         dist_ref = torch.norm(group_points - points_ref.unsqueeze(2), dim=-1, p=2)
@@ -144,7 +148,7 @@ class PointStretchLoss(torch.nn.Module):
         point2: (B,N,D) pred points, uses connectivity of point1
         """
         # find neighborhood, (B,N,K,3), (B,N,K), (B,N,K)
-        _, knn_idx, group_points_ref = ops.knn_points(points_ref, points_ref, K=self.nn_size+1, return_nn=True)
+        _, knn_idx, group_points_ref = knn_points(points_ref, points_ref, K=self.nn_size+1, return_nn=True)
         knn_idx = knn_idx[:, :, 1:]
         group_points_ref = group_points_ref[:,:,1:,:]
         dist_ref = torch.norm(group_points_ref - points_ref.unsqueeze(2), dim=-1, p=2)
@@ -176,12 +180,8 @@ class MeshEdgeLengthLoss(torch.nn.Module):
 
     @staticmethod
     def getEV(faces, n_vertices):
-        """return a list of B (E, 2) int64 tensor"""
-        B, F, _ = faces.shape
-        EV = []
-        for b in range(B):
-            EV.append(geo_op.edge_vertex_indices(faces[b]))
-        return EV
+        """return a list of B (E, 2) int64 tensor, shared through the topology cache"""
+        return topology_cache.get("edges", faces, lambda: [geo_op.edge_vertex_indices(f) for f in faces], faces.device)
 
     def forward(self, vert1, vert2, face=None):
         """
@@ -228,12 +228,8 @@ class MeshStretchLoss(torch.nn.Module):
 
     @staticmethod
     def getEV(faces, n_vertices):
-        """return a list of B (E, 2) int64 tensor"""
-        B, F, _ = faces.shape
-        EV = []
-        for b in range(B):
-            EV.append(geo_op.edge_vertex_indices(faces[b]))
-        return EV
+        """return a list of B (E, 2) int64 tensor, shared through the topology cache"""
+        return topology_cache.get("edges", faces, lambda: [geo_op.edge_vertex_indices(f) for f in faces], faces.device)
 
     def forward(self, vert1, vert2, face=None):
         assert(vert1.shape == vert2.shape)
@@ -375,13 +371,13 @@ class SimplePointRepulsionLoss(torch.nn.Module):
     def forward(self, points, knn_idx=None):
         batchSize, PN, _ = points.shape
         if knn_idx is None:
-            distance2, knn_idx, knn_points=ops.knn_points(points, points, K=self.nn_size+1, return_nn=True)
-            knn_points = knn_points[:, :, 1:, :].contiguous().detach()
+            distance2, knn_idx, knn_point = knn_points(points, points, K=self.nn_size+1, return_nn=True)
+            knn_point = knn_point[:, :, 1:, :].contiguous().detach()
             knn_idx = knn_idx[:, :, 1:].contiguous()
         else:
-            knn_points = torch.gather(points.unsqueeze(1).expand(-1, PN, -1, -1), 2, knn_idx.unsqueeze(-1).expand(-1, -1, -1, points.shape[-1]))
+            knn_point = torch.gather(points.unsqueeze(1).expand(-1, PN, -1, -1), 2, knn_idx.unsqueeze(-1).expand(-1, -1, -1, points.shape[-1]))
 
-        knn_v = knn_points - points.unsqueeze(dim=2)
+        knn_v = knn_point - points.unsqueeze(dim=2)
         distance2 = torch.sum(knn_v * knn_v, dim=-1)
         loss = 1/torch.sqrt(distance2+1e-4)
         loss = torch.where(distance2 < self.radius2, loss, torch.zeros_like(loss))
@@ -409,16 +405,11 @@ class NmDistanceFunction(torch.autograd.Function):
         batchsize, n, _ = xyz1.size()
         _, m, _ = xyz2.size()
         assert(xyz1.dtype==xyz2.dtype)
-        dist1 = torch.zeros(batchsize, n, dtype=xyz1.dtype)
-        dist2 = torch.zeros(batchsize, m, dtype=xyz1.dtype)
+        dist1 = torch.zeros(batchsize, n, dtype=xyz1.dtype, device=xyz1.device)
+        dist2 = torch.zeros(batchsize, m, dtype=xyz1.dtype, device=xyz1.device)
 
-        idx1 = torch.zeros(batchsize, n).type(torch.IntTensor)
-        idx2 = torch.zeros(batchsize, m).type(torch.IntTensor)
-
-        dist1 = dist1.cuda()
-        dist2 = dist2.cuda()
-        idx1 = idx1.cuda()
-        idx2 = idx2.cuda()
+        idx1 = torch.zeros(batchsize, n, dtype=torch.int32, device=xyz1.device)
+        idx2 = torch.zeros(batchsize, m, dtype=torch.int32, device=xyz1.device)
         losses.nmdistance_forward(xyz1, xyz2, dist1, dist2, idx1, idx2)
         ctx.save_for_backward(xyz1, xyz2, idx1, idx2)
         ctx.mark_non_differentiable(idx1, idx2)
@@ -432,35 +423,432 @@ class NmDistanceFunction(torch.autograd.Function):
 
         gradxyz1 = torch.zeros_like(xyz1)
         gradxyz2 = torch.zeros_like(xyz2)
-
-        gradxyz1 = gradxyz1.cuda()
-        gradxyz2 = gradxyz2.cuda()
         losses.nmdistance_backward(xyz1, xyz2, gradxyz1, gradxyz2, graddist1, graddist2, idx1, idx2)
         return gradxyz1, gradxyz2
 
 
-nndistance = NmDistanceFunction.apply  # type: ignore
+def _nndistance_torch(xyz1, xyz2):
+    """reference of NmDistanceFunction"""
+    dist = torch.cdist(xyz1, xyz2, compute_mode="donot_use_mm_for_euclid_dist")**2
+    dist1, idx1 = torch.min(dist, dim=2)
+    dist2, idx2 = torch.min(dist, dim=1)
+    return dist1, dist2, idx1.to(dtype=torch.int32), idx2.to(dtype=torch.int32)
+
+
+backends.register_op("nndistance", size=lambda xyz1, xyz2: xyz1.shape[0]*xyz1.shape[1]*xyz2.shape[1])
+backends.register_engine("nndistance", "ext", NmDistanceFunction.apply, available=backends.module_available(losses.__name__))
+backends.register_engine("nndistance", "torch", _nndistance_torch)
+nndistance = backends.dispatcher("nndistance", NmDistanceFunction.__doc__)
+
+
+class PackedNmDistanceFunction(torch.autograd.Function):
+    """
+    3D point set to 3D point set distance of packed clouds, identical to nndistance on every cloud
+    xyz1 (P1, 3), lengths1 (B,), xyz2 (P2, 3), lengths2 (B,) -> dist1 (P1,), dist2 (P2,), idx1 (P1,), idx2 (P2,)
+    the indices are global (into the packed xyz2 resp. xyz1), -1 if the other cloud is empty
+    """
+    @staticmethod
+    def forward(ctx, xyz1, lengths1, xyz2, lengths2):
+        xyz1 = xyz1.contiguous()
+        xyz2 = xyz2.contiguous()
+        assert(xyz1.dtype==xyz2.dtype)
+        offsets1 = lengths_to_offsets(lengths1)
+        offsets2 = lengths_to_offsets(lengths2)
+        assert(offsets1.numel() == offsets2.numel())
+        dist1 = torch.zeros(xyz1.shape[0], dtype=xyz1.dtype, device=xyz1.device)
+        dist2 = torch.zeros(xyz2.shape[0], dtype=xyz1.dtype, device=xyz1.device)
+        idx1 = torch.full((xyz1.shape[0],), -1, dtype=torch.int32, device=xyz1.device)
+        idx2 = torch.full((xyz2.shape[0],), -1, dtype=torch.int32, device=xyz1.device)
+        if not xyz1.is_cuda:
+            losses.nmdistance_packed_forward(xyz1, offsets1, xyz2, offsets2, dist1, dist2, idx1, idx2)
+        else:
+            # cuda clouds are processed one by one without padding
+            offsets1, offsets2 = offsets1.tolist(), offsets2.tolist()
+            for i in range(len(offsets1)-1):
+                s1, e1, s2, e2 = offsets1[i], offsets1[i+1], offsets2[i], offsets2[i+1]
+                if e1 == s1 or e2 == s2:
+                    continue
+                d1, d2 = dist1[None, s1:e1], dist2[None, s2:e2]
+                i1 = torch.zeros(1, e1-s1, dtype=torch.int32, device=xyz1.device)
+                i2 = torch.zeros(1, e2-s2, dtype=torch.int32, device=xyz1.device)
+                losses.nmdistance_forward(xyz1[None, s1:e1], xyz2[None, s2:e2], d1, d2, i1, i2)
+                idx1[s1:e1] = i1[0] + s2
+                idx2[s2:e2] = i2[0] + s1
+        ctx.save_for_backward(xyz1, xyz2, idx1, idx2)
+        ctx.mark_non_differentiable(idx1, idx2)
+        return dist1, dist2, idx1, idx2
+
+    @staticmethod
+    def backward(ctx, graddist1, graddist2, gradNone1, gradNone2):
+        xyz1, xyz2, idx1, idx2 = ctx.saved_tensors
+        # the indices are global, hence the packed clouds form a single batch
+        gradxyz1 = torch.zeros_like(xyz1)
+        gradxyz2 = torch.zeros_like(xyz2)
+        losses.nmdistance_backward(xyz1[None], xyz2[None], gradxyz1[None], gradxyz2[None],
+                                   graddist1.contiguous()[None], graddist2.contiguous()[None], idx1[None], idx2[None])
+        return gradxyz1, None, gradxyz2, None
+
+
+packed_nndistance = PackedNmDistanceFunction.apply  # type: ignore
+
+
+def coverage_radius(points, samples, NCHW=True):
+    """
+    largest distance of a point to its closest sample, the quantity FPS greedily minimizes
+    :param
+        points (B, 3, N) or (B, N, 3)
+        samples (B, 3, M) or (B, M, 3)
+    :return
+        (B,) coverage radius
+    """
+    if NCHW:
+        points = points.transpose(2, 1)
+        samples = samples.transpose(2, 1)
+    dist1, _, _, _ = nndistance(points.contiguous(), samples.contiguous())
+    return torch.sqrt(torch.max(dist1, dim=-1)[0])
+
+
+def _chamfer_tiles(xyz1, xyz2, tile, threshold=None, per_point=False):
+    """
+    one pass of nndistance over tiles of xyz1, the nearest distances of xyz2 are kept as a running
+    minimum, hence the working set is a tile plus one value per point of xyz2
+    """
+    B, N, _ = xyz1.shape
+    M = xyz2.shape[1]
+    sum1 = xyz1.new_zeros(B)
+    max1 = xyz1.new_full((B,), -1)
+    argmax1 = torch.zeros(B, dtype=torch.long, device=xyz1.device)
+    hit1 = torch.zeros(B, dtype=torch.long, device=xyz1.device)
+    dist2 = xyz1.new_full((B, M), float("inf"))
+    dist1_tiles, idx1_tiles = [], []
+    idx2 = torch.zeros(B, M, dtype=torch.int32, device=xyz1.device) if per_point else None
+    for start in range(0, N, tile):
+        d1, d2, i1, i2 = nndistance(xyz1[:, start:start+tile].contiguous(), xyz2)
+        sum1 += d1.sum(dim=-1)
+        m, a = d1.max(dim=-1)
+        further = m > max1
+        max1 = torch.where(further, m, max1)
+        argmax1 = torch.where(further, a + start, argmax1)
+        if threshold is not None:
+            hit1 += (d1 < threshold**2).sum(dim=-1)
+        if per_point:
+            dist1_tiles.append(d1)
+            idx1_tiles.append(i1)
+            idx2 = torch.where(d2 < dist2, i2 + start, idx2)
+        dist2 = torch.min(dist2, d2)
+    max2, argmax2 = dist2.max(dim=-1)
+    hit2 = (dist2 < threshold**2).sum(dim=-1) if threshold is not None else torch.zeros_like(hit1)
+    stats = (sum1, dist2.sum(dim=-1), max1, max2, hit1, hit2, argmax1, argmax2)
+    if per_point:
+        return stats, (torch.cat(dist1_tiles, dim=1), dist2, torch.cat(idx1_tiles, dim=1), idx2)
+    return stats, None
+
+
+def _add_nn_grad(query, ref, weight, grad_query, grad_ref, tile):
+    """
+    adds the gradient of sum_i weight * |query_i - nn(query_i)|^2, weight (B,), tile by tile,
+    the neighbors come from nndistance as in the forward, so ties resolve to the same points
+    """
+    B = query.shape[0]
+    for start in range(0, query.shape[1], tile):
+        q = query[:, start:start+tile].contiguous()
+        _, _, idx, _ = nndistance(q, ref)
+        idx = idx.long().unsqueeze(-1).expand(-1, -1, 3)
+        g = 2 * weight.view(B, 1, 1) * (q - torch.gather(ref, 1, idx))
+        grad_query[:, start:start+tile] += g
+        grad_ref.scatter_add_(1, idx, -g)
+
+
+def _add_single_nn_grad(points, i, ref, weight, grad_points, grad_ref, tile):
+    """_add_nn_grad of the single query points[b, i[b]]"""
+    index = i.view(-1, 1, 1).expand(-1, 1, 3)
+    grad = torch.zeros_like(index, dtype=points.dtype)
+    _add_nn_grad(torch.gather(points, 1, index), ref, weight, grad, grad_ref, tile)
+    grad_points.scatter_add_(1, index, grad)
+
+
+class ChunkedNmDistanceFunction(torch.autograd.Function):
+    """
+    reduced 3D point set to 3D point set distance, xyz1 (B, N, 3) and xyz2 (B, M, 3) are compared
+    over tiles of xyz1, nothing per point is kept for the backward which recomputes the neighbors.
+    Returns per batch the sums and maxima of dist1 and dist2 (squared distances) and the number of
+    points of xyz1 resp. xyz2 closer than threshold to the other set (zero without threshold).
+    With per_point the full dist1, dist2, idx1, idx2 follow (not differentiable).
+    """
+    @staticmethod
+    def forward(ctx, xyz1, xyz2, tile, threshold=None, per_point=False):
+        xyz1 = xyz1.contiguous()
+        xyz2 = xyz2.contiguous()
+        assert(xyz1.dtype==xyz2.dtype)
+        assert(xyz1.shape[1] > 0 and xyz2.shape[1] > 0), "chamfer distance of an empty set"
+        stats, points = _chamfer_tiles(xyz1, xyz2, tile, threshold, per_point)
+        sum1, sum2, max1, max2, hit1, hit2, argmax1, argmax2 = stats
+        ctx.save_for_backward(xyz1, xyz2, argmax1, argmax2)
+        ctx.tile = tile
+        # the passes over xyz2 build (B, tile2, N) matrices, tile bounds (B, tile, M)
+        ctx.tile2 = max(1, tile * xyz2.shape[1] // xyz1.shape[1])
+        ctx.mark_non_differentiable(hit1, hit2)
+        if points is None:
+            return sum1, sum2, max1, max2, hit1, hit2
+        ctx.mark_non_differentiable(*points)
+        return (sum1, sum2, max1, max2, hit1, hit2) + points
+
+    @staticmethod
+    def backward(ctx, gradsum1, gradsum2, gradmax1, gradmax2, *gradNone):
+        xyz1, xyz2, argmax1, argmax2 = ctx.saved_tensors
+        gradxyz1 = torch.zeros_like(xyz1)
+        gradxyz2 = torch.zeros_like(xyz2)
+        with torch.no_grad():
+            if torch.any(gradsum1 != 0):
+                _add_nn_grad(xyz1, xyz2, gradsum1, gradxyz1, gradxyz2, ctx.tile)
+            if torch.any(gradsum2 != 0):
+                _add_nn_grad(xyz2, xyz1, gradsum2, gradxyz2, gradxyz1, ctx.tile2)
+            if torch.any(gradmax1 != 0):
+                _add_single_nn_grad(xyz1, argmax1, xyz2, gradmax1, gradxyz1, gradxyz2, ctx.tile)
+            if torch.any(gradmax2 != 0):
+                _add_single_nn_grad(xyz2, argmax2, xyz1, gradmax2, gradxyz2, gradxyz1, ctx.tile2)
+        return gradxyz1, gradxyz2, None, None, None
+
+
+def chunked_chamfer(xyz1, xyz2, reductions=("mean",), threshold=None, memory_budget=2**28, return_per_point=False):
+    """
+    chamfer distance of large clouds under a memory budget, the reductions come from a single pass
+    over tiles of xyz1 without per-point outputs
+    :param
+        xyz1 (B, N, 3), xyz2 (B, M, 3)
+        reductions subset of
+            "mean"   mean(dist1) + mean(dist2) of the squared distances
+            "sum"    sum(dist1) + sum(dist2)
+            "max"    Hausdorff distance (not squared)
+            "fscore" F-score at threshold, also returns "precision" (xyz1 within threshold of xyz2)
+                     and "recall" (xyz2 within threshold of xyz1), not differentiable
+        memory_budget bytes for the distances of a tile, bounds the (B, tile, M) matrix of the
+            torch engine, the extension needs less
+        return_per_point also return dist1, dist2, idx1, idx2 as nndistance (not differentiable)
+    :return
+        dict of (B,) tensors
+    """
+    assert(xyz1.dim() == 3 and xyz2.dim() == 3)
+    if "fscore" in reductions:
+        assert(threshold is not None), "fscore needs a threshold"
+    B, N, _ = xyz1.shape
+    M = xyz2.shape[1]
+    tile = max(1, int(memory_budget) // (xyz1.element_size() * B * M))
+    outputs = ChunkedNmDistanceFunction.apply(xyz1, xyz2, tile, threshold, return_per_point)
+    sum1, sum2, max1, max2, hit1, hit2 = outputs[:6]
+    result = {}
+    for r in reductions:
+        if r == "mean":
+            result[r] = sum1 / N + sum2 / M
+        elif r == "sum":
+            result[r] = sum1 + sum2
+        elif r == "max":
+            result[r] = torch.sqrt(torch.max(max1, max2))
+        elif r == "fscore":
+            precision = hit1.to(xyz1.dtype) / N
+            recall = hit2.to(xyz1.dtype) / M
+            result["precision"], result["recall"] = precision, recall
+            result[r] = torch.where(precision + recall > 0, 2 * precision * recall / (precision + recall), torch.zeros_like(precision))
+        else:
+            raise ValueError("unknown reduction {}".format(r))
+    if return_per_point:
+        result.update(zip(("dist1", "dist2", "idx1", "idx2"), outputs[6:]))
+    return result
+
+
+def _wasserstein_1d(u, v, p=2):
+    """
+    p-th power of the Wasserstein distance of the uniform 1D distributions u (..., N) and v (..., M),
+    computed exactly from the sorted values on the merged quantile grid
+    """
+    N, M = u.shape[-1], v.shape[-1]
+    u = torch.sort(u, dim=-1)[0]
+    v = torch.sort(v, dim=-1)[0]
+    if N == M:
+        return torch.mean(torch.abs(u - v)**p, dim=-1)
+    levels = torch.sort(torch.cat([torch.arange(1, N+1, dtype=u.dtype, device=u.device) / N,
+                                   torch.arange(1, M+1, dtype=u.dtype, device=u.device) / M]))[0]
+    widths = levels - torch.cat([levels.new_zeros(1), levels[:-1]])
+    middle = levels - widths / 2
+    iu = torch.clamp((middle * N).long(), max=N-1)
+    iv = torch.clamp((middle * M).long(), max=M-1)
+    return torch.sum(torch.abs(u[..., iu] - v[..., iv])**p * widths, dim=-1)
+
+
+def sliced_wasserstein(xyz1, xyz2, n_projections=64, p=2, generator=None):
+    """
+    sliced Wasserstein distance, an approximate EMD that projects both clouds onto random
+    directions and matches the sorted projections, O(N log N) per projection
+    :param
+        xyz1 (B, N, 3), xyz2 (B, M, 3), N and M may differ
+        generator torch.Generator for the directions, pass a seeded one for a deterministic loss
+    :return
+        (B,) mean over the projections of W_p^p
+    """
+    dim = xyz1.shape[-1]
+    directions = torch.randn(n_projections, dim, generator=generator, dtype=xyz1.dtype,
+                             device=generator.device if generator is not None else "cpu").to(xyz1.device)
+    directions = directions / torch.norm(directions, dim=-1, keepdim=True)
+    # (B, n_projections, N)
+    proj1 = torch.matmul(directions, xyz1.transpose(1, 2))
+    proj2 = torch.matmul(directions, xyz2.transpose(1, 2))
+    return torch.mean(_wasserstein_1d(proj1, proj2, p), dim=-1)
+
+
+def sinkhorn(xyz1, xyz2, eps=1e-3, max_iters=200, tol=1e-3, p=2):
+    """
+    entropic optimal transport between the uniform clouds xyz1 (B, N, 3) and xyz2 (B, M, 3) with
+    log-domain Sinkhorn iterations, cost |x - y|^p. The potentials are found without gradient,
+    the gradient is that of <P, C> with the optimal plan P held fixed (envelope theorem).
+    Memory and time are O(N M) per iteration, meant for moderate sizes.
+    :return
+        (B,) transport cost, approaches W_p^p for eps -> 0
+    """
+    B, N, _ = xyz1.shape
+    M = xyz2.shape[1]
+    cost = torch.cdist(xyz1, xyz2)**p
+    log_a = -np.log(N)
+    log_b = -np.log(M)
+    with torch.no_grad():
+        c = cost.detach()
+        f = c.new_zeros(B, N)
+        g = c.new_zeros(B, M)
+        # eps-scaling: start at the scale of the cost and halve the temperature every iteration
+        eps_k = max(float(c.max()), eps)
+        kernel = -c / eps_k
+        for it in range(max_iters):
+            f = -eps_k * torch.logsumexp(kernel + (g / eps_k + log_b).unsqueeze(1), dim=2)
+            g = -eps_k * torch.logsumexp(kernel + (f / eps_k + log_a).unsqueeze(2), dim=1)
+            if eps_k > eps:
+                eps_k = max(eps_k / 2, eps)
+                kernel = -c / eps_k
+                continue
+            if it % 10 != 9:
+                continue
+            # after the g update the columns are exact, check the rows
+            row = torch.exp(torch.logsumexp(kernel + (f / eps + log_a).unsqueeze(2) + (g / eps + log_b).unsqueeze(1), dim=2))
+            if torch.max(torch.abs(row * N - 1)) < tol:
+                break
+        plan = torch.exp((f.unsqueeze(2) + g.unsqueeze(1) - c) / eps + log_a + log_b)
+    return torch.sum(plan * cost, dim=(1, 2))
+
+
+class ChamferTarget(object):
+    """
+    nndistance(pred, target) against a fixed target, e.g. in registration or deformation fitting.
+    The target gets a KD-tree once for the pred -> target queries. For target -> pred the
+    neighbors are certified incrementally: at a rebuild every target point t stores its nearest
+    pred point j and second nearest distance d2 in the pred snapshot P0. For a new pred that moved
+    at most delta from P0, j is still the nearest if |t - pred[j]| <= d2 - delta, so without
+    uncertified points no tree is built at all. The remaining points query a tree of the current
+    pred, which becomes the new snapshot if more than rebuild_ratio of the points needed it.
+    The distances are computed with torch from the found indices, so the gradients are those of
+    NmDistanceFunction (with respect to pred and target).
+    usage:
+        target = ChamferTarget(target_points)   # (B, M, 3)
+        for it in range(n):
+            dist1, dist2, idx1, idx2 = target.nndistance(pred)
+    """
+
+    def __init__(self, target, rebuild_ratio=0.5):
+        assert(target.dim() == 3 and target.shape[1] > 0), "target must be (B, M, 3)"
+        self.target = target
+        self.rebuild_ratio = rebuild_ratio
+        self._target_np = target.detach().cpu().double().numpy()
+        self._trees = [spatial.cKDTree(t) for t in self._target_np]
+        self._snapshot = None
+        # counters of the target -> pred queries
+        self.rebuilds = 0
+        self.certified = 0
+        self.searched = 0
+
+    @staticmethod
+    def _squared_distance(points, ref, idx):
+        """|points - ref[idx]|^2, differentiable w.r.t. points and ref"""
+        nn = torch.gather(ref, 1, idx.long().unsqueeze(-1).expand(-1, -1, 3))
+        return torch.sum((points - nn)**2, dim=-1)
+
+    def pred_to_target(self, pred):
+        """dist1 (B, N), idx1 (B, N) of pred (B, N, 3) to the target"""
+        pred_np = pred.detach().cpu().double().numpy()
+        idx = np.stack([tree.query(p, k=1, workers=-1)[1] for tree, p in zip(self._trees, pred_np)])
+        idx = torch.from_numpy(idx.astype(np.int32)).to(pred.device)
+        return self._squared_distance(pred, self.target, idx), idx
+
+    def _rebuild(self, pred_np, trees=None):
+        self.rebuilds += 1
+        trees = trees or [spatial.cKDTree(p) for p in pred_np]
+        nearest, d1, d2 = [], [], []
+        k = min(2, pred_np.shape[1])
+        for tree, t in zip(trees, self._target_np):
+            dist, idx = tree.query(t, k=k, workers=-1)
+            if k == 1:
+                dist, idx = dist[:, None], idx[:, None]
+                dist = np.concatenate([dist, np.full_like(dist, np.inf)], axis=1)
+            nearest.append(idx[:, 0])
+            d1.append(dist[:, 0])
+            d2.append(dist[:, 1])
+        self._snapshot = (pred_np, np.stack(nearest), np.stack(d1), np.stack(d2))
+
+    def _target_to_pred_idx(self, pred_np):
+        if self._snapshot is None or self._snapshot[0].shape != pred_np.shape:
+            self._rebuild(pred_np)
+            self.searched += self._snapshot[1].size
+            return self._snapshot[1].copy()
+        snapshot, nearest, _, second = self._snapshot
+        delta = np.sqrt(np.max(np.sum((pred_np - snapshot)**2, axis=-1), axis=-1))
+        todo = []
+        for b in range(pred_np.shape[0]):
+            dist = np.sqrt(np.sum((self._target_np[b] - pred_np[b][nearest[b]])**2, axis=-1))
+            todo.append(np.nonzero(dist > second[b] - delta[b])[0])
+        n_todo = sum(len(t) for t in todo)
+        if n_todo == 0:
+            self.certified += nearest.size
+            return nearest.copy()
+        # the uncertified points are searched in a tree of the current pred, which becomes
+        # the new snapshot if too many points need it
+        trees = [spatial.cKDTree(p) for p in pred_np]
+        if n_todo > self.rebuild_ratio * nearest.size:
+            self._rebuild(pred_np, trees)
+            self.searched += nearest.size
+            return self._snapshot[1].copy()
+        self.certified += nearest.size - n_todo
+        self.searched += n_todo
+        idx = nearest.copy()
+        for b, tree in enumerate(trees):
+            if len(todo[b]) > 0:
+                idx[b, todo[b]] = tree.query(self._target_np[b][todo[b]], k=1, workers=-1)[1]
+        return idx
+
+    def target_to_pred(self, pred):
+        """dist2 (B, M), idx2 (B, M) of the target to pred (B, N, 3)"""
+        idx = self._target_to_pred_idx(pred.detach().cpu().double().numpy())
+        idx = torch.from_numpy(idx.astype(np.int32)).to(pred.device)
+        return self._squared_distance(self.target, pred, idx), idx
+
+    def nndistance(self, pred):
+        """same outputs as nndistance(pred, target)"""
+        dist1, idx1 = self.pred_to_target(pred)
+        dist2, idx2 = self.target_to_pred(pred)
+        return dist1, dist2, idx1, idx2
 
 
 class LabeledNmdistanceFunction(torch.autograd.Function):
     """ CD within the same category, ignore points that have no matching category """
     @staticmethod
     def forward(ctx, xyz1, xyz2, label1, label2):
+        xyz1 = xyz1.contiguous()
+        xyz2 = xyz2.contiguous()
         batchsize, n, _ = xyz1.size()
         _, m, _ = xyz2.size()
         assert(xyz1.dtype==xyz2.dtype)
         label1 = label1.to(dtype=xyz1.dtype)
         label2 = label2.to(dtype=xyz1.dtype)
-        dist1 = torch.zeros(batchsize, n, dtype=xyz1.dtype)
-        dist2 = torch.zeros(batchsize, m, dtype=xyz1.dtype)
+        dist1 = torch.zeros(batchsize, n, dtype=xyz1.dtype, device=xyz1.device)
+        dist2 = torch.zeros(batchsize, m, dtype=xyz1.dtype, device=xyz1.device)
 
-        idx1 = torch.zeros(batchsize, n).type(torch.IntTensor)
-        idx2 = torch.zeros(batchsize, m).type(torch.IntTensor)
-
-        dist1 = dist1.cuda()
-        dist2 = dist2.cuda()
-        idx1 = idx1.cuda()
-        idx2 = idx2.cuda()
+        idx1 = torch.zeros(batchsize, n, dtype=torch.int32, device=xyz1.device)
+        idx2 = torch.zeros(batchsize, m, dtype=torch.int32, device=xyz1.device)
         losses.labeled_nmdistance_forward(xyz1, xyz2, label1, label2,  dist1, dist2, idx1, idx2)
         ctx.save_for_backward(xyz1, xyz2, idx1, idx2)
         ctx.mark_non_differentiable(idx1, idx2)
@@ -474,9 +862,6 @@ class LabeledNmdistanceFunction(torch.autograd.Function):
 
         gradxyz1 = torch.zeros_like(xyz1)
         gradxyz2 = torch.zeros_like(xyz2)
-
-        gradxyz1 = gradxyz1.cuda()
-        gradxyz2 = gradxyz2.cuda()
         losses.nmdistance_backward(xyz1, xyz2, gradxyz1, gradxyz2, graddist1, graddist2, idx1, idx2)
         return gradxyz1, gradxyz2, None, None
 
@@ -5,10 +5,15 @@ https://github.com/erikwijmans/Pointnet2_PyTorch
 
 import torch
 import numpy as np
-from scipy import sparse
+from collections import namedtuple
 
-from .._ext import sampling, linalg
-from ..utils.pytorch_utils import check_values, save_grad, saved_variables
+from . import backends
+from ..misc.lazy import LazyModule
+from ..utils.pytorch_utils import check_values, save_grad, saved_variables, amp_custom_fwd, amp_custom_bwd
+
+sampling = LazyModule(".._ext.sampling", __package__)
+linalg = LazyModule(".._ext.linalg", __package__)
+ops = LazyModule("pytorch3d.ops")
 
 
 def channel_shuffle(x, groups=2):
@@ -37,6 +42,7 @@ def jitter_perturbation_point_cloud(batch_data, sigma=0.005, clip=0.02, is_2D=Fa
 
 class GatherFunction(torch.autograd.Function):
     @staticmethod
+    @amp_custom_fwd
     def forward(ctx, features, idx):
         r"""
         Parameters
@@ -69,6 +75,7 @@ class GatherFunction(torch.autograd.Function):
         return output
 
     @staticmethod
+    @amp_custom_bwd
     def backward(ctx, grad_out):
         idx, = ctx.saved_tensors
         B, npoint = idx.size()
@@ -82,11 +89,20 @@ class GatherFunction(torch.autograd.Function):
         return grad_features, None
 
 
-gather_points = GatherFunction.apply  # type: ignore
+def _gather_points_torch(features, idx):
+    """reference of GatherFunction with torch.gather"""
+    return torch.gather(features, 2, idx.long().unsqueeze(1).expand(-1, features.shape[1], -1))
+
+
+backends.register_op("gather_points", size=lambda features, idx: idx.numel()*features.shape[1])
+backends.register_engine("gather_points", "ext", GatherFunction.apply, available=backends.module_available(sampling.__name__))
+backends.register_engine("gather_points", "torch", _gather_points_torch)
+gather_points = backends.dispatcher("gather_points", GatherFunction.forward.__doc__)
 
 
 class BallQuery(torch.autograd.Function):
     @staticmethod
+    @amp_custom_fwd
     def forward(ctx, radius, nsample, xyz, new_xyz):
         r"""
         Parameters
@@ -104,18 +120,34 @@ class BallQuery(torch.autograd.Function):
         torch.Tensor
             (B, npoint, nsample) tensor with the indicies of the features that form the query balls
         """
-        return sampling.ball_query(new_xyz, xyz, radius, nsample)
+        return sampling.ball_query(new_xyz.to(xyz.dtype).contiguous(), xyz.contiguous(), radius, nsample)
 
     @staticmethod
     def backward(ctx, a=None):
         return None, None, None, None
 
 
-ball_query = BallQuery.apply  # type: ignore
+def _ball_query_torch(radius, nsample, xyz, new_xyz):
+    """reference of BallQuery, the nsample smallest indices inside the ball padded with the first"""
+    B, N, _ = xyz.shape
+    inside = torch.cdist(new_xyz, xyz, compute_mode="donot_use_mm_for_euclid_dist") < radius
+    key = torch.where(inside, torch.arange(N, device=xyz.device), torch.full_like(inside, N, dtype=torch.long))
+    key = torch.topk(key, min(nsample, N), dim=-1, largest=False, sorted=True)[0]
+    if nsample > N:
+        key = torch.cat([key, key.new_full(key.shape[:2]+(nsample-N,), N)], dim=-1)
+    first = torch.where(key[..., :1] < N, key[..., :1], torch.zeros_like(key[..., :1]))
+    return torch.where(key < N, key, first).to(dtype=torch.int32)
+
+
+backends.register_op("ball_query", size=lambda radius, nsample, xyz, new_xyz: xyz.shape[0]*xyz.shape[1]*new_xyz.shape[1])
+backends.register_engine("ball_query", "ext", BallQuery.apply, available=backends.module_available(sampling.__name__))
+backends.register_engine("ball_query", "torch", _ball_query_torch)
+ball_query = backends.dispatcher("ball_query", BallQuery.forward.__doc__)
 
 
 class GroupingOperation(torch.autograd.Function):
     @staticmethod
+    @amp_custom_fwd
     def forward(ctx, features, idx):
         r"""
         Parameters
@@ -137,6 +169,7 @@ class GroupingOperation(torch.autograd.Function):
         return sampling.group_points(features, idx)
 
     @staticmethod
+    @amp_custom_bwd
     def backward(ctx, grad_out):
         r"""
         Parameters
@@ -156,7 +189,163 @@ class GroupingOperation(torch.autograd.Function):
         return grad_features, None
 
 
-grouping_operation = GroupingOperation.apply  # type: ignore
+def _grouping_operation_torch(features, idx):
+    """reference of GroupingOperation with torch.gather"""
+    B, C, N = features.shape
+    _, npoint, nsample = idx.shape
+    index = idx.long().view(B, 1, -1).expand(-1, C, -1)
+    return torch.gather(features, 2, index).view(B, C, npoint, nsample)
+
+
+backends.register_op("grouping_operation", size=lambda features, idx: idx.numel()*features.shape[1])
+backends.register_engine("grouping_operation", "ext", GroupingOperation.apply, available=backends.module_available(sampling.__name__))
+backends.register_engine("grouping_operation", "torch", _grouping_operation_torch)
+grouping_operation = backends.dispatcher("grouping_operation", GroupingOperation.forward.__doc__)
+
+
+def pack_points(clouds):
+    """
+    concatenate a list of (N_i, C) clouds
+    return:
+        points (sum N_i, C), lengths (B,) int64 on cpu
+    """
+    lengths = torch.tensor([c.shape[0] for c in clouds], dtype=torch.int64)
+    return torch.cat(clouds, dim=0), lengths
+
+
+def lengths_to_offsets(lengths):
+    """(B,) lengths -> (B+1,) int64 offsets on cpu, cloud i is offsets[i]:offsets[i+1]"""
+    lengths = torch.as_tensor(lengths, dtype=torch.int64).cpu()
+    offsets = torch.zeros(lengths.numel()+1, dtype=torch.int64)
+    torch.cumsum(lengths, dim=0, out=offsets[1:])
+    return offsets
+
+
+def _packed_ball_query_ext(xyz, offsets, new_xyz, new_offsets, radius, nsample):
+    return sampling.ball_query_packed(new_xyz, new_offsets, xyz, offsets, radius, nsample)
+
+
+def _packed_ball_query_torch(xyz, offsets, new_xyz, new_offsets, radius, nsample):
+    """reference of sampling.ball_query_packed, queries the clouds one by one"""
+    idx = torch.zeros(new_xyz.shape[0], nsample, dtype=torch.int32, device=xyz.device)
+    offsets, new_offsets = offsets.tolist(), new_offsets.tolist()
+    for i in range(len(offsets)-1):
+        if new_offsets[i+1] == new_offsets[i]:
+            continue
+        idx[new_offsets[i]:new_offsets[i+1]] = ball_query(
+            radius, nsample, xyz[None, offsets[i]:offsets[i+1]], new_xyz[None, new_offsets[i]:new_offsets[i+1]])[0] + offsets[i]
+    return idx
+
+
+backends.register_op("packed_ball_query", size=lambda xyz, offsets, new_xyz, new_offsets, radius, nsample:
+                     xyz.shape[0]*new_xyz.shape[0]//max(offsets.numel()-1, 1))
+backends.register_engine("packed_ball_query", "ext", _packed_ball_query_ext,
+                         available=backends.module_available(sampling.__name__), devices=("cpu",))
+backends.register_engine("packed_ball_query", "torch", _packed_ball_query_torch)
+
+
+def packed_ball_query(radius, nsample, xyz, lengths, new_xyz, new_lengths):
+    r"""
+    ball query of packed clouds, identical to ball_query on every cloud,
+    centers without neighbors point to the first point of their own cloud,
+    every cloud with centers must have at least one point
+    Parameters
+    ----------
+    xyz : torch.Tensor
+        (P, 3) concatenated clouds with lengths (B,)
+    new_xyz : torch.Tensor
+        (Q, 3) concatenated centers with new_lengths (B,)
+    Returns
+    -------
+    torch.Tensor
+        (Q, nsample) int32 indices into the packed xyz
+    """
+    offsets = lengths_to_offsets(lengths)
+    new_offsets = lengths_to_offsets(new_lengths)
+    assert(offsets.numel() == new_offsets.numel())
+    assert(((offsets[1:] > offsets[:-1]) | (new_offsets[1:] == new_offsets[:-1])).all()), \
+        "every cloud with centers must have at least one point"
+    return backends.dispatch("packed_ball_query", xyz.contiguous(), offsets, new_xyz.contiguous(), new_offsets, radius, nsample)
+
+
+def packed_grouping_operation(features, idx):
+    r"""
+    Parameters
+    ----------
+    features : torch.Tensor
+        (C, P) features of packed clouds
+    idx : torch.Tensor
+        (Q, nsample) indices into the packed clouds, e.g. from packed_ball_query
+    Returns
+    -------
+    torch.Tensor
+        (C, Q, nsample) tensor
+    """
+    return grouping_operation(features.unsqueeze(0), idx.unsqueeze(0)).squeeze(0)
+
+
+class QueryAndGroupFunction(torch.autograd.Function):
+    @staticmethod
+    @amp_custom_fwd
+    def forward(ctx, radius, nsample, xyz, new_xyz, features=None, use_xyz=True):
+        r"""
+        ball query, grouping and recentering in one op, without the intermediate grouped tensors
+        Parameters
+        ----------
+        xyz : torch.Tensor
+            (B, N, 3) xyz coordinates of the features
+        new_xyz : torch.Tensor
+            (B, npoint, 3) centers of the ball query
+        features : torch.Tensor
+            (B, C, N) descriptors of the features or None
+        use_xyz : bool
+            prepend the neighbor coordinates relative to the center
+        Returns
+        -------
+        torch.Tensor
+            (B, 3 + C, npoint, nsample) or (B, C, npoint, nsample) without use_xyz
+        """
+        assert(use_xyz or features is not None), "Cannot have not features and not use xyz as a feature!"
+        # one dtype for the output, promoted as torch.cat of the coordinates and features would
+        dtype = xyz.dtype if features is None else torch.promote_types(xyz.dtype, features.dtype)
+        xyz = xyz.to(dtype).contiguous()
+        if features is None:
+            features = xyz.new_empty(xyz.shape[0], 0, xyz.shape[1])
+        out, idx = sampling.query_and_group(new_xyz.to(dtype).contiguous(), xyz, features.to(dtype).contiguous(),
+                                            radius, nsample, use_xyz)
+        ctx.for_backwards = (idx, xyz.shape[1], use_xyz)
+        ctx.mark_non_differentiable(idx)
+        return out
+
+    @staticmethod
+    @amp_custom_bwd
+    def backward(ctx, grad_out):
+        idx, N, use_xyz = ctx.for_backwards
+        grad_xyz, grad_new_xyz, grad_features = sampling.query_and_group_grad(grad_out.contiguous(), idx, N, use_xyz)
+        if not use_xyz:
+            grad_xyz = grad_new_xyz = None
+        if not ctx.needs_input_grad[4]:
+            grad_features = None
+        return None, None, grad_xyz, grad_new_xyz, grad_features, None
+
+
+def _query_and_group_torch(radius, nsample, xyz, new_xyz, features=None, use_xyz=True):
+    """reference of QueryAndGroupFunction composed of ball_query and grouping_operation"""
+    assert(use_xyz or features is not None), "Cannot have not features and not use xyz as a feature!"
+    idx = ball_query(radius, nsample, xyz, new_xyz)
+    grouped = []
+    if use_xyz:
+        grouped.append(grouping_operation(xyz.transpose(1, 2).contiguous(), idx) - new_xyz.transpose(1, 2).unsqueeze(-1))
+    if features is not None:
+        grouped.append(grouping_operation(features, idx))
+    return torch.cat(grouped, dim=1) if len(grouped) > 1 else grouped[0]
+
+
+backends.register_op("query_and_group", size=lambda radius, nsample, xyz, new_xyz, features=None, use_xyz=True:
+                     xyz.shape[0]*xyz.shape[1]*new_xyz.shape[1])
+backends.register_engine("query_and_group", "ext", QueryAndGroupFunction.apply, available=backends.module_available(sampling.__name__))
+backends.register_engine("query_and_group", "torch", _query_and_group_torch)
+query_and_group = backends.dispatcher("query_and_group", QueryAndGroupFunction.forward.__doc__)
 
 
 class QueryAndGroup(torch.nn.Module):
@@ -189,59 +378,33 @@ class QueryAndGroup(torch.nn.Module):
         new_features : torch.Tensor
             (B, 3 + C, npoint, nsample) tensor
         """
-        # (B, npoint, k)
-        idx = ball_query(self.radius, self.nsample, xyz, new_xyz)
-        # (B, 3, N)
-        xyz_trans = xyz.transpose(1, 2).contiguous()
-        grouped_xyz = grouping_operation(xyz_trans, idx)  # (B, 3, npoint, nsample)
-        grouped_xyz -= new_xyz.transpose(1, 2).unsqueeze(-1)
-
-        if features is not None:
-            grouped_features = grouping_operation(features, idx)
-            if self.use_xyz:
-                new_features = torch.cat(
-                    [grouped_xyz, grouped_features], dim=1
-                )  # (B, C + 3, npoint, nsample)
-            else:
-                new_features = grouped_features
-        else:
-            assert (
-                self.use_xyz
-            ), "Cannot have not features and not use xyz as a feature!"
-            new_features = grouped_xyz
-
-        return new_features
+        return query_and_group(self.radius, self.nsample, xyz, new_xyz, features, self.use_xyz)
 
 class BatchSVDFunction(torch.autograd.Function):
     """
     batched svd implemented by https://github.com/KinglittleQ/torch-batch-svd
+    runs with cusolver on gpu and with a one-sided Jacobi solver on cpu
     """
     @staticmethod
     def forward(ctx, x):
-        ctx.device = x.device
-        if not torch.cuda.is_available():
-            assert(RuntimeError), "BatchSVDFunction only runs on gpu"
-        x = x.cuda()
-        U, S, V = linalg.batch_svd_forward(x, True, 1e-7, 100)
+        tol = 1e-7 if x.dtype == torch.float32 else 1e-14
+        U, S, V = linalg.batch_svd_forward(x, True, tol, 100)
         k = S.size(1)
         U = U[:, :, :k]
         V = V[:, :, :k]
         ctx.save_for_backward(x, U, S, V)
-        U = U.to(ctx.device)
-        S = S.to(ctx.device)
-        V = V.to(ctx.device)
         return U, S, V
 
     @staticmethod
     def backward(ctx, grad_u, grad_s, grad_v):
-        x, U, S, V = ctx.saved_variables
+        x, U, S, V = ctx.saved_tensors
 
         grad_out = linalg.batch_svd_backward(
             [grad_u, grad_s, grad_v],
             x, True, True, U, S, V
         )
 
-        return grad_out.to(device=ctx.device)
+        return grad_out
 
 
 def batch_svd(x):
@@ -255,7 +418,156 @@ def batch_svd(x):
         S [B, k] in decending order
     """
     assert(x.dim() == 3)
-    return BatchSVDFunction.apply(x)
+    return _batch_svd(x)
+
+
+def _batch_svd_torch(x):
+    U, S, Vh = torch.linalg.svd(x, full_matrices=False)
+    return U, S, Vh.transpose(-1, -2)
+
+
+backends.register_op("batch_svd", size=lambda x: x.numel()*min(x.shape[1:]))
+backends.register_engine("batch_svd", "ext", BatchSVDFunction.apply, available=backends.module_available(linalg.__name__))
+backends.register_engine("batch_svd", "torch", _batch_svd_torch)
+_batch_svd = backends.dispatcher("batch_svd")
+
+
+KNN = namedtuple("KNN", ["dists", "idx", "knn"])
+
+
+def knn_gather(x, idx):
+    """
+    x (B, N, C), idx (B, M, K) -> (B, M, K, C)
+    """
+    B, M, K = idx.shape
+    index = idx.reshape(B, M*K, 1).expand(-1, -1, x.shape[-1])
+    return torch.gather(x, 1, index).view(B, M, K, x.shape[-1])
+
+
+def _knn_points_pytorch3d(p1, p2, K=1, return_nn=False):
+    return KNN(*ops.knn_points(p1, p2, K=K, return_nn=return_nn))
+
+
+def _knn_points_torch(p1, p2, K=1, return_nn=False):
+    dists = torch.cdist(p1, p2, compute_mode="donot_use_mm_for_euclid_dist")**2
+    dists, idx = torch.topk(dists, K, dim=-1, largest=False, sorted=True)
+    return KNN(dists, idx, knn_gather(p2, idx) if return_nn else None)
+
+
+backends.register_op("knn_points", size=lambda p1, p2, K=1, return_nn=False: p1.shape[0]*p1.shape[1]*p2.shape[1])
+backends.register_engine("knn_points", "pytorch3d", _knn_points_pytorch3d, available=backends.module_available(ops.__name__))
+backends.register_engine("knn_points", "torch", _knn_points_torch)
+knn_points = backends.dispatcher("knn_points", """
+    K nearest neighbors of p1 (B, N, D) in p2 (B, M, D)
+    return:
+        KNN(dists, idx, knn), squared distances (B, N, K), int64 indices (B, N, K)
+        and the neighbors (B, N, K, D) if return_nn else None
+    """)
+
+
+def _eigvec3x3(A, eigval):
+    """
+    unit eigenvector of symmetric (*,3,3) A to eigval (*,) from the largest cross product
+    of the rows of A - eigval*I, and the norm of that cross product (~0 if eigval is repeated)
+    """
+    M = A - eigval[..., None, None]*torch.eye(3, dtype=A.dtype, device=A.device)
+    crosses = torch.stack([torch.cross(M[..., 0, :], M[..., 1, :], dim=-1),
+                           torch.cross(M[..., 0, :], M[..., 2, :], dim=-1),
+                           torch.cross(M[..., 1, :], M[..., 2, :], dim=-1)], dim=-2)
+    norms = torch.sum(crosses*crosses, dim=-1)
+    best = torch.argmax(norms, dim=-1)
+    v = torch.gather(crosses, -2, best[..., None, None].expand(best.shape+(1, 3))).squeeze(-2)
+    norm = torch.gather(norms, -1, best[..., None]).sqrt()
+    return v/norm.clamp_min(1e-30), norm.squeeze(-1)
+
+
+def _orthogonal3(v):
+    """unit vector orthogonal to the unit vectors v (*,3)"""
+    # cross with the axis least aligned to v
+    axis = torch.nn.functional.one_hot(torch.argmin(v.abs(), dim=-1), 3).to(dtype=v.dtype)
+    return normalize(torch.cross(v, axis, dim=-1), dim=-1)
+
+
+def _eigh3x3_closed_form(A):
+    """
+    eigenvalues (ascending) and eigenvectors of symmetric 3x3 matrices with the trigonometric
+    solution of the characteristic polynomial (Smith 1961)
+    """
+    # scale to unit range for accuracy
+    scale = A.abs().flatten(-2).max(dim=-1)[0].clamp_min(1e-30)
+    A = A / scale[..., None, None]
+    q = (A[..., 0, 0]+A[..., 1, 1]+A[..., 2, 2])/3
+    p1 = A[..., 0, 1]**2 + A[..., 0, 2]**2 + A[..., 1, 2]**2
+    p2 = (A[..., 0, 0]-q)**2 + (A[..., 1, 1]-q)**2 + (A[..., 2, 2]-q)**2 + 2*p1
+    p = torch.sqrt(p2/6)
+    Bm = (A - q[..., None, None]*torch.eye(3, dtype=A.dtype, device=A.device)) / p.clamp_min(1e-30)[..., None, None]
+    r = torch.det(Bm).clamp(-2, 2)/2
+    phi = torch.acos(r)/3
+    eig_max = q + 2*p*torch.cos(phi)
+    eig_min = q + 2*p*torch.cos(phi + 2*np.pi/3)
+    eig_mid = 3*q - eig_max - eig_min
+
+    # eigenvectors of the simple eigenvalue at the ends of the spectrum
+    tol = 64*torch.finfo(A.dtype).eps
+    v_max, n_max = _eigvec3x3(A, eig_max)
+    v_min, n_min = _eigvec3x3(A, eig_min)
+    simple_max = (n_max > tol).unsqueeze(-1)
+    simple_min = (n_min > tol).unsqueeze(-1)
+    # a repeated eigenvalue leaves a whole plane, use a vector orthogonal to the other end
+    e_z = torch.zeros_like(v_max)
+    e_z[..., 2] = 1
+    v_max = torch.where(simple_max | ~simple_min, v_max, _orthogonal3(v_min))
+    v_max = torch.where(simple_max | simple_min, v_max, e_z)
+    v_min = torch.where(simple_min, v_min, _orthogonal3(v_max))
+    # orthogonalize against rounding
+    v_min = normalize(v_min - dot_product(v_min, v_max, keepdim=True)*v_max, dim=-1)
+    v_mid = torch.cross(v_max, v_min, dim=-1)
+
+    eigval = torch.stack([eig_min, eig_mid, eig_max], dim=-1)*scale[..., None]
+    eigvec = torch.stack([v_min, v_mid, v_max], dim=-1)
+    return eigval, eigvec
+
+
+class BatchEigh3x3Function(torch.autograd.Function):
+    """
+    closed-form eigen-decomposition of symmetric 3x3 matrices
+    """
+    @staticmethod
+    def forward(ctx, A):
+        eigval, eigvec = _eigh3x3_closed_form(A)
+        ctx.save_for_backward(eigval, eigvec)
+        return eigval, eigvec
+
+    @staticmethod
+    def backward(ctx, grad_eigval, grad_eigvec):
+        eigval, eigvec = ctx.saved_tensors
+        Vt = eigvec.transpose(-1, -2)
+        inner = torch.zeros_like(eigvec)
+        if grad_eigvec is not None:
+            # F_ij = 1/(lambda_j-lambda_i), terms of (nearly) repeated eigenvalues are dropped
+            # since the eigenvectors are arbitrary within their eigenspace
+            diff = eigval.unsqueeze(-2) - eigval.unsqueeze(-1)
+            scale = eigval.abs().max(dim=-1, keepdim=True)[0].unsqueeze(-1).clamp_min(1e-30)
+            F = torch.where(diff.abs() > 1e-6*scale, 1/torch.where(diff == 0, torch.ones_like(diff), diff), torch.zeros_like(diff))
+            inner = inner + F*torch.matmul(Vt, grad_eigvec)
+        if grad_eigval is not None:
+            inner = inner + torch.diag_embed(grad_eigval)
+        grad_A = torch.matmul(torch.matmul(eigvec, inner), Vt)
+        return (grad_A + grad_A.transpose(-1, -2))/2
+
+
+def batch_eigh3x3(A):
+    """
+    eigen-decomposition of symmetric 3x3 matrices without iterations, runs on any device
+    input:
+        A --- shape of [*, 3, 3], symmetric
+    return:
+        eigval [*, 3] in ascending order
+        eigvec [*, 3, 3] eigenvectors as columns, A = eigvec diag(eigval) eigvec^T
+    """
+    assert(A.shape[-2:] == (3, 3))
+    return BatchEigh3x3Function.apply(A)
+
 
 def normalize(tensor, dim=-1):
     """normalize tensor in specified dimension"""
@@ -4,8 +4,9 @@ from torch.autograd import Function
 import torch.nn as nn
 from typing import Tuple
 
-from .._ext import sampling
-from .operations import grouping_operation, ball_query
+from . import backends
+from .operations import sampling, grouping_operation, ball_query
+from ..utils.pytorch_utils import amp_custom_fwd, amp_custom_bwd
 
 
 class ThreeNN(Function):
@@ -18,7 +19,8 @@ class ThreeNN(Function):
         :param unknown: (B, N, 3)
         :param known: (B, M, 3)
         :return:
-            dist: (B, N, 3) l2 distance to the three nearest neighbors
+            dist: (B, N, 3) l2 distance to the three nearest neighbors, in the dtype of unknown
+                (the search runs in float)
             idx: (B, N, 3) index of 3 nearest neighbors
         """
         assert unknown.is_contiguous()
@@ -26,23 +28,34 @@ class ThreeNN(Function):
 
         B, N, _ = unknown.size()
         m = known.size(1)
-        dist2 = torch.cuda.FloatTensor(B, N, 3)
-        idx = torch.cuda.IntTensor(B, N, 3)
+        dist2 = torch.empty(B, N, 3, dtype=torch.float32, device=unknown.device)
+        idx = torch.empty(B, N, 3, dtype=torch.int32, device=unknown.device)
 
-        sampling.three_nn_wrapper(B, N, m, unknown, known, dist2, idx)
-        return torch.sqrt(dist2), idx
+        sampling.three_nn_wrapper(B, N, m, unknown.float().contiguous(), known.float().contiguous(), dist2, idx)
+        return torch.sqrt(dist2).to(unknown.dtype), idx
 
     @staticmethod
     def backward(ctx, a=None, b=None):
         return None, None
 
 
-three_nn = ThreeNN.apply
+def _three_nn_torch(unknown, known):
+    """reference of ThreeNN"""
+    dist2 = torch.cdist(unknown, known, compute_mode="donot_use_mm_for_euclid_dist")**2
+    dist2, idx = torch.topk(dist2, 3, dim=-1, largest=False, sorted=True)
+    return torch.sqrt(dist2), idx.to(dtype=torch.int32)
+
+
+backends.register_op("three_nn", size=lambda unknown, known: unknown.shape[0]*unknown.shape[1]*known.shape[1])
+backends.register_engine("three_nn", "ext", ThreeNN.apply, available=backends.module_available(sampling.__name__))
+backends.register_engine("three_nn", "torch", _three_nn_torch)
+three_nn = backends.dispatcher("three_nn", ThreeNN.forward.__doc__)
 
 
 class ThreeInterpolate(Function):
 
     @staticmethod
+    @amp_custom_fwd
     def forward(ctx, features: torch.Tensor, idx: torch.Tensor, weight: torch.Tensor) -> torch.Tensor:
         """
         Performs weight linear interpolation on 3 features
@@ -57,15 +70,18 @@ class ThreeInterpolate(Function):
         assert idx.is_contiguous()
         assert weight.is_contiguous()
 
+        # the weights may come in another dtype, the interpolation runs in the dtype of the features
+        weight = weight.to(features.dtype)
         B, c, m = features.size()
         n = idx.size(1)
         ctx.three_interpolate_for_backward = (idx, weight, m)
-        output = torch.cuda.FloatTensor(B, c, n)
+        output = torch.empty(B, c, n, dtype=features.dtype, device=features.device)
 
         sampling.three_interpolate_wrapper(B, c, m, n, features, idx, weight, output)
         return output
 
     @staticmethod
+    @amp_custom_bwd
     def backward(ctx, grad_out: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
         """
         :param ctx:
@@ -78,8 +94,8 @@ class ThreeInterpolate(Function):
         idx, weight, m = ctx.three_interpolate_for_backward
         B, c, n = grad_out.size()
 
-        grad_features = torch.cuda.FloatTensor(B, c, m).zero_()
-        grad_out_data = grad_out.data.contiguous()
+        grad_features = torch.zeros(B, c, m, dtype=weight.dtype, device=grad_out.device)
+        grad_out_data = grad_out.data.to(weight.dtype).contiguous()
 
         sampling.three_interpolate_grad_wrapper(B, c, n, m, grad_out_data, idx, weight, grad_features.data)
         return grad_features, None, None
@@ -0,0 +1,139 @@
+"""
+Process-wide cache of the precomputations that depend only on the mesh connectivity.
+
+Uniform laplacians, cotangent laplacian sparsity patterns, unique edges and vertex degrees are
+keyed by a content fingerprint of the face tensor, so every loss module working on the same
+template shares one precomputation, whether or not its faces tensor is the same object.
+Least recently used entries are dropped once the cached tensors exceed the memory cap.
+
+usage:
+    from pytorch_points.network import topology_cache
+    topology_cache.configure(max_bytes=2**30)  # or PYTORCH_POINTS_TOPOLOGY_CACHE_MB=1024, 0 disables
+    ... train ...
+    print(topology_cache.stats())
+"""
+import hashlib
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+import torch
+
+
+def _nbytes(value):
+    if isinstance(value, torch.Tensor):
+        if value.layout == torch.sparse_coo:
+            return _nbytes(value._indices()) + _nbytes(value._values())
+        if value.layout == torch.sparse_csr:
+            return _nbytes(value.crow_indices()) + _nbytes(value.col_indices()) + _nbytes(value.values())
+        return value.numel() * value.element_size()
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(v) for v in value)
+    return 0
+
+
+class TopologyCache(object):
+    """
+    params:
+        max_bytes   memory cap of the cached tensors, least recently used are dropped first
+    """
+
+    def __init__(self, max_bytes=2**28):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # id(faces) -> (weakref, version, digest), skips hashing a faces tensor passed again unchanged
+        self._digests = {}
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """counters since the last reset_stats"""
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries), "bytes": self._bytes}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._digests.clear()
+            self._bytes = 0
+
+    def fingerprint(self, faces):
+        """hex digest of the shape, dtype and content of faces"""
+        memo = self._digests.get(id(faces))
+        if memo is not None and memo[0]() is faces and memo[1] == faces._version:
+            return memo[2]
+        data = faces.detach().cpu().contiguous()
+        h = hashlib.blake2b(digest_size=16)
+        h.update("{}/{}".format(tuple(data.shape), data.dtype).encode())
+        h.update(data.numpy().tobytes())
+        digest = h.hexdigest()
+        with self._lock:
+            # drop the memos of collected tensors before their ids are reused
+            self._digests = {k: v for k, v in self._digests.items() if v[0]() is not None}
+            self._digests[id(faces)] = (weakref.ref(faces), faces._version, digest)
+        return digest
+
+    def get(self, kind, faces, compute, *params):
+        """
+        cached compute() for the connectivity faces, kind names the precomputation and params
+        are the other values it depends on (sizes, dtype, device)
+        """
+        key = (kind, self.fingerprint(faces)) + params
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = compute()
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return value
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = value
+                self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, dropped = self._entries.popitem(last=False)
+                self._bytes -= _nbytes(dropped)
+                self.evictions += 1
+        return value
+
+
+_active = TopologyCache(int(float(os.environ.get("PYTORCH_POINTS_TOPOLOGY_CACHE_MB", "256")) * 2**20))
+
+
+def configure(max_bytes):
+    """replace the process-wide cache by a new TopologyCache(max_bytes) and return it"""
+    global _active
+    _active = TopologyCache(max_bytes)
+    return _active
+
+
+def active():
+    return _active
+
+
+def get(kind, faces, compute, *params):
+    """TopologyCache.get of the process-wide cache, compute() is called directly if its cap is 0"""
+    if _active.max_bytes <= 0:
+        return compute()
+    return _active.get(kind, faces, compute, *params)
+
+
+def stats():
+    return _active.stats()
+
+
+def clear():
+    _active.clear()
@@ -4,13 +4,15 @@ https://github.com/ranahanocka/MeshCNN/blob/master/models/layers/mesh_prepare.py
 """
 import numpy as np
 import random
-import openmesh as om
 import os
-from matplotlib import cm
 import torch
 from collections import abc
 from ..network.geo_operations import compute_face_normals_and_areas
 from ..misc import logger
+from ..misc.lazy import LazyModule
+
+om = LazyModule("openmesh")
+cm = LazyModule("matplotlib.cm")
 
 def normalize_to_same_area(v_ref: torch.Tensor, f_ref: torch.Tensor, v: torch.Tensor, f:torch.Tensor):
     """
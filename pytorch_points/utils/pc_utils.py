@@ -5,9 +5,11 @@ import os
 import numpy as np
 import torch
 # Point cloud IO
-from matplotlib import cm
-import matplotlib.colors as mpc
 import plyfile
+from ..misc.lazy import LazyModule
+
+cm = LazyModule("matplotlib.cm")
+mpc = LazyModule("matplotlib.colors")
 
 
 def normalize_to_sphere(input):
@@ -1,10 +1,20 @@
 import torch
 import numpy as np
+import functools
 import os
 import warnings
 from collections import OrderedDict
 from ..misc import logger
 
+# autocast decorators for the forward and backward of custom autograd Functions,
+# torch.amp.custom_fwd replaces the deprecated torch.cuda.amp.custom_fwd since torch 2.4
+if hasattr(torch.amp, "custom_fwd"):
+    amp_custom_fwd = functools.partial(torch.amp.custom_fwd, device_type="cuda")
+    amp_custom_bwd = functools.partial(torch.amp.custom_bwd, device_type="cuda")
+else:
+    amp_custom_fwd = torch.cuda.amp.custom_fwd
+    amp_custom_bwd = torch.cuda.amp.custom_bwd
+
 saved_variables = {}
 def save_grad(name):
     def hook(grad):
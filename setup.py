@@ -1,8 +1,29 @@
+import os
+
+import torch
 from setuptools import setup, find_packages
-from torch.utils.cpp_extension import BuildExtension, CUDAExtension, CppExtension
+from torch.utils.cpp_extension import BuildExtension, CUDAExtension, CppExtension, CUDA_HOME
 
 print(find_packages())
 
+# the cuda kernels are built if a cuda toolkit is found (or FORCE_CUDA=1, e.g. in a docker build
+# without gpu), otherwise only the cpu engines, FORCE_CPU=1 skips cuda altogether
+WITH_CUDA = os.getenv("FORCE_CPU", "0") != "1" and (
+    (torch.cuda.is_available() and CUDA_HOME is not None) or os.getenv("FORCE_CUDA", "0") == "1")
+
+
+def extension(name, sources, cuda_sources, libraries=()):
+    if WITH_CUDA:
+        return CUDAExtension(name, sources + cuda_sources,
+                             libraries=list(libraries),
+                             define_macros=[("WITH_CUDA", None)],
+                             extra_compile_args={'cxx': ['-g', '-O3', '-fopenmp'], 'nvcc': ['-O2']},
+                             extra_link_args=['-fopenmp'])
+    return CppExtension(name, sources,
+                        extra_compile_args=['-g', '-O3', '-fopenmp'],
+                        extra_link_args=['-fopenmp'])
+
+
 INSTALL_REQUIREMENTS = ['numpy', 'torch', 'plyfile', 'matplotlib', 'openmesh']
 setup(
     name='pytorch_points',
@@ -16,22 +37,15 @@ setup(
     ext_package="pytorch_points._ext",
     python_requires=">3.6",
     ext_modules=[
-        CUDAExtension('linalg', [
-            'pytorch_points/_ext/torch_batch_svd.cpp', ],
-            libraries=["cusolver", "cublas"],
-            extra_compile_args={'cxx': ['-g'], 'nvcc': ['-O2']},
-        ),
-        CUDAExtension('losses', [
-            'pytorch_points/_ext/nmdistance_cuda.cu', 'pytorch_points/_ext/nmdistance.cpp'],
-            extra_compile_args={'cxx': ['-g'], 'nvcc': ['-O2']},
-        ),
-        CUDAExtension('sampling', [
-            'pytorch_points/_ext/sampling.cpp',
-            'pytorch_points/_ext/sampling_cuda.cu',
-            'pytorch_points/_ext/interpolate_gpu.cu',
-            ],
-            extra_compile_args={'cxx': ['-g'], 'nvcc': ['-O2']},
-        )
+        extension('linalg',
+                  ['pytorch_points/_ext/torch_batch_svd.cpp', 'pytorch_points/_ext/torch_batch_svd_cpu.cpp'],
+                  [], libraries=["cusolver", "cublas"]),
+        extension('losses',
+                  ['pytorch_points/_ext/nmdistance.cpp', 'pytorch_points/_ext/nmdistance_cpu.cpp'],
+                  ['pytorch_points/_ext/nmdistance_cuda.cu']),
+        extension('sampling',
+                  ['pytorch_points/_ext/sampling.cpp', 'pytorch_points/_ext/sampling_cpu.cpp'],
+                  ['pytorch_points/_ext/sampling_cuda.cu', 'pytorch_points/_ext/interpolate_gpu.cu']),
     ],
 
     cmdclass={
@@ -0,0 +1,49 @@
+"""
+parity tests of the engines of the point ops against the pure-torch references,
+engines whose dependency is missing (e.g. the extensions are not built) are skipped.
+run with: python -m pytest tests
+"""
+import importlib.util
+
+import pytest
+
+# without torch there is nothing to test
+collect_ignore_glob = [] if importlib.util.find_spec("torch") else ["test_*.py"]
+
+
+@pytest.fixture(autouse=True)
+def default_backends():
+    """no autotuning, no fps cache, and no engine forced across tests"""
+    import torch
+    from pytorch_points.network import backends, fps_cache
+    autotune = backends._autotuner.enabled
+    backends.set_autotune(False)
+    fps_cache.disable()
+    torch.manual_seed(0)
+    yield
+    backends.set_autotune(autotune)
+    for op in list(backends._FORCED):
+        backends.set_engine(op, None)
+
+
+@pytest.fixture
+def use_engine():
+    """use_engine(op, name) forces engine `name` of op for the rest of the test, skips if it is unusable on cpu"""
+    from pytorch_points.network import backends
+
+    def use(op, name):
+        if name not in backends.engines(op, "cpu"):
+            pytest.skip("engine {} of {} is not available".format(name, op))
+        backends.set_engine(op, name)
+    return use
+
+
+@pytest.fixture
+def require_ext():
+    """require_ext(module) skips unless the extension pytorch_points._ext.<module> is built"""
+    from pytorch_points.network import backends
+
+    def require(module):
+        if not backends.module_available("pytorch_points._ext." + module)():
+            pytest.skip("extension {} is not built".format(module))
+    return require
@@ -0,0 +1,104 @@
+import pytest
+import torch
+
+from pytorch_points.network.model_loss import (nndistance, labeled_nndistance, packed_nndistance, chunked_chamfer,
+                                               ChamferTarget, _nndistance_torch)
+from pytorch_points.network.operations import pack_points
+
+
+@pytest.mark.parametrize("engine", ["ext", "torch"])
+@pytest.mark.parametrize("dtype", [torch.float32, torch.float64])
+def test_nndistance_engines(use_engine, engine, dtype):
+    use_engine("nndistance", engine)
+    xyz1 = torch.rand(2, 300, 3, dtype=dtype, requires_grad=True)
+    xyz2 = torch.rand(2, 200, 3, dtype=dtype, requires_grad=True)
+    dist1, dist2, idx1, idx2 = nndistance(xyz1, xyz2)
+    expected = _nndistance_torch(xyz1, xyz2)
+    assert torch.equal(idx1, expected[2]) and torch.equal(idx2, expected[3])
+    assert torch.allclose(dist1, expected[0], atol=1e-6) and torch.allclose(dist2, expected[1], atol=1e-6)
+    grads = torch.autograd.grad(dist1.sum() + 2*dist2.sum(), (xyz1, xyz2))
+    expected_grads = torch.autograd.grad(expected[0].sum() + 2*expected[1].sum(), (xyz1, xyz2))
+    for g, e in zip(grads, expected_grads):
+        assert torch.allclose(g, e, atol=1e-5)
+
+
+def _labeled_reference(xyz1, xyz2, label1, label2):
+    """nearest neighbor within the same label, distance 0 and index -1 without a matching label"""
+    dist = torch.cdist(xyz1, xyz2, compute_mode="donot_use_mm_for_euclid_dist")**2
+    dist = torch.where(label1.unsqueeze(-1) == label2.unsqueeze(-2), dist, torch.full_like(dist, float("inf")))
+    dist1, idx1 = dist.min(dim=2)
+    idx1 = torch.where(torch.isinf(dist1), torch.full_like(idx1, -1), idx1)
+    return torch.where(torch.isinf(dist1), torch.zeros_like(dist1), dist1), idx1.to(torch.int32)
+
+
+def test_labeled_nndistance(require_ext):
+    require_ext("losses")
+    xyz1 = torch.rand(2, 120, 3)
+    xyz2 = torch.rand(2, 90, 3)
+    label1 = torch.randint(0, 4, (2, 120))
+    # label 3 has no match in xyz2
+    label2 = torch.randint(0, 3, (2, 90))
+    dist1, dist2, idx1, idx2 = labeled_nndistance(xyz1, xyz2, label1, label2)
+    expected_dist1, expected_idx1 = _labeled_reference(xyz1, xyz2, label1, label2)
+    expected_dist2, expected_idx2 = _labeled_reference(xyz2, xyz1, label2, label1)
+    assert torch.equal(idx1, expected_idx1) and torch.equal(idx2, expected_idx2)
+    assert torch.allclose(dist1, expected_dist1, atol=1e-6) and torch.allclose(dist2, expected_dist2, atol=1e-6)
+
+
+def test_packed_nndistance_matches_per_cloud(require_ext):
+    require_ext("losses")
+    clouds1 = [torch.rand(n, 3) for n in (40, 0, 25, 10)]
+    clouds2 = [torch.rand(n, 3) for n in (30, 12, 0, 10)]
+    xyz1, lengths1 = pack_points(clouds1)
+    xyz2, lengths2 = pack_points(clouds2)
+    dist1, dist2, idx1, idx2 = packed_nndistance(xyz1, lengths1, xyz2, lengths2)
+    s1 = s2 = 0
+    for c1, c2 in zip(clouds1, clouds2):
+        e1, e2 = s1 + c1.shape[0], s2 + c2.shape[0]
+        if c1.shape[0] > 0 and c2.shape[0] > 0:
+            d1, d2, i1, i2 = _nndistance_torch(c1[None], c2[None])
+            assert torch.allclose(dist1[s1:e1], d1[0], atol=1e-6) and torch.allclose(dist2[s2:e2], d2[0], atol=1e-6)
+            assert torch.equal(idx1[s1:e1], i1[0] + s2) and torch.equal(idx2[s2:e2], i2[0] + s1)
+        else:
+            assert torch.all(idx1[s1:e1] == -1) and torch.all(idx2[s2:e2] == -1)
+        s1, s2 = e1, e2
+
+
+@pytest.mark.parametrize("engine", ["ext", "torch"])
+def test_chunked_chamfer(use_engine, engine):
+    use_engine("nndistance", engine)
+    xyz1 = torch.rand(2, 500, 3, dtype=torch.float64, requires_grad=True)
+    xyz2 = torch.rand(2, 300, 3, dtype=torch.float64, requires_grad=True)
+    # a budget of a few tiles
+    result = chunked_chamfer(xyz1, xyz2, reductions=("mean", "sum", "max", "fscore"), threshold=0.05,
+                             memory_budget=2*300*8*64, return_per_point=True)
+    dist1, dist2, idx1, idx2 = _nndistance_torch(xyz1, xyz2)
+    assert torch.equal(result["idx1"], idx1) and torch.equal(result["idx2"], idx2)
+    assert torch.allclose(result["dist1"], dist1) and torch.allclose(result["dist2"], dist2)
+    assert torch.allclose(result["mean"], dist1.mean(-1) + dist2.mean(-1))
+    assert torch.allclose(result["sum"], dist1.sum(-1) + dist2.sum(-1))
+    hausdorff = torch.sqrt(torch.max(dist1.max(-1)[0], dist2.max(-1)[0]))
+    assert torch.allclose(result["max"], hausdorff)
+    precision = (dist1 < 0.05**2).double().mean(-1)
+    recall = (dist2 < 0.05**2).double().mean(-1)
+    assert torch.allclose(result["precision"], precision) and torch.allclose(result["recall"], recall)
+
+    for reduction, expected in (("mean", dist1.mean(-1) + dist2.mean(-1)), ("max", hausdorff)):
+        grads = torch.autograd.grad(result[reduction].sum(), (xyz1, xyz2), retain_graph=True)
+        expected_grads = torch.autograd.grad(expected.sum(), (xyz1, xyz2), retain_graph=True)
+        for g, e in zip(grads, expected_grads):
+            assert torch.allclose(g, e, atol=1e-8)
+
+
+def test_chamfer_target():
+    pytest.importorskip("scipy")
+    target = torch.rand(2, 300, 3, dtype=torch.float64)
+    pred = torch.rand(2, 200, 3, dtype=torch.float64)
+    index = ChamferTarget(target)
+    # the second and third calls reuse the certified neighbors of the first
+    for step in (0.0, 1e-3, 0.1):
+        pred = pred + step * torch.randn_like(pred)
+        dist1, dist2, idx1, idx2 = index.nndistance(pred)
+        expected = _nndistance_torch(pred, target)
+        assert torch.equal(idx1, expected[2]) and torch.equal(idx2, expected[3])
+        assert torch.allclose(dist1, expected[0]) and torch.allclose(dist2, expected[1])
@@ -0,0 +1,121 @@
+import pytest
+import torch
+
+from pytorch_points.network.operations import (ball_query, grouping_operation, gather_points, query_and_group,
+                                               packed_ball_query, pack_points, _ball_query_torch,
+                                               _grouping_operation_torch, _query_and_group_torch)
+from pytorch_points.network import pointnet2_utils
+
+
+@pytest.mark.parametrize("engine", ["ext", "torch"])
+@pytest.mark.parametrize("radius", [0.2, 0.0])
+def test_ball_query_engines(use_engine, engine, radius):
+    use_engine("ball_query", engine)
+    xyz = torch.rand(2, 400, 3)
+    new_xyz = torch.rand(2, 50, 3)
+    idx = ball_query(radius, 16, xyz, new_xyz)
+    assert idx.dtype == torch.int32
+    assert torch.equal(idx, _ball_query_torch(radius, 16, xyz, new_xyz))
+
+
+@pytest.mark.parametrize("engine", ["ext", "torch"])
+def test_packed_ball_query_matches_per_cloud(use_engine, engine):
+    use_engine("packed_ball_query", engine)
+    clouds = [torch.rand(n, 3) for n in (60, 5, 0, 150)]
+    centers = [torch.rand(n, 3) for n in (8, 4, 0, 20)]
+    # a far away center without neighbors points to the first point of its own cloud
+    centers[1][0] = 10
+    xyz, lengths = pack_points(clouds)
+    new_xyz, new_lengths = pack_points(centers)
+    for radius in (0.3, 0.0):
+        idx = packed_ball_query(radius, 8, xyz, lengths, new_xyz, new_lengths)
+        start = offset = 0
+        for cloud, center in zip(clouds, centers):
+            if center.shape[0] > 0:
+                expected = _ball_query_torch(radius, 8, cloud[None], center[None])[0] + offset
+                assert torch.equal(idx[start:start+center.shape[0]], expected)
+            start += center.shape[0]
+            offset += cloud.shape[0]
+
+
+def test_packed_ball_query_empty_cloud_with_centers():
+    xyz, lengths = pack_points([torch.rand(10, 3), torch.rand(0, 3)])
+    new_xyz, new_lengths = pack_points([torch.rand(2, 3), torch.rand(1, 3)])
+    with pytest.raises(AssertionError):
+        packed_ball_query(0.5, 4, xyz, lengths, new_xyz, new_lengths)
+
+
+@pytest.mark.parametrize("engine", ["ext", "torch"])
+@pytest.mark.parametrize("dtype", [torch.float16, torch.bfloat16, torch.float32, torch.float64])
+def test_grouping_engines(use_engine, engine, dtype):
+    use_engine("grouping_operation", engine)
+    features = torch.randn(2, 5, 100, dtype=dtype, requires_grad=True)
+    idx = torch.randint(0, 100, (2, 30, 8), dtype=torch.int32)
+    out = grouping_operation(features, idx)
+    assert out.dtype == dtype
+    expected = _grouping_operation_torch(features.detach(), idx)
+    assert torch.equal(out.detach(), expected)
+    grad = torch.randn_like(out)
+    out.backward(grad)
+    # scatter-add in the accumulation type of dtype, compare in double
+    expected_grad = torch.zeros(2, 5, 100, dtype=torch.float64).scatter_add_(
+        2, idx.long().view(2, 1, -1).expand(-1, 5, -1), grad.double().view(2, 5, -1))
+    tol = 5e-2 if dtype in (torch.float16, torch.bfloat16) else 1e-6
+    assert torch.allclose(features.grad.double(), expected_grad, atol=tol, rtol=tol)
+
+
+@pytest.mark.parametrize("engine", ["ext", "torch"])
+@pytest.mark.parametrize("dtype", [torch.float32, torch.float64])
+def test_gather_points_engines(use_engine, engine, dtype):
+    use_engine("gather_points", engine)
+    features = torch.randn(2, 4, 50, dtype=dtype)
+    idx = torch.randint(0, 50, (2, 20), dtype=torch.int32)
+    out = gather_points(features, idx)
+    assert torch.equal(out, torch.gather(features, 2, idx.long().unsqueeze(1).expand(-1, 4, -1)))
+
+
+@pytest.mark.parametrize("engine", ["ext", "torch"])
+@pytest.mark.parametrize("use_xyz", [True, False])
+def test_query_and_group_engines(use_engine, engine, use_xyz):
+    use_engine("query_and_group", engine)
+    xyz = torch.rand(2, 300, 3, requires_grad=True)
+    new_xyz = torch.rand(2, 40, 3, requires_grad=True)
+    features = torch.randn(2, 6, 300, requires_grad=True)
+    out = query_and_group(0.25, 12, xyz, new_xyz, features, use_xyz)
+    grads = torch.autograd.grad(out, (xyz, new_xyz, features), torch.ones_like(out), allow_unused=True)
+    expected = _query_and_group_torch(0.25, 12, xyz, new_xyz, features, use_xyz)
+    expected_grads = torch.autograd.grad(expected, (xyz, new_xyz, features), torch.ones_like(expected), allow_unused=True)
+    assert torch.allclose(out, expected, atol=1e-6)
+    for g, e in zip(grads, expected_grads):
+        if e is None:
+            assert g is None or torch.all(g == 0)
+        else:
+            assert torch.allclose(g, e, atol=1e-5)
+
+
+@pytest.mark.parametrize("engine", ["ext", "torch"])
+@pytest.mark.parametrize("dtype", [torch.float32, torch.float64])
+def test_three_nn_engines(use_engine, engine, dtype):
+    use_engine("three_nn", engine)
+    unknown = torch.rand(2, 200, 3, dtype=dtype)
+    known = torch.rand(2, 64, 3, dtype=dtype)
+    dist, idx = pointnet2_utils.three_nn(unknown, known)
+    assert dist.dtype == dtype
+    expected_dist, expected_idx = pointnet2_utils._three_nn_torch(unknown, known)
+    assert torch.equal(idx, expected_idx)
+    assert torch.allclose(dist, expected_dist, atol=1e-5)
+
+
+@pytest.mark.parametrize("dtype", [torch.float32, torch.float64])
+def test_three_interpolate(require_ext, dtype):
+    require_ext("sampling")
+    features = torch.randn(2, 4, 30, dtype=dtype, requires_grad=True)
+    idx = torch.randint(0, 30, (2, 50, 3), dtype=torch.int32)
+    weight = torch.rand(2, 50, 3, dtype=dtype)
+    out = pointnet2_utils.three_interpolate(features, idx, weight)
+    index = idx.long().view(2, 1, -1).expand(-1, 4, -1)
+    expected = (torch.gather(features, 2, index).view(2, 4, 50, 3) * weight.unsqueeze(1)).sum(-1)
+    assert torch.allclose(out, expected, atol=1e-6)
+    grad, = torch.autograd.grad(out, features, torch.ones_like(out))
+    expected_grad, = torch.autograd.grad(expected, features, torch.ones_like(expected))
+    assert torch.allclose(grad, expected_grad, atol=1e-5)
@@ -0,0 +1,106 @@
+import pytest
+import torch
+
+from pytorch_points.network.geo_operations import CotLaplacian, UniformLaplacian, LaplacianSolver, cotangent
+
+
+def _grid_mesh(k=6, batch=2, dtype=torch.float64):
+    """batch of perturbed (k+1)x(k+1) grids with consistently oriented triangles"""
+    u, v = torch.meshgrid(torch.arange(k+1), torch.arange(k+1), indexing="ij")
+    V = torch.stack([u, v, torch.zeros_like(u)], dim=-1).reshape(-1, 3).to(dtype) / k
+    V = V + 0.02 * torch.randn(batch, V.shape[0], 3, dtype=dtype)
+    i = torch.arange(k).view(-1, 1) * (k+1) + torch.arange(k).view(1, -1)
+    i = i.reshape(-1)
+    F = torch.cat([torch.stack([i, i+k+1, i+1], dim=-1), torch.stack([i+1, i+k+1, i+k+2], dim=-1)])
+    return V, F.unsqueeze(0).expand(batch, -1, -1)
+
+
+def _cot_laplacian_scipy(V, F):
+    """the scipy construction of CotLaplacian before it moved to torch"""
+    np = pytest.importorskip("numpy")
+    sparse = pytest.importorskip("scipy.sparse")
+    B, N, _ = V.shape
+    C = cotangent(V, F).numpy().reshape(-1)
+    batchF = (F.numpy() + np.arange(B).reshape(-1, 1, 1) * N).reshape(-1, 3)
+    rows = batchF[:, [1, 2, 0]].reshape(-1)
+    cols = batchF[:, [2, 0, 1]].reshape(-1)
+    L = sparse.csr_matrix((C, (rows, cols)), shape=(B*N, B*N))
+    L = L + L.T
+    M = sparse.diags(np.array(np.sum(L, 1)).reshape(-1), format="csr")
+    return torch.from_numpy((L - M).toarray())
+
+
+def test_cot_laplacian_matches_scipy():
+    V, F = _grid_mesh()
+    lap = CotLaplacian()
+    out = lap(V, F)
+    assert lap.L.layout == torch.sparse_csr
+    expected = _cot_laplacian_scipy(V, F)
+    assert torch.allclose(lap.L.to_dense(), expected)
+    assert torch.allclose(out, (expected @ V.reshape(-1, 3)).view(V.shape))
+    # moved vertices keep the pattern and get new weights
+    V2 = V + 0.01 * torch.randn_like(V)
+    lap.updateLaplacian(V2)
+    assert torch.allclose(lap.L.to_dense(), _cot_laplacian_scipy(V2, F))
+
+
+def test_uniform_laplacian_shared_topology():
+    V, F = _grid_mesh(batch=3)
+    expected = UniformLaplacian()(V, F)
+    shared = UniformLaplacian(shared_topology=True)
+    assert torch.allclose(shared(V, F), expected)
+    assert shared.L.shape == (V.shape[1], V.shape[1])
+
+
+def _dense_system(L, lam):
+    n = L.shape[0]
+    return torch.eye(n, dtype=L.dtype) + lam * L if lam is not None else L
+
+
+@pytest.mark.parametrize("method", ["cg", "splu", "cholmod"])
+def test_laplacian_solver_smoothing(method):
+    if method == "splu":
+        pytest.importorskip("scipy.sparse.linalg")
+    elif method == "cholmod":
+        pytest.importorskip("sksparse.cholmod")
+    V, F = _grid_mesh(batch=1)
+    lap = CotLaplacian()
+    lap(V, F)
+    L = -lap.L.to_sparse()
+    solver = LaplacianSolver(L, lam=0.5, method=method, tol=1e-10)
+    b = torch.randn(2, V.shape[1], 3, dtype=V.dtype, requires_grad=True)
+    x = solver(b)
+    A = _dense_system(L.to_dense(), 0.5)
+    expected = torch.linalg.solve(A, b.detach().transpose(0, 1).reshape(V.shape[1], -1)).view(V.shape[1], 2, 3).transpose(0, 1)
+    tol = 1e-6 if method == "cg" else 1e-10
+    assert torch.allclose(x, expected, atol=tol)
+    # the backward is a solve with the same (symmetric) system
+    g = torch.randn_like(x)
+    grad, = torch.autograd.grad(x, b, g)
+    expected_grad = torch.linalg.solve(A, g.transpose(0, 1).reshape(V.shape[1], -1)).view(V.shape[1], 2, 3).transpose(0, 1)
+    assert torch.allclose(grad, expected_grad, atol=tol)
+
+
+@pytest.mark.parametrize("method", ["cg", "splu"])
+def test_laplacian_solver_fixed(method):
+    if method == "splu":
+        pytest.importorskip("scipy.sparse.linalg")
+    V, F = _grid_mesh(batch=1)
+    lap = CotLaplacian()
+    lap(V, F)
+    L = -lap.L.to_sparse()
+    N = V.shape[1]
+    fixed = torch.tensor([0, 6, N-7, N-1])
+    solver = LaplacianSolver(L, fixed=fixed, method=method, tol=1e-10)
+    b = torch.randn(N, 3, dtype=V.dtype)
+    x_fixed = torch.randn(4, 3, dtype=V.dtype)
+    x = solver(b, x_fixed)
+    # dense reference: L_ff x_f = b_f - L_fc x_c
+    Ld = L.to_dense()
+    free = torch.ones(N, dtype=torch.bool)
+    free[fixed] = False
+    expected = torch.zeros_like(b)
+    expected[fixed] = x_fixed
+    expected[free] = torch.linalg.solve(Ld[free][:, free], b[free] - Ld[free][:, fixed] @ x_fixed)
+    tol = 1e-6 if method == "cg" else 1e-10
+    assert torch.allclose(x, expected, atol=tol)
@@ -0,0 +1,50 @@
+import pytest
+import torch
+
+from pytorch_points.network.operations import batch_svd, batch_eigh3x3
+
+
+@pytest.mark.parametrize("engine", ["ext", "torch"])
+@pytest.mark.parametrize("shape", [(3, 3), (5, 3), (3, 6)])
+@pytest.mark.parametrize("dtype", [torch.float32, torch.float64])
+def test_batch_svd_engines(use_engine, engine, shape, dtype):
+    use_engine("batch_svd", engine)
+    x = torch.randn((16,) + shape, dtype=dtype)
+    U, S, V = batch_svd(x)
+    k = min(shape)
+    assert U.shape == (16, shape[0], k) and S.shape == (16, k) and V.shape == (16, shape[1], k)
+    tol = 1e-4 if dtype == torch.float32 else 1e-10
+    assert torch.allclose(S, torch.linalg.svdvals(x), atol=tol)
+    assert torch.all(S[:, :-1] >= S[:, 1:])
+    assert torch.allclose(U @ torch.diag_embed(S) @ V.transpose(1, 2), x, atol=tol)
+    eye = torch.eye(k, dtype=dtype).expand(16, -1, -1)
+    assert torch.allclose(U.transpose(1, 2) @ U, eye, atol=tol)
+    assert torch.allclose(V.transpose(1, 2) @ V, eye, atol=tol)
+
+
+@pytest.mark.parametrize("dtype", [torch.float32, torch.float64])
+def test_batch_eigh3x3(dtype):
+    A = torch.randn(200, 3, 3, dtype=dtype)
+    A = A + A.transpose(1, 2)
+    # repeated and zero eigenvalues
+    A[0] = torch.diag(torch.tensor([1.0, 1.0, 2.0], dtype=dtype))
+    A[1] = 0
+    eigval, eigvec = batch_eigh3x3(A)
+    tol = 1e-4 if dtype == torch.float32 else 1e-10
+    assert torch.allclose(eigval, torch.linalg.eigvalsh(A), atol=tol)
+    assert torch.allclose(eigvec @ torch.diag_embed(eigval) @ eigvec.transpose(1, 2), A, atol=tol)
+    assert torch.allclose(eigvec.transpose(1, 2) @ eigvec, torch.eye(3, dtype=dtype).expand(200, -1, -1), atol=tol)
+
+
+def test_batch_eigh3x3_grad():
+    A = torch.randn(8, 3, 3, dtype=torch.float64)
+    A = A + A.transpose(1, 2)
+    A.requires_grad_(True)
+    # eigenvalues and sign-invariant projectors of the eigenvectors
+    eigval, eigvec = batch_eigh3x3(A)
+    loss = (eigval * torch.arange(1, 4, dtype=A.dtype)).sum() + (eigvec[:, :, 0:1] @ eigvec[:, :, 0:1].transpose(1, 2)).sum()
+    grad, = torch.autograd.grad(loss, A)
+    eigval, eigvec = torch.linalg.eigh(A)
+    expected = (eigval * torch.arange(1, 4, dtype=A.dtype)).sum() + (eigvec[:, :, 0:1] @ eigvec[:, :, 0:1].transpose(1, 2)).sum()
+    expected_grad, = torch.autograd.grad(expected, A)
+    assert torch.allclose(grad, expected_grad, atol=1e-8)
@@ -0,0 +1,71 @@
+import pytest
+import torch
+
+from pytorch_points.network.geo_operations import (furthest_point_sample, resume_furthest_point_sample,
+                                                    packed_furthest_point_sample,
+                                                    _furthest_point_sample_torch as _reference_fps)
+from pytorch_points.network.operations import pack_points
+
+
+@pytest.mark.parametrize("engine", ["ext", "torch"])
+def test_fps_engines(use_engine, engine):
+    xyz = torch.rand(2, 500, 3)
+    use_engine("furthest_point_sample", engine)
+    idx, sampled = furthest_point_sample(xyz, 64, NCHW=False, seedIdx=3)
+    assert idx.shape == (2, 64)
+    assert torch.equal(idx.long(), _reference_fps(xyz, 64, 3).long())
+    assert torch.equal(sampled, torch.gather(xyz, 1, idx.long().unsqueeze(-1).expand(-1, -1, 3)))
+
+
+def test_fps_grid_eps0_is_exact(use_engine):
+    use_engine("furthest_point_sample", "ext")
+    xyz = torch.randn(2, 3000, 3)
+    exact, _ = furthest_point_sample(xyz, 256, NCHW=False)
+    grid, _ = furthest_point_sample(xyz, 256, NCHW=False, eps=0.0)
+    assert torch.equal(exact, grid)
+
+
+def test_fps_grid_eps_coverage(use_engine):
+    use_engine("furthest_point_sample", "ext")
+    xyz = torch.randn(1, 3000, 3)
+    idx, _ = furthest_point_sample(xyz, 128, NCHW=False, eps=0.2)
+    assert idx.unique().numel() == 128
+
+
+@pytest.mark.parametrize("engine", ["ext", "torch"])
+def test_resume_chaining(use_engine, engine):
+    use_engine("furthest_point_sample_resume", engine)
+    xyz = torch.rand(2, 800, 3)
+    full = _reference_fps(xyz, 96, 0)
+    idx1, _, temp = resume_furthest_point_sample(xyz, 16, NCHW=False)
+    idx2, _, temp = resume_furthest_point_sample(xyz, 48, prefix=idx1, temp=temp, NCHW=False)
+    idx3, _, _ = resume_furthest_point_sample(xyz, 96, prefix=idx2, temp=temp, NCHW=False)
+    assert torch.equal(idx1.long(), full[:, :16].long())
+    assert torch.equal(idx3.long(), full.long())
+    # without the state the distances to the prefix are recomputed
+    idx4, _, _ = resume_furthest_point_sample(xyz, 96, prefix=idx2, NCHW=False)
+    assert torch.equal(idx4.long(), full.long())
+
+
+@pytest.mark.parametrize("engine", ["ext", "torch"])
+def test_packed_fps_matches_per_cloud(use_engine, engine):
+    use_engine("packed_furthest_point_sample", engine)
+    clouds = [torch.rand(n, 3) for n in (50, 7, 0, 200)]
+    npoint = torch.tensor([10, 7, 0, 32])
+    xyz, lengths = pack_points(clouds)
+    idx, sampled, sample_lengths = packed_furthest_point_sample(xyz, lengths, npoint, seedIdx=2)
+    assert torch.equal(sample_lengths, npoint)
+    start = offset = 0
+    for cloud, k in zip(clouds, npoint.tolist()):
+        if k > 0:
+            expected = _reference_fps(cloud[None], k, 2)[0].long() + offset
+            assert torch.equal(idx[start:start+k].long(), expected)
+        start += k
+        offset += cloud.shape[0]
+    assert torch.equal(sampled, xyz[idx.long()])
+
+
+def test_packed_fps_seed_out_of_range():
+    xyz, lengths = pack_points([torch.rand(3, 3), torch.rand(100, 3)])
+    with pytest.raises(AssertionError):
+        packed_furthest_point_sample(xyz, lengths, 2, seedIdx=5)